@@ -9,8 +9,10 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 class AssistantManager:
     def __init__(self,
                  model=None,
-                 tools=None):
-        self.client = OpenAI()
+                 tools=None,
+                 client=None):
+        # Any OpenAI client, e.g. OpenAI(base_url=...) for another server speaking the API
+        self.client = client or OpenAI()
         self.model = model if model else "gpt-4o-mini"
         self.assistant_prompts = {
             "recommendation": """
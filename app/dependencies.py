@@ -0,0 +1,18 @@
+from app.resources.chat_resource import ChatResource
+from app.services.openai import AsyncOpenAIService, OpenAIService
+from app.services.service_factory import ServiceFactory
+
+
+def get_chat_resource() -> ChatResource:
+    """The process wide ChatResource, for use with Depends"""
+    return ServiceFactory.get_service("ChatResource")
+
+
+def get_openai_service() -> OpenAIService:
+    """The process wide OpenAIService, for use with Depends"""
+    return ServiceFactory.get_service("OpenAI")
+
+
+def get_async_openai_service() -> AsyncOpenAIService:
+    """The process wide AsyncOpenAIService, for use with Depends"""
+    return ServiceFactory.get_service("AsyncOpenAI")
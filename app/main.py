@@ -1,18 +1,57 @@
+from contextlib import asynccontextmanager
+import os
+
 from fastapi import Depends, FastAPI
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.routers import chats
+from app.migrations import missing_columns
+from app.routers import chats, metrics
+from app.services.service_factory import ServiceFactory
+from framework.middleware.profiling import ProfilingMiddleware
+from framework.middleware.timing import ServerTimingMiddleware
+from framework.utils.metrics import observe_request, track_request
+from framework.utils.structured_logging import BackgroundLogging, parse_sample_rates
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # uvicorn has set up its handlers by now, move them to a background thread
+    background_logging = BackgroundLogging(
+        json_format=os.getenv('LOG_FORMAT', 'text') == 'json',
+        max_length=int(os.getenv('LOG_MAX_FIELD_LENGTH', 1000)),
+        sample_rates=parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', ''))
+    )
+    background_logging.start()
+    # Build the data services once per worker before serving, they are shared by all requests
+    missing = missing_columns(ServiceFactory.get_service("ChatResource"))
+    if missing:
+        background_logging.stop()
+        raise RuntimeError(f"Missing columns {', '.join(missing)}, run python -m app.migrations upgrade")
+    yield
+    await ServiceFactory.close_services()
+    background_logging.stop()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=['*']
+    allow_origins=['*'],
+    expose_headers=["Server-Timing"]
 )
+app.add_middleware(ServerTimingMiddleware, on_request=track_request, on_response=observe_request)
+
+# Profiling is off unless an admin token or a sample rate is configured
+profile_token = os.getenv('PROFILE_TOKEN')
+profile_sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+if profile_token or profile_sample_rate:
+    app.add_middleware(ProfilingMiddleware, directory=os.getenv('PROFILE_DIR', 'profiles'), token=profile_token,
+                       sample_rate=profile_sample_rate, max_files=int(os.getenv('PROFILE_MAX_FILES', 100)))
 
 
 app.include_router(chats.router)
+app.include_router(metrics.router)
 
 
 @app.get("/")
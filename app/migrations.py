@@ -0,0 +1,235 @@
+"""
+Schema management for the chat tables.
+
+    python -m app.migrations upgrade    create missing tables, columns and indexes
+    python -m app.migrations check      EXPLAIN every query ChatResource issues and exit
+                                        with status 1 if any of them scans a whole table
+                                        or sorts its rows instead of reading an index
+
+The database is the one configured for the service (DB_BACKEND, DB_NAME, ...).
+"""
+import argparse
+import asyncio
+import copy
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from app.resources.chat_resource import ChatResource
+from app.services.service_factory import ServiceFactory
+from app.services.schema import backfill_statements, chat_tables, mysql_schema, sqlite_schema
+from app.utils.conversation_cache import ConversationCache
+from app.utils.cursor import encode_cursor
+from framework.services.data_access.AsyncDataService import AsyncDataService
+from framework.services.data_access.SQLiteDataService import SQLiteDataService
+from framework.utils.cache import LRUCache
+
+
+class _StatementRecorder:
+    """Stands in for a DB-API connection and its cursor, recording statements instead of running them"""
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql_statement, values=None):
+        self.statements.append((sql_statement, list(values or [])))
+
+    def executemany(self, sql_statement, rows):
+        for values in rows[:1]:
+            self.execute(sql_statement, values)
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def _existing_columns(resource: ChatResource, table_name: str) -> set:
+    data_service = resource.data_service
+    if isinstance(data_service, SQLiteDataService):
+        rows = data_service.execute_statement("SELECT name AS column_name FROM pragma_table_info(?)", [table_name])
+    else:
+        rows = data_service.execute_statement(
+            "SELECT column_name AS column_name FROM information_schema.columns "
+            "WHERE table_schema=%s AND table_name=%s",
+            [resource.database, table_name]
+        )
+    return {row["column_name"].lower() for row in rows}
+
+
+def missing_columns(resource: ChatResource) -> List[str]:
+    """Return the table.column names the queries of ChatResource need but the database lacks"""
+    missing = []
+    for table_info in chat_tables(resource.info_collection, resource.details_collection, resource.summaries_collection):
+        existing = _existing_columns(resource, table_info["name"])
+        missing += [f"{table_info['name']}.{name}" for name, _ in table_info["columns"] if name.lower() not in existing]
+    return missing
+
+
+def upgrade(resource: ChatResource) -> List[str]:
+    """Create the chat tables and any missing column or index, return the statements that were run"""
+    data_service = resource.data_service
+    sqlite = isinstance(data_service, SQLiteDataService)
+    tables = chat_tables(resource.info_collection, resource.details_collection, resource.summaries_collection)
+
+    def table(collection_name):
+        return data_service._table(resource.database, collection_name)
+
+    if sqlite:
+        schema = sqlite_schema(resource.info_collection, resource.details_collection, resource.summaries_collection)
+    else:
+        schema = mysql_schema(resource.database, resource.info_collection, resource.details_collection,
+                              resource.summaries_collection)
+    # Indexes of existing tables may need the columns added below, they are created last
+    statements = [statement for statement in schema if not statement.startswith("CREATE INDEX")]
+    data_service.create_schema(statements)
+
+    # CREATE TABLE IF NOT EXISTS leaves existing tables alone, add the columns they miss
+    added = []
+    for table_info in tables:
+        existing = _existing_columns(resource, table_info["name"])
+        for name, column_type in table_info["columns"]:
+            if name.lower() not in existing:
+                added.append(f"ALTER TABLE {table(table_info['name'])} ADD COLUMN {name} {column_type}")
+    added += backfill_statements(table, resource.info_collection, resource.details_collection)
+    data_service.create_schema(added)
+    statements += added
+
+    if sqlite:
+        indexes = [statement for statement in schema if statement.startswith("CREATE INDEX")]
+        data_service.create_schema(indexes)
+        return statements + indexes
+
+    # and the indexes they miss
+    for table_info in tables:
+        rows = data_service.execute_statement(
+            "SELECT DISTINCT index_name AS index_name FROM information_schema.statistics "
+            "WHERE table_schema=%s AND table_name=%s",
+            [resource.database, table_info["name"]]
+        )
+        existing = {row["index_name"] for row in rows}
+        for index_name, index_columns in table_info["indexes"].items():
+            if index_name not in existing:
+                statement = f"ALTER TABLE {table(table_info['name'])} " + \
+                            f"ADD INDEX {index_name} ({', '.join(index_columns)})"
+                data_service.execute_statement(statement)
+                statements.append(statement)
+    return statements
+
+
+def hot_queries(resource: ChatResource) -> List[Tuple[str, list]]:
+    """
+    Record the distinct SELECT statements ChatResource sends to its data service for the
+    request shapes served by the routers, without touching the database.
+    """
+    recorder = _StatementRecorder()
+
+    @contextmanager
+    def recording_connection():
+        yield recorder
+
+    recording_service = copy.copy(resource.data_service)
+    recording_service._get_connection = recording_connection
+    probe = copy.copy(resource)
+    probe.data_service = recording_service
+    probe.async_data_service = AsyncDataService(recording_service, max_workers=1)
+    # Disabled caches of its own, so every lookup is a query and the shared caches are left alone
+    probe.info_cache = LRUCache(max_size=0)
+    probe.conversation_cache = ConversationCache(window_size=resource.conversation_cache.window_size, max_messages=0)
+
+    key = str(uuid.uuid4())
+    cursor = encode_cursor(datetime.utcnow(), key)
+
+    async def issue():
+        await probe.get_info_by_key(key)
+        await probe.get_details_by_key(key)
+        for chat_id in (None, key):
+            for role in (None, "human"):
+                for agent_name in (None, "Chat"):
+                    await probe.get_chat_history(user_id=key, chat_id=chat_id, role=role, agent_name=agent_name)
+            await probe.get_chat_history_page(user_id=key, chat_id=chat_id)
+            await probe.get_chat_history_page(user_id=key, chat_id=chat_id, after=cursor)
+            await probe.get_chat_history_page(user_id=key, chat_id=chat_id, before=cursor)
+        await probe.get_recent_messages(user_id=key, chat_id=key, agent_name="Chat")
+        await probe.get_user_summary(user_id=key, agent_name="Chat")
+        await probe.get_messages_after(user_id=key, agent_name="Chat", role="human", watermark=None, limit=10)
+        await probe.get_messages_after(user_id=key, agent_name="Chat", role="human",
+                                       watermark=(datetime.utcnow(), key), limit=10)
+        await probe.count_messages_before(user_id=key, agent_name="Chat", role="human",
+                                          watermark=(datetime.utcnow(), key))
+
+    try:
+        asyncio.run(issue())
+    finally:
+        probe.async_data_service.close()
+
+    queries = []
+    for sql_statement, values in recorder.statements:
+        if sql_statement.lstrip().upper().startswith("SELECT") and sql_statement not in dict(queries):
+            queries.append((sql_statement, values))
+    return queries
+
+
+def check(resource: ChatResource, queries: Optional[List[Tuple[str, list]]] = None) -> List[Tuple[str, list]]:
+    """
+    EXPLAIN the hot queries, return (statement, plan) for each one that scans a whole table or
+    sorts the matching rows, whose cost then grows with the table instead of the result.
+
+    :param queries: The hot_queries() of the resource, recorded again when not given.
+    """
+    failures = []
+    for sql_statement, values in queries if queries is not None else hot_queries(resource):
+        plan = resource.data_service.explain(sql_statement, values)
+        if any(step["full_scan"] or step["sort"] for step in plan):
+            failures.append((sql_statement, plan))
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.migrations", description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["upgrade", "check"])
+    args = parser.parse_args(argv)
+
+    resource = ServiceFactory.get_service("ChatResource")
+
+    if args.command == "upgrade":
+        for statement in upgrade(resource):
+            print(statement)
+        return 0
+
+    queries = hot_queries(resource)
+    failures = check(resource, queries)
+    for sql_statement, plan in failures:
+        print(f"FULL SCAN OR SORT: {sql_statement}")
+        for step in plan:
+            print(f"    {step['detail']}")
+    print(f"{len(queries)} queries checked, {len(failures)} with full table scans or sorts")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,50 +1,76 @@
-from typing import Any, Optional, List
+from typing import Any, Optional, List, Tuple
 
 from framework.resources.base_resource import BaseResource
+from framework.utils.cache import LRUCache
 
 from app.models.chat_info import ChatInfo
 from app.models.chat_details import ChatDetails
 from app.services.service_factory import ServiceFactory
+from app.utils.conversation_cache import ConversationCache
+from app.utils.cursor import encode_cursor, decode_cursor
 import dotenv, os
 import uuid
 from datetime import datetime
 
 dotenv.load_dotenv()
 db = os.getenv('DB_NAME')
-info_collection = os.getenv('DB_INFO_COLLECTION')
-details_collection = os.getenv('DB_DETAILS_COLLECTION')
+info_collection = os.getenv('DB_INFO_COLLECTION', 'chat_info')
+details_collection = os.getenv('DB_DETAILS_COLLECTION', 'chat_details')
+summaries_collection = os.getenv('DB_SUMMARIES_COLLECTION', 'user_summaries')
+metadata_cache_size = int(os.getenv('CHAT_METADATA_CACHE_SIZE', 10000))
+metadata_cache_ttl = float(os.getenv('CHAT_METADATA_CACHE_TTL', 300))
+conversation_window_size = int(os.getenv('CONVERSATION_WINDOW_SIZE', 50))
+conversation_cache_max_messages = int(os.getenv('CONVERSATION_CACHE_MAX_MESSAGES', 100000))
+conversation_cache_ttl = float(os.getenv('CONVERSATION_CACHE_TTL', 600))
 
 
 class ChatResource(BaseResource):
+    """
+    Chat info and chat details stored through a data service. The public methods are coroutines
+    going through the async data service, sync callers run them with asyncio.run().
+
+    Chat metadata is written once and never changes afterwards, so chat_info rows are kept in a
+    process wide LRU cache shared by all instances, which no other worker can make stale. The most recent
+    messages of active chats are kept in a conversation cache that every write appends to.
+    """
+
+    info_cache = LRUCache(max_size=metadata_cache_size, ttl=metadata_cache_ttl)
+    conversation_cache = ConversationCache(window_size=conversation_window_size,
+                                           max_messages=conversation_cache_max_messages,
+                                           ttl=conversation_cache_ttl)
 
     def __init__(self, config):
         super().__init__(config)
 
         self.data_service = ServiceFactory.get_service("ChatResourceDataService")
+        self.async_data_service = ServiceFactory.get_service("AsyncChatResourceDataService")
         self.database = db
         self.info_collection = info_collection
         self.details_collection = details_collection
+        self.summaries_collection = summaries_collection
         self.info_key_field = "chat_id"
         self.details_key_field = "message_id"
         self.user_key_filed = "user_id"
+        # Messages are filed under the owner stored in chat_info, never under the one in the payload
+        self.details_owner = (self.info_collection, self.info_key_field, ["user_id", "agent_name"])
 
-    def get_info_by_key(self, key: str) -> ChatInfo:
-        d_service = self.data_service
+    async def get_info_by_key(self, key: str) -> ChatInfo:
+        result = self.info_cache.get(key)
+        if result is not None:
+            return result
 
-        result = d_service.get_data_object(
+        result = await self.async_data_service.get_data_object(
             self.database, self.info_collection, key_field=self.info_key_field, key_value=key
         )
         if result:
             result = ChatInfo(**result)
+            self.info_cache.set(key, result)
         return result
 
-    def get_details_by_key(self, key: str) -> ChatDetails:
-        d_service = self.data_service
-
-        result = d_service.get_data_object(
+    async def get_details_by_key(self, key: str) -> ChatDetails:
+        result = await self.async_data_service.get_data_object(
             self.database, self.details_collection, key_field=self.details_key_field, key_value=key
         )
-
         if result:
             result = ChatDetails(**result)
         return result
@@ -55,6 +81,8 @@ class ChatResource(BaseResource):
         chat_info_list = d_service.get_all_data_object(
             self.database, self.info_collection, key_field=self.user_key_filed, key_value=key
         )
+        if chat_info_list is None:
+            return []
 
         if agent_name:
             chat_info_list = [info for info in chat_info_list if info["agent_name"] == agent_name]
@@ -63,6 +91,23 @@ class ChatResource(BaseResource):
 
         return results
 
+    def _on_chat_written(self, chat_data, chat_id: str, chat_info_data: dict):
+        """Cache the metadata of a chat created by the write"""
+        if chat_data.chat_id is None:
+            # The chat was created from this message, its metadata is exactly what was written.
+            self.info_cache.set(chat_id, ChatInfo(**chat_info_data))
+
+    def _on_message_written(self, chat_id: str, chat_details_data: dict):
+        # Only chats already in the conversation cache are appended to, others are seeded on read.
+        self.conversation_cache.append(chat_id, ChatDetails(**chat_details_data))
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        return {
+            "chat_info": cls.info_cache.stats(),
+            "conversations": cls.conversation_cache.stats()
+        }
+
     def _get_chats_by_key(self, key_field: str, key: str) -> List[ChatDetails]:
         d_service = self.data_service
 
@@ -77,71 +122,258 @@ class ChatResource(BaseResource):
                 results.append(result)
         return results
 
-    def get_chat_history(self,
-                         user_id: str,
-                         chat_id: Optional[str]=None,
-                         role: Optional[str]=None,
-                         agent_name: Optional[str]=None) -> List[ChatDetails]:
-        result = []
-        chat_ids = self._get_chat_ids(key=user_id, agent_name=agent_name)
+    def _history_query(self, user_id, chat_id, role, agent_name, **kwargs) -> dict:
+        """Arguments of the single query returning a user's chat_details"""
+        # chat_details carries the user and agent of its chat, so an index of chat_details
+        # serves the filters and the ordering without a JOIN on chat_info.
+        return dict(
+            database_name=self.database,
+            collection_name=self.details_collection,
+            filters={self.user_key_filed: user_id, "chat_id": chat_id, "role": role, "agent_name": agent_name},
+            **kwargs
+        )
+
+    @staticmethod
+    def _to_page(results, limit: int, backwards: bool) -> Tuple[List[ChatDetails], Optional[str]]:
+        results = results or []
+        has_more = len(results) > limit
+        if has_more:
+            results = results[1:] if backwards else results[:limit]
 
-        if not chat_ids:
-            return result
+        page = [ChatDetails(**result) for result in results]
+        next_cursor = None
+        if has_more and page:
+            edge = page[0] if backwards else page[-1]
+            next_cursor = encode_cursor(edge.created_at, edge.message_id)
 
-        if chat_id:
-            chat_details = self._get_chats_by_key(key_field="chat_id", key=chat_id)
-            result += chat_details
-        else:
-            for chat_id in chat_ids:
-                chat_details = self._get_chats_by_key(key_field="chat_id", key=chat_id)
-                result += chat_details
+        return page, next_cursor
 
-        if role:
-            result = [item for item in result if item.role == role]
+    async def get_chat_history(self,
+                               user_id: str,
+                               chat_id: Optional[str]=None,
+                               role: Optional[str]=None,
+                               agent_name: Optional[str]=None) -> List[ChatDetails]:
+        results = await self.async_data_service.get_data_objects(
+            **self._history_query(user_id, chat_id, role, agent_name)
+        )
+        return [ChatDetails(**result) for result in results or []]
 
-        return result
+    async def get_recent_messages(self,
+                                  user_id: str,
+                                  chat_id: str,
+                                  agent_name: Optional[str]=None) -> List[ChatDetails]:
+        """
+        Get the most recent messages of a chat, oldest first, at most the conversation window
+        size. Served from the conversation cache, the database is only read on a miss.
+        """
+        messages = self.conversation_cache.get(chat_id, user_id, agent_name)
+        if messages is not None:
+            return messages
 
-    def update_chat(self, chat_data) -> str:
-        message_id = str(uuid.uuid4())
-        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-        chat_id = chat_data.chat_id
-        if chat_id is None:
-            chat_id = str(uuid.uuid4())
+        # A message written during the read is not in its result, the window is then not cached
+        version = self.conversation_cache.version()
+        # Newest first so the LIMIT keeps the most recent messages, reversed once read.
+        results = await self.async_data_service.get_data_objects(**self._history_query(
+            user_id, chat_id, None, agent_name,
+            order_direction="DESC",
+            tiebreak_field=self.details_key_field,
+            limit=self.conversation_cache.window_size
+        ))
+        if results is None:
+            return []
+        messages = [ChatDetails(**result) for result in reversed(results)]
+        self.conversation_cache.seed(chat_id, user_id, agent_name, messages, version=version)
+        return messages
+
+    @staticmethod
+    def summary_id(user_id: str, agent_name: Optional[str]) -> str:
+        """Primary key of the rolling summary of a user's messages to an agent"""
+        return f"{agent_name or ''}:{user_id}"
+
+    async def get_user_summary(self, user_id: str, agent_name: Optional[str]=None) -> Optional[dict]:
+        """
+        The stored rolling summary with its watermark, the (created_at, message_id) of the last
+        message it covers, and the watermark_position, the number of messages before it, or None
+        if the user has none yet.
+        """
+        return await self.async_data_service.get_data_object(
+            self.database, self.summaries_collection, key_field="summary_id", key_value=self.summary_id(user_id, agent_name)
+        )
+
+    async def get_messages_after(self,
+                                 user_id: str,
+                                 agent_name: Optional[str]=None,
+                                 role: Optional[str]=None,
+                                 watermark: Optional[tuple]=None,
+                                 limit: int=100) -> List[ChatDetails]:
+        """The oldest messages of a user over all chats following a (created_at, message_id) watermark"""
+        results = await self.async_data_service.get_data_objects(**self._history_query(
+            user_id, None, role, agent_name,
+            tiebreak_field=self.details_key_field,
+            after=tuple(watermark) if watermark else None,
+            limit=limit
+        ))
+        return [ChatDetails(**result) for result in results or []]
+
+    async def count_messages_before(self,
+                                    user_id: str,
+                                    agent_name: Optional[str]=None,
+                                    role: Optional[str]=None,
+                                    watermark: tuple=None) -> Optional[int]:
+        """
+        The number of messages of a user over all chats before a (created_at, message_id)
+        watermark, None if they could not be counted. Reads one index entry per message.
+        """
+        return await self.async_data_service.count_data_objects(**self._history_query(
+            user_id, None, role, agent_name,
+            tiebreak_field=self.details_key_field,
+            before=tuple(watermark)
+        ))
 
-        # Check whether a new chat_id
-        info_result = self.get_info_by_key(chat_data.chat_id)
-
-        if info_result is None:
-            chat_info_data = {
-                "chat_id": chat_id,
-                "user_id": chat_data.user_id,
-                "user_name": chat_data.user_name,
-                "agent_id": chat_data.agent_id,
-                "agent_name": chat_data.agent_name,
-                "created_at": created_at
-            }
-            info_id = self.data_service.add_data_object(
-                database_name=self.database,
-                collection_name=self.info_collection,
-                data=chat_info_data
+    async def save_user_summary(self, user_id: str, agent_name: Optional[str], summary: str,
+                                last_message: ChatDetails, position: int, exists: bool):
+        """
+        Store the summary covering the messages up to last_message.
+
+        :param position: Number of messages the summary covers before last_message.
+        :param exists: Whether get_user_summary found a summary, it is then updated in place.
+        """
+        row = {
+            "summary_id": self.summary_id(user_id, agent_name),
+            "user_id": user_id,
+            "agent_name": agent_name,
+            "summary": summary,
+            "watermark_created_at": last_message.created_at,
+            "watermark_message_id": last_message.message_id,
+            "watermark_position": position,
+            "updated_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        if exists:
+            await self.async_data_service.update_data_object(
+                self.database, self.summaries_collection, "summary_id", row.pop("summary_id"), row
+            )
+        else:
+            # A concurrent first analysis may have won, its summary is kept
+            await self.async_data_service.add_data_objects(
+                self.database, self.summaries_collection, [row], ignore_duplicate=True
             )
-            info_result = self.get_info_by_key(info_id)
-            # print(f"info_result: {info_result}")
 
-        # Add to chat_details
+    async def get_chat_history_page(self,
+                                    user_id: str,
+                                    chat_id: Optional[str]=None,
+                                    role: Optional[str]=None,
+                                    agent_name: Optional[str]=None,
+                                    limit: int=100,
+                                    before: Optional[str]=None,
+                                    after: Optional[str]=None) -> Tuple[List[ChatDetails], Optional[str]]:
+        """
+        Get one page of chat history in created_at order. Pass the returned cursor as `after`
+        to read the following page, or as `before` when paging backwards from a `before`
+        cursor. The cursor is None when there are no more messages in that direction.
+        """
+        results = await self.async_data_service.get_data_objects(**self._history_query(
+            user_id, chat_id, role, agent_name,
+            tiebreak_field=self.details_key_field,
+            after=decode_cursor(after) if after else None,
+            before=decode_cursor(before) if before else None,
+            # One extra row tells whether another page exists without a COUNT query.
+            limit=limit + 1
+        ))
+        return self._to_page(results, limit, backwards=before is not None and after is None)
+
+    @staticmethod
+    def _chat_rows(chat_data, chat_id: str, created_at) -> Tuple[dict, dict]:
+        """
+        The chat_info and chat_details rows written for one message. The user and agent of the
+        message are not in chat_details_data, they are copied from chat_info by the insert.
+        """
+        chat_info_data = {
+            "chat_id": chat_id,
+            "user_id": chat_data.user_id,
+            "user_name": chat_data.user_name,
+            "agent_id": chat_data.agent_id,
+            "agent_name": chat_data.agent_name,
+            "created_at": created_at
+        }
         chat_details_data = {
-            "message_id": message_id,
-            "chat_id": chat_data.chat_id,
+            "message_id": str(uuid.uuid4()),
+            "chat_id": chat_id,
             "role": chat_data.role,
             "content": chat_data.content,
             "created_at": created_at
         }
+        return chat_info_data, chat_details_data
 
-        details_result = self.data_service.add_data_object(
+    async def update_chat(self, chat_data) -> Optional[str]:
+        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        chat_id = chat_data.chat_id
+        if chat_id is None:
+            chat_id = str(uuid.uuid4())
+
+        chat_info_data, chat_details_data = self._chat_rows(chat_data, chat_id, created_at)
+
+        writes = [(self.details_collection, chat_details_data, False, self.details_owner)]
+        if self.info_cache.get(chat_id) is None:
+            # Create the chat_info row only if the chat is new, without reading it first
+            writes.insert(0, (self.info_collection, chat_info_data, True))
+        result = await self.async_data_service.add_data_objects_in_transaction(
             database_name=self.database,
-            collection_name=self.details_collection,
-            data=chat_details_data
+            writes=writes
         )
-        # print(f"details_result: {details_result}")
+        if result is None:
+            return None
 
+        self._on_chat_written(chat_data, chat_id, chat_info_data)
+        self._on_message_written(chat_id, chat_details_data)
         return chat_id
+
+    async def update_chats(self, chat_data_list: list) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        Store many messages at once. Chats are created if missing and messages are written in
+        bulk. Return a (chat_id, error) pair per message, error is None if it was stored.
+        """
+        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        chat_ids = []
+        chat_info_rows = {}
+        chat_details_rows = []
+
+        for chat_data in chat_data_list:
+            chat_id = chat_data.chat_id
+            if chat_id is None:
+                chat_id = str(uuid.uuid4())
+            message_created_at = getattr(chat_data, "created_at", None) or created_at
+            chat_ids.append(chat_id)
+
+            chat_info_data, chat_details_data = self._chat_rows(chat_data, chat_id, message_created_at)
+            chat_info_rows.setdefault(chat_id, chat_info_data)
+            chat_details_rows.append(chat_details_data)
+
+        info_errors = await self.async_data_service.add_data_objects(
+            database_name=self.database,
+            collection_name=self.info_collection,
+            data=list(chat_info_rows.values()),
+            ignore_duplicate=True
+        )
+        failed_chats = {chat_id: error for chat_id, error in zip(chat_info_rows.keys(), info_errors) if error}
+
+        # Messages of a chat that could not be created are not written at all
+        pending = [i for i, chat_id in enumerate(chat_ids) if chat_id not in failed_chats]
+        details_errors = await self.async_data_service.add_data_objects(
+            database_name=self.database,
+            collection_name=self.details_collection,
+            data=[chat_details_rows[i] for i in pending],
+            copy_from=self.details_owner
+        )
+
+        for chat_data, chat_id in zip(chat_data_list, chat_ids):
+            if chat_id not in failed_chats:
+                self._on_chat_written(chat_data, chat_id, chat_info_rows[chat_id])
+        # Batches may carry backdated messages, so touched windows are reseeded rather than appended to.
+        for chat_id in chat_info_rows:
+            self.conversation_cache.invalidate(chat_id)
+
+        results = [(chat_id, failed_chats.get(chat_id)) for chat_id in chat_ids]
+        for i, error in zip(pending, details_errors):
+            if error:
+                results[i] = (chat_ids[i], error)
+        return results
@@ -1,18 +1,31 @@
-from fastapi import APIRouter, status, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Union
 from datetime import datetime
+import json
 import logging
 
 from app.models.chat_details import ChatDetails
 from app.models.chat_info import ChatInfo
 from app.models.traits import Message, Traits
+from app.dependencies import get_chat_resource, get_async_openai_service
 from app.resources.chat_resource import ChatResource
-from app.services.service_factory import ServiceFactory
+from app.services.openai import AsyncOpenAIService
+from framework.utils.structured_logging import REQUEST
+from framework.utils.timing import server_timing, stage_timings, timed
 
 router = APIRouter()
 logger = logging.getLogger("uvicorn")
 
+DEFAULT_HISTORY_LIMIT = 100
+MAX_HISTORY_LIMIT = 1000
+MAX_BATCH_SIZE = 5000
+# Messages folded into a user's rolling summary per completion
+SUMMARY_BATCH_SIZE = 200
+# Completions one request spends on catching up a rolling summary, the rest is left to the next ones
+MAX_SUMMARY_BATCHES = 5
+
 class ChatData(BaseModel):
     chat_id: Optional[str] = None
     role: Optional[str] = None
@@ -22,99 +35,167 @@ class ChatData(BaseModel):
     agent_id: Optional[str] = None
     agent_name: Optional[str] = None
 
+class ChatHistoryPage(BaseModel):
+    messages: List[ChatDetails]
+    next_cursor: Optional[str] = None
+
+class ChatBatchItem(ChatData):
+    created_at: Optional[datetime] = None
+
+class ChatBatchResult(BaseModel):
+    chat_id: Optional[str] = None
+    error: Optional[str] = None
+
 class ChatResponse(BaseModel):
     content: str
     traits: Optional[Traits]
 
+class ChatStreamResult(ChatResponse):
+    need_recommendation: bool
+
 
 @router.get("/chat_info/{chat_id}", tags=["chat"], status_code=status.HTTP_200_OK)
-async def get_chat_info(chat_id: str, request: Request) -> ChatInfo:
+async def get_chat_info(chat_id: str, request: Request, res: ChatResource = Depends(get_chat_resource)) -> ChatInfo:
     """Get chat details by chat id"""
     cid = request.headers.get("X-Correlation-ID")
-    logger.info(f"Incoming Request - Method: GET, Path: /chat_info/{chat_id} - [{cid}]")
-    res = ServiceFactory.get_service("ChatResource")
-    result = res.get_info_by_key(chat_id)
+    logger.info("Incoming Request - Method: GET, Path: /chat_info/%s - [%s]", chat_id, cid, extra=REQUEST)
+    result = await res.get_info_by_key(chat_id)
     if result is None:
-        logger.error(f"Couldn't find chat with id {chat_id} - [{cid}]")
+        logger.error("Couldn't find chat with id %s - [%s]", chat_id, cid)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found")
     return result
 
 
 @router.get("/chat_details/{message_id}", tags=["chat"], status_code=status.HTTP_200_OK)
-async def get_chat_details(message_id: str, request: Request) -> ChatDetails:
+async def get_chat_details(message_id: str, request: Request,
+                           res: ChatResource = Depends(get_chat_resource)) -> ChatDetails:
     """Gets chat details by message id"""
     cid = request.headers.get("X-Correlation-ID")
-    logger.info(f"Incoming Request - Method: GET, Path: /chat_details/{message_id} - [{cid}]")
-    res = ServiceFactory.get_service("ChatResource")
-    result = res.get_details_by_key(message_id)
+    logger.info("Incoming Request - Method: GET, Path: /chat_details/%s - [%s]", message_id, cid, extra=REQUEST)
+    result = await res.get_details_by_key(message_id)
     if result is None:
-        logger.error(f"Couldn't find message details with id {message_id} - [{cid}]")
+        logger.error("Couldn't find message details with id %s - [%s]", message_id, cid)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chat details not found")
     return result
 
 
-@router.get("/chat_history", tags=["chat"], response_model=List[ChatDetails], status_code=status.HTTP_200_OK)
+@router.get("/chat_history", tags=["chat"], response_model=Union[List[ChatDetails], ChatHistoryPage],
+            status_code=status.HTTP_200_OK)
 async def get_chat_history(
     request: Request,
     user_id: str = Query(..., description="User ID (required)"),
     chat_id: Optional[str] = Query(None, description="Chat ID to optionally filter by"),
     role: Optional[str] = Query(None, description="Role to optionally filter by"),
-    agent_name: Optional[str] = Query(None, description="Agent Name to optionally filter by")
-) -> List[ChatDetails]:
-    """Get chat history by user_id (optional: chat_id, agent_type and role), return messages list."""
+    agent_name: Optional[str] = Query(None, description="Agent Name to optionally filter by"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_HISTORY_LIMIT,
+                                 description=f"Page size, pages the history (default {DEFAULT_HISTORY_LIMIT})"),
+    before: Optional[str] = Query(None, description="Cursor, return the page of messages before it"),
+    after: Optional[str] = Query(None, description="Cursor, return the page of messages after it"),
+    res: ChatResource = Depends(get_chat_resource),
+) -> Union[List[ChatDetails], ChatHistoryPage]:
+    """
+    Get chat history by user_id (optional: chat_id, agent_type and role), return messages list.
+    With limit, before or after, return one page of messages with the next_cursor of the
+    following page instead, null on the last page.
+    """
     cid = request.headers.get("X-Correlation-ID")
-    logger.info(f"Incoming Request - Method: GET, Path: /chat_history - [{cid}]")
-    res = ServiceFactory.get_service("ChatResource")
-    result = res.get_chat_history(user_id=user_id, chat_id=chat_id, role=role, agent_name=agent_name)
+    logger.info("Incoming Request - Method: GET, Path: /chat_history - [%s]", cid, extra=REQUEST)
+    if before and after:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Use either before or after, not both")
+    paged = limit is not None or before is not None or after is not None
+    next_cursor = None
+    try:
+        if paged:
+            result, next_cursor = await res.get_chat_history_page(user_id=user_id, chat_id=chat_id, role=role,
+                                                                  agent_name=agent_name,
+                                                                  limit=limit or DEFAULT_HISTORY_LIMIT,
+                                                                  before=before, after=after)
+        else:
+            result = await res.get_chat_history(user_id=user_id, chat_id=chat_id, role=role,
+                                                agent_name=agent_name)
+    except ValueError as e:
+        logger.error("Invalid chat history cursor: %s - [%s]", e, cid)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
     if not result:
-        logger.error(f"No chat details found for user_id/chat_id: {user_id}/{chat_id} - [{cid}]")
+        logger.error("No chat details found for user_id/chat_id: %s/%s - [%s]", user_id, chat_id, cid)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"No chat details found for user_id: {user_id}"
         )
+    if paged:
+        return ChatHistoryPage(messages=result, next_cursor=next_cursor)
     return result
 
 
 @router.post("/update_chat", tags=["chat"], status_code=status.HTTP_200_OK)
-async def update_chat(chat_data: ChatData, request: Request) -> str:
+async def update_chat(chat_data: ChatData, request: Request, res: ChatResource = Depends(get_chat_resource)) -> str:
     """Store message to database, return a chat_id"""
     cid = request.headers.get("X-Correlation-ID")
-    logger.info(f"Incoming Request - Method: POST, Path: /update_chat - [{cid}]")
-    res = ServiceFactory.get_service("ChatResource")
-    result = res.update_chat(chat_data)
+    logger.info("Incoming Request - Method: POST, Path: /update_chat - [%s]", cid, extra=REQUEST)
+    result = await res.update_chat(chat_data)
     if result is None:
-        logger.error(f"Failed to add new chat message to database: {chat_data} - [{cid}]")
+        logger.error("Failed to add new chat message to database: %s - [%s]", chat_data, cid)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Failed to add message to database")
     return result
 
 
+@router.post("/update_chat/batch", tags=["chat"], response_model=List[ChatBatchResult], status_code=status.HTTP_200_OK)
+async def update_chat_batch(chat_data_list: List[ChatBatchItem], request: Request,
+                            res: ChatResource = Depends(get_chat_resource)) -> List[ChatBatchResult]:
+    """Store many messages to database, return a chat_id or an error for each message"""
+    cid = request.headers.get("X-Correlation-ID")
+    logger.info("Incoming Request - Method: POST, Path: /update_chat/batch - [%s]", cid, extra=REQUEST)
+    if len(chat_data_list) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {MAX_BATCH_SIZE} messages per batch")
+    results = await res.update_chats(chat_data_list)
+    failed = sum(1 for _, error in results if error)
+    if failed:
+        logger.error("Failed to add %s/%s chat messages to database - [%s]", failed, len(results), cid)
+    return [ChatBatchResult(chat_id=chat_id, error=error) for chat_id, error in results]
+
+
+async def _general_chat_history(db_service: ChatResource, user_id: str, chat_id: Optional[str]) -> List[ChatDetails]:
+    # A known chat only needs its most recent messages
+    if chat_id:
+        return await db_service.get_recent_messages(user_id=user_id, chat_id=chat_id, agent_name="Chat")
+    return await db_service.get_chat_history(user_id=user_id, chat_id=chat_id, agent_name="Chat")
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @router.post("/general_chat", tags=["chat"], response_model=ChatResponse, status_code=status.HTTP_200_OK)
 async def general_chat(
     request: Request,
     user_id: str = Query(..., description="User ID (required)"),
     chat_id: str = Query(None, description="Chat ID (optional)"),
     query: str = Query(..., description="Chat Input (required)"),
+    db_service: ChatResource = Depends(get_chat_resource),
+    openai_service: AsyncOpenAIService = Depends(get_async_openai_service),
 ) -> ChatResponse:
     """Generate the multiple rounds chat with user and determine when to give the recommendation"""
     cid = request.headers.get("X-Correlation-ID")
-    logger.info(f"Incoming Request - Method: POST, Path: /general_chat - [{cid}]")
+    logger.info("Incoming Request - Method: POST, Path: /general_chat - [%s]", cid, extra=REQUEST)
     
     # Get chat history by specific chat id
-    db_service = ServiceFactory.get_service("ChatResource")
-    chat_history = db_service.get_chat_history(user_id=user_id, chat_id=chat_id, agent_name="Chat")
+    with timed("history"):
+        chat_history = await _general_chat_history(db_service, user_id, chat_id)
 
     # Generate agent's answer
-    openai_service = ServiceFactory.get_service("OpenAI")
-    answer = openai_service.general_chat(query=query, chat_history=chat_history, cid=cid)
+    with timed("answer"):
+        answer = await openai_service.general_chat(query=query, chat_history=chat_history, cid=cid)
     if answer is None:
-        logger.error(f"Couldn't get Open AI response - [{cid}]")
+        logger.error("Couldn't get Open AI response - [%s]", cid)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Couldn't get Open AI response")
 
     if answer["need_recommendation"]: # able to generate recommendation:
-        traits = openai_service.extract_song_traits(query, cid)
+        with timed("traits"):
+            traits = await openai_service.extract_song_traits(query, cid)
         if traits is None:
-            logger.error(f"Couldn't get song traits - [{cid}]")
+            logger.error("Couldn't get song traits - [%s]", cid)
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Couldn't extract song traits")
         response_data = ChatResponse(
             content=answer["content"],
@@ -123,7 +204,7 @@ async def general_chat(
         return response_data
     else: # continue general chat
         if answer["content"] is None:
-            logger.error(f"Failed generating chat content - [{cid}]")
+            logger.error("Failed generating chat content - [%s]", cid)
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed in generating chat content")
         response_data = ChatResponse(
             content=answer["content"],
@@ -133,29 +214,140 @@ async def general_chat(
 
 
 
+@router.post("/general_chat/stream", tags=["chat"], status_code=status.HTTP_200_OK,
+             response_class=StreamingResponse)
+async def general_chat_stream(
+    request: Request,
+    user_id: str = Query(..., description="User ID (required)"),
+    chat_id: str = Query(None, description="Chat ID (optional)"),
+    query: str = Query(..., description="Chat Input (required)"),
+    db_service: ChatResource = Depends(get_chat_resource),
+    openai_service: AsyncOpenAIService = Depends(get_async_openai_service),
+) -> StreamingResponse:
+    """
+    Same as /general_chat as Server-Sent Events: "content" events carry the answer as it is
+    generated ({"delta": "..."}), then one "done" event carries the whole answer with
+    need_recommendation and the traits, or an "error" event carries {"detail": "..."}.
+    Right before it, a "timing" event carries the Server-Timing of the stages of the whole
+    stream ({"server_timing": "..."}), the header only has the stages before the first event.
+    """
+    cid = request.headers.get("X-Correlation-ID")
+    logger.info("Incoming Request - Method: POST, Path: /general_chat/stream - [%s]", cid, extra=REQUEST)
+
+    with timed("history"):
+        chat_history = await _general_chat_history(db_service, user_id, chat_id)
+
+    async def events():
+        try:
+            answer = None
+            async for item in openai_service.general_chat_stream(query=query, chat_history=chat_history, cid=cid):
+                if isinstance(item, str):
+                    yield _sse("content", {"delta": item})
+                else:
+                    answer = item
+
+            if answer is None or answer.get("content") is None:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed in generating chat content")
+            traits = None
+            if answer.get("need_recommendation"): # able to generate recommendation
+                with timed("traits"):
+                    traits = await openai_service.extract_song_traits(query, cid)
+                if traits is None:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Couldn't extract song traits")
+            result = ChatStreamResult(content=answer["content"], traits=traits,
+                                      need_recommendation=bool(answer.get("need_recommendation")))
+            event = _sse("done", result.model_dump(mode="json"))
+        except HTTPException as e:
+            logger.error("Failed streaming chat response: %s - [%s]", e.detail, cid)
+            event = _sse("error", {"detail": e.detail})
+        except Exception as e:
+            logger.error("Failed streaming chat response: %s - [%s]", e, cid)
+            event = _sse("error", {"detail": "Failed in generating chat content"})
+        yield _sse("timing", {"server_timing": server_timing(stage_timings())})
+        yield event
+
+    # No buffering by proxies, each event is sent as soon as it is produced
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _rolling_summary(db_service: ChatResource, openai_service: AsyncOpenAIService,
+                           user_id: str, cid: str) -> Optional[str]:
+    """
+    The user's stored summary brought up to date: only the messages after its watermark are
+    summarized, folded into it and stored with the new watermark. When messages were written
+    behind the watermark since, e.g. backdated or committed late, the summary is rebuilt.
+    At most MAX_SUMMARY_BATCHES batches are summarized, a long backlog takes several requests.
+    """
+    stored = await db_service.get_user_summary(user_id=user_id, agent_name="Chat")
+    summary, watermark, position, exists = None, None, 0, stored is not None
+    if stored:
+        watermark = (stored["watermark_created_at"], stored["watermark_message_id"])
+        behind = await db_service.count_messages_before(user_id=user_id, agent_name="Chat", role="human",
+                                                        watermark=watermark)
+        if behind is None or behind == stored["watermark_position"]:
+            summary, position = stored["summary"], stored["watermark_position"] or 0
+        else:
+            logger.warning("Messages were written behind the summary watermark, summarizing again - [%s]", cid)
+            watermark = None
+
+    for _ in range(MAX_SUMMARY_BATCHES):
+        messages = await db_service.get_messages_after(user_id=user_id, agent_name="Chat", role="human",
+                                                        watermark=watermark, limit=SUMMARY_BATCH_SIZE)
+        if not messages:
+            break
+        new_summary = await openai_service.summarize_chat_history(summary, messages, cid)
+        if new_summary is None:
+            logger.error("Unable to summarize the user's chat history - [%s]", cid)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unable to analyze the user's preference")
+        summary = new_summary
+        # Before the new watermark: the old one with the messages before it, and the batch
+        position = (position + 1 if watermark is not None else 0) + len(messages) - 1
+        await db_service.save_user_summary(user_id=user_id, agent_name="Chat", summary=summary,
+                                           last_message=messages[-1], position=position, exists=exists)
+        exists = True
+        watermark = (messages[-1].created_at, messages[-1].message_id)
+        if len(messages) < SUMMARY_BATCH_SIZE:
+            break
+    else:
+        logger.warning("The summary is behind the user's messages, the next analysis continues it - [%s]", cid)
+    return summary
+
+
 @router.post("/analyze_preference", tags=["analyze preference"], status_code=status.HTTP_200_OK)
 async def analyze_preference(
     request: Request,
     user_id: str = Query(..., description="User ID (required)"),
     chat_id: Optional[str] = Query(None, description="Chat ID (optional)"),
+    db_service: ChatResource = Depends(get_chat_resource),
+    openai_service: AsyncOpenAIService = Depends(get_async_openai_service),
 ) -> str:
-    """Analyze the user preference with given chat history, return agent message"""
+    """
+    Analyze the user preference with given chat history, return agent message. Without a
+    chat_id the analysis reads a rolling summary of all the user's messages instead.
+    """
     cid = request.headers.get("X-Correlation-ID")
-    logger.info(f"Incoming Request - Method: POST, Path: /analyze_preference - [{cid}]")
+    logger.info("Incoming Request - Method: POST, Path: /analyze_preference - [%s]", cid, extra=REQUEST)
     
     # Get chat history with human input and recommendation only
-    db_service = ServiceFactory.get_service("ChatResource")
-    chat_history = db_service.get_chat_history(user_id=user_id, chat_id=chat_id, role="human", agent_name="Chat")
+    summary = None
+    if chat_id:
+        with timed("history"):
+            chat_history = await db_service.get_chat_history(user_id=user_id, chat_id=chat_id, role="human", agent_name="Chat")
+    else:
+        chat_history = []
+        with timed("summary"):
+            summary = await _rolling_summary(db_service, openai_service, user_id, cid)
 
-    if chat_history:
+    if chat_history or summary:
         # Get preference analysis
-        openai_service = ServiceFactory.get_service("OpenAI")
-        result = openai_service.analyze_user_preference(chat_history, cid)
+        with timed("analysis"):
+            result = await openai_service.analyze_user_preference(chat_history, cid, summary=summary)
         if result is None:
-            logger.error(f"Unable to analyze the user's preference - [{cid}]")
+            logger.error("Unable to analyze the user's preference - [%s]", cid)
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unable to analyze the user's preference")
     else:
-        logger.error(f"No user records available for analysis - [{cid}]")
+        logger.error("No user records available for analysis - [%s]", cid)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No user records available for analysis")
 
     # print(f"chatbot service - result: {result}")
@@ -163,14 +355,14 @@ async def analyze_preference(
 
 
 @router.post("/extract_traits", tags=["extract traits"], response_model=Traits, status_code=status.HTTP_200_OK)
-async def extract_traits(query: Message, request: Request) -> Traits:
+async def extract_traits(query: Message, request: Request,
+                         openai_service: AsyncOpenAIService = Depends(get_async_openai_service)) -> Traits:
     """Given a user query, return a formatted spotify recommendations JSON"""
     cid = request.headers.get("X-Correlation-ID")
-    logger.info(f"Incoming Request - Method: POST, Path: /extract_traits - [{cid}]")
-    result = ServiceFactory.get_service("OpenAI")
-    result = result.extract_song_traits(query.query, cid)
+    logger.info("Incoming Request - Method: POST, Path: /extract_traits - [%s]", cid, extra=REQUEST)
+    result = await openai_service.extract_song_traits(query.query, cid)
     if result is None:
-        logger.error(f"Couldn't extract song traits - [{cid}]")
+        logger.error("Couldn't extract song traits - [%s]", cid)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Couldn't extract song traits")
     return result
 
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+
+from framework.utils.metrics import latest
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Prometheus metrics of this worker"""
+    body, content_type = latest()
+    return Response(content=body, media_type=content_type)
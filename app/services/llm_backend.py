@@ -0,0 +1,114 @@
+import asyncio
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+from openai import NOT_GIVEN, AsyncOpenAI
+
+from framework.utils.metrics import observe_completion
+from framework.utils.timing import timed
+
+
+class AsyncLLMBackend:
+    """
+    Chat completions of one model provider, what AsyncOpenAIService sends its prompts to.
+    Failures are raised, the service decides whether to retry or give up.
+    """
+
+    async def complete(self, messages: list, model: str, response_format: Optional[dict] = None) -> str:
+        """Content of the assistant message answering the messages"""
+        raise NotImplementedError
+
+    def stream(self, messages: list, model: str, response_format: Optional[dict] = None) -> AsyncIterator[str]:
+        """Content of the assistant message piece by piece as it is generated"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class AsyncOpenAIBackend(AsyncLLMBackend):
+    """
+    The chat completions API of OpenAI, or of any server speaking it, e.g. a local model
+    server or the stand-in in benchmarks/llm_server.py, selected with base_url.
+    """
+
+    def __init__(self, token=None, org=None, base_url: Optional[str] = None, max_connections: int = 100,
+                 max_keepalive_connections: int = 20, timeout: float = 60.0, client: Optional[AsyncOpenAI] = None):
+        """
+        :param base_url: Root of the API, e.g. "http://localhost:8100/v1". None for OPENAI_BASE_URL or OpenAI.
+        :param max_connections: Maximum number of concurrent connections to the API.
+        :param max_keepalive_connections: Idle connections kept open for reuse.
+        :param timeout: Seconds before a completion request is abandoned.
+        :param client: Client to use instead of one created from the other arguments.
+        """
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_connections,
+                                    max_keepalive_connections=max_keepalive_connections),
+                timeout=timeout
+            )
+            client = AsyncOpenAI(api_key=token, organization=org, base_url=base_url, http_client=http_client)
+        self.client = client
+
+    async def complete(self, messages: list, model: str, response_format: Optional[dict] = None) -> str:
+        start = time.perf_counter()
+        try:
+            with timed("llm"):
+                completion = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    response_format=response_format or NOT_GIVEN
+                )
+        except Exception:
+            observe_completion(model, "error", time.perf_counter() - start)
+            raise
+        observe_completion(model, "ok", time.perf_counter() - start, completion.usage)
+        return completion.choices[0].message.content
+
+    async def stream(self, messages: list, model: str, response_format: Optional[dict] = None) -> AsyncIterator[str]:
+        # Only the waits on the API are timed, not the consumer handling each piece
+        waited = 0.0
+
+        async def upstream(awaitable):
+            nonlocal waited
+            start = time.perf_counter()
+            try:
+                with timed("llm"):
+                    return await awaitable
+            finally:
+                waited += time.perf_counter() - start
+
+        usage = None
+        try:
+            stream = await upstream(self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format=response_format or NOT_GIVEN,
+                stream=True,
+                # The usage arrives in a last chunk without choices
+                stream_options={"include_usage": True},
+            ))
+            # Not the aiter()/anext() builtins, the image runs Python 3.9
+            chunks = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await upstream(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                usage = chunk.usage or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        except (GeneratorExit, asyncio.CancelledError):
+            # The consumer went away, e.g. the client disconnected
+            observe_completion(model, "cancelled", waited)
+            raise
+        except Exception:
+            observe_completion(model, "error", waited)
+            raise
+        observe_completion(model, "ok", waited, usage)
+
+    async def close(self):
+        """Close the HTTP connections kept alive by the client"""
+        await self.client.close()
@@ -1,9 +1,21 @@
-from openai import OpenAI
 from app.models.traits import Traits
 from app.models.chat_details import ChatDetails
-from typing import Optional
+from app.utils.context_window import fit_to_budget
+from app.utils.json_stream import JsonStringFieldExtractor
+from app.services.llm_backend import AsyncLLMBackend, AsyncOpenAIBackend
+from framework.utils.metrics import LLM_RETRIES
+from framework.utils.persistent_cache import PersistentCache
+from framework.utils.similarity_cache import SimilarityCache
+from framework.utils.single_flight import AsyncSingleFlight
+from framework.utils.structured_logging import PAYLOAD
+from framework.utils.timing import timed
+from typing import Optional, get_args
+import asyncio
+import copy
+import hashlib
 import json
 import logging
+import threading
 from fastapi import HTTPException
 
 logger = logging.getLogger("uvicorn")
@@ -192,6 +204,12 @@ You are a Music Preference Analyzer assistant. Your task is to analyze the user'
 
 """
 
+SYS_PROMPT_SUMMARY = """
+You maintain a running summary of a user's music preferences, built from the messages the user sent to a music assistant.
+You are given the current summary, which may be empty, and the user's new messages with their timestamps.
+Return the updated summary as plain text, at most 300 words. Keep the genres, artists, moods and themes the user asked for, note when and how their preferences changed over time with approximate dates, and drop details that are not about music.
+"""
+
 SYS_PROMPT_CHAT = """ 
 You are a knowledgeable and engaging Music Expert assistant. 
 Your role is to interact with users in a conversational manner about music-related topics. Each interaction includes the user's chat history with timestamps and the new input message. 
@@ -290,49 +308,295 @@ TRAITS = [
 
 genres = ["acoustic", "afrobeat", "alt-rock", "alternative", "ambient", "anime", "black-metal", "bluegrass", "blues", "bossanova", "brazil", "breakbeat", "british", "cantopop", "chicago-house", "children", "chill", "classical", "club", "comedy", "country", "dance", "dancehall", "death-metal", "deep-house", "detroit-techno", "disco", "disney", "drum-and-bass", "dub", "dubstep", "edm", "electro", "electronic", "emo", "folk", "forro", "french", "funk", "garage", "german", "gospel", "goth", "grindcore", "groove", "grunge", "guitar", "happy", "hard-rock", "hardcore", "hardstyle", "heavy-metal", "hip-hop", "holidays", "honky-tonk", "house", "idm", "indian", "indie", "indie-pop", "industrial", "iranian", "j-dance", "j-idol", "j-pop", "j-rock", "jazz", "k-pop", "kids", "latin", "latino", "malay", "mandopop", "metal", "metal-misc", "metalcore", "minimal-techno", "movies", "mpb", "new-age", "new-release", "opera", "pagode", "party", "philippines-opm", "piano", "pop", "pop-film", "post-dubstep", "power-pop", "progressive-house", "psych-rock", "punk", "punk-rock", "r-n-b", "rainy-day", "reggae", "reggaeton", "road-trip", "rock", "rock-n-roll", "rockabilly", "romance", "sad", "salsa", "samba", "sertanejo", "show-tunes", "singer-songwriter", "ska", "sleep", "songwriter", "soul", "soundtracks", "spanish", "study", "summer", "swedish", "synth-pop", "tango", "techno", "trance", "trip-hop", "turkish", "work-out", "world-music"]
 
-class OpenAIService:
-    
-    def __init__(self, token, org=None):
-        self.client = OpenAI(api_key=token, organization=org)
-    
-    # https://platform.openai.com/docs/quickstart?language-preference=python
-    def extract_song_traits(self, query: str, cid: str) -> Optional[Traits]:
+GENRE_PROMPT = f"Given the description from the user, write out the genres that apply from the following list:\n{genres}"
+
+SYS_PROMPT_STRUCTURED_TRAITS = SYS_PROMPT_RECOMMENDATION + """
+Also fill `genres` with every genre from the allowed list that applies to the user's description, at least one.
+"""
+
+# Two completions, one for the traits and one for the genres, validated by hand.
+TRAITS_MODE_COMPLETIONS = "completions"
+# One completion constrained by TRAITS_RESPONSE_FORMAT.
+TRAITS_MODE_STRUCTURED = "structured"
+
+_JSON_TYPES = {float: "number", int: "integer", str: "string"}
+
+
+def _traits_response_format() -> dict:
+    """Strict JSON schema with every trait of the Traits model, nullable, and the genres vocabulary"""
+    properties = {}
+    for trait in TRAITS:
+        field_type = next(arg for arg in get_args(Traits.model_fields[trait].annotation) if arg is not type(None))
+        properties[trait] = {"type": [_JSON_TYPES[field_type], "null"]}
+    properties["genres"] = {"type": "array", "items": {"type": "string", "enum": genres}}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "song_traits",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+TRAITS_RESPONSE_FORMAT = _traits_response_format()
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+class AsyncOpenAIService:
+    """
+    Chat, song traits and preference analysis completions for the async routes. Completions
+    are awaited instead of blocking the event loop, so one worker can keep many of them in
+    flight over the connections of one client. OpenAIService offers the same for sync callers.
+    """
+
+    def __init__(self, token=None, org=None, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 timeout: float = 60.0, traits_mode: str = TRAITS_MODE_COMPLETIONS,
+                 traits_cache: Optional[PersistentCache] = None, similarity_cache: Optional[SimilarityCache] = None,
+                 context_budgets: Optional[dict] = None, base_url: Optional[str] = None,
+                 backend: Optional[AsyncLLMBackend] = None, model: str = DEFAULT_MODEL):
+        """
+        :param traits_mode: TRAITS_MODE_COMPLETIONS or TRAITS_MODE_STRUCTURED, how song traits are extracted.
+        :param traits_cache: Cache of extracted song traits checked before calling the model.
+        :param similarity_cache: Near duplicate lookup of song traits, checked after traits_cache.
+        :param context_budgets: Token budget of the chat history sent by "general_chat" and
+            "analyze_preference", the older messages are trimmed. No limit for a missing endpoint.
+        :param max_connections: Maximum number of concurrent connections to the API.
+        :param max_keepalive_connections: Idle connections kept open for reuse.
+        :param timeout: Seconds before a completion request is abandoned.
+        :param base_url: Root of a chat completions API other than OpenAI's, see AsyncOpenAIBackend.
+        :param backend: Backend to send the completions to instead of an AsyncOpenAIBackend.
+        :param model: Model answering every completion, part of the traits cache keys.
+        """
+        self.backend = backend or AsyncOpenAIBackend(
+            token=token, org=org, base_url=base_url, max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections, timeout=timeout
+        )
+        self.model = model
+        self.single_flight = AsyncSingleFlight()
+        self.traits_mode = traits_mode
+        self.traits_cache = traits_cache
+        self.similarity_cache = similarity_cache
+        self.context_budgets = context_budgets
+
+    async def close(self):
+        """Close the HTTP connections kept alive by the backend"""
+        await self.backend.close()
+
+    def _traits_version(self) -> str:
+        """
+        Hash of what the traits of a query depend on besides the query: the model, the prompts,
+        the response format and the mode. The caches of song traits are keyed on it.
+        """
+        if self.traits_mode == TRAITS_MODE_STRUCTURED:
+            prompts = [SYS_PROMPT_STRUCTURED_TRAITS, json.dumps(TRAITS_RESPONSE_FORMAT)]
+        else:
+            prompts = [SYS_PROMPT_RECOMMENDATION, GENRE_PROMPT]
+        return hashlib.sha256("\0".join([self.traits_mode, self.model, *prompts]).encode()).hexdigest()
+
+    def _traits_cache_key(self, query: str) -> str:
+        """Key of a query in the traits cache, queries differing only in case and whitespace share a key"""
+        normalized = " ".join(query.lower().split())
+        return hashlib.sha256("\0".join([self._traits_version(), normalized]).encode()).hexdigest()
+
+    def _cached_traits(self, query: str, cid: str):
+        # Entries are copied in and out, callers own the result and may change it.
+        # The traits cache reads SQLite, so the async methods call this on a worker thread
+        output_json = None
+        if self.traits_cache is not None:
+            output_json = self.traits_cache.get(self._traits_cache_key(query))
+        if output_json is None and self.similarity_cache is not None:
+            # A paraphrase of a query answered before gets the same traits
+            output_json = self.similarity_cache.get(query, namespace=self._traits_version())
+        if output_json is not None:
+            logger.info("Got cached song traits: %s - [%s]", output_json, cid, extra=PAYLOAD)
+            output_json = copy.deepcopy(output_json)
+        return output_json
+
+    @staticmethod
+    def _chat_key(query: str, sys_prompt: str, model: str, response_format) -> tuple:
+        """Identical completions share this key and are sent once while one is in flight"""
+        return sys_prompt, query, model, json.dumps(response_format, sort_keys=True) if response_format else None
+
+    def _cache_traits(self, query: str, output_json: dict):
+        if self.traits_cache is not None:
+            self.traits_cache.set(self._traits_cache_key(query), copy.deepcopy(output_json))
+        if self.similarity_cache is not None:
+            self.similarity_cache.add(query, copy.deepcopy(output_json), namespace=self._traits_version())
+
+    @staticmethod
+    def _count_retry(attempt: int, operation: str):
+        if attempt:
+            LLM_RETRIES.labels(operation).inc()
+
+    @staticmethod
+    def _messages(query: str, sys_prompt: str) -> list:
+        return [
+            {"role": "system", "content": sys_prompt},
+            {
+                "role": "user",
+                "content": query
+            }
+        ]
+
+    def _fit_history(self, lines: list[str], endpoint: str, cid: str) -> list[str]:
+        """Keep the most recent history lines within the token budget of the endpoint"""
+        budget = (self.context_budgets or {}).get(endpoint)
+        with timed("prompt"):
+            lines, trimmed = fit_to_budget(lines, budget)
+        if trimmed:
+            logger.info("Trimmed %s tokens of chat history for %s, budget %s - [%s]", trimmed, endpoint, budget, cid)
+        return lines
+
+    def _preference_query(self, chat_history: list[ChatDetails], cid: str, summary: Optional[str] = None) -> str:
+        sections = []
+        if summary:
+            sections.append(f"**Summary of the User's Chat History:**\n{summary}")
+        if chat_history or not summary:
+            lines = [f"{str(chat.created_at)} - {chat.content}" for chat in chat_history]
+            sections.append("\n".join(["**User's Chat History:**", *self._fit_history(lines, "analyze_preference", cid)]))
+        return "\n\n".join(sections)
+
+    def _summary_query(self, summary: Optional[str], chat_history: list[ChatDetails], cid: str) -> str:
+        lines = [f"{str(chat.created_at)} - {chat.content}" for chat in chat_history]
+        return "\n".join([
+            "**Current Summary:**", summary or "(empty)", "",
+            "**New Messages:**", *self._fit_history(lines, "analyze_preference", cid)
+        ])
+
+    def _general_chat_input(self, query: str, chat_history: list[ChatDetails], cid: str) -> str:
+        lines = [f"{chat.role}: {chat.content}" for chat in chat_history]
+        formatted_history = "\n".join(["### User Chat History ###", *self._fit_history(lines, "general_chat", cid)])
+
+        return formatted_history + f"\n\n### User New Input ###\n{query}"
+
+    def _verify_traits_json(self, output: str, cid: str):
+        """Verify the JSON provided from GPT and add missing fields"""
+        logger.info("Verifying json: %s - [%s]", output, cid, extra=PAYLOAD)
+        try:
+            start = output.index("{")
+            end = output.index("}")
+            output_json = json.loads(output[start:end+1])
+        except Exception as e:
+            logger.error("JSON decode error: %s - [%s]", output, cid)
+            return None
+        for trait in TRAITS:
+            if trait not in output_json:
+                logger.error("Missing trait: %s - [%s]", trait, cid)
+                return None
+        for key in output_json:
+            if key not in TRAITS:
+                logger.error("Extra key: %s - [%s]", key, cid)
+                return None
+            
+        output_json["limit"] = 3
+        output_json["market"] = "US"
+        
+        return output_json
+
+    def _verify_structured_traits(self, output: str, cid: str):
+        """Verify the JSON of a TRAITS_RESPONSE_FORMAT completion and add missing fields"""
+        logger.info("Verifying structured json: %s - [%s]", output, cid, extra=PAYLOAD)
+        try:
+            output_json = json.loads(output)
+        except Exception as e:
+            logger.error("JSON decode error: %s - [%s]", output, cid)
+            return None
+        # The schema is enforced by the API, this only guards against refusals and truncation
+        if any(trait not in output_json for trait in TRAITS):
+            logger.error("Missing traits: %s - [%s]", output, cid)
+            return None
+        song_genres = [genre for genre in output_json.get("genres") or [] if genre in genres]
+        if len(song_genres) == 0:
+            logger.error("No genres found: %s - [%s]", output, cid)
+            return None
+
+        output_json["genres"] = song_genres
+        output_json["limit"] = 3
+        output_json["market"] = "US"
+        return output_json
+
+    def _extract_genres(self, output: str, cid: str) -> Optional[list]:
+        """Extract genres from GPT response"""
+        logger.info("Extracting genres: %s - [%s]", output, cid, extra=PAYLOAD)
+        song_genres = [genre for genre in genres if genre in (output or "")]
+        if len(song_genres) == 0:
+            logger.error("No genres found: %s - [%s]", output, cid)
+            return None
+        return song_genres
+
+    async def extract_song_traits(self, query: str, cid: str) -> Optional[Traits]:
         """Given a query, extract a songs traits and genres and return the JSON representation"""
-        logger.info(f"Getting song traits from query: {query} - [{cid}]")
-        for _ in range(3): # Try 3 times
-            traits_completion = self._chat(query, SYS_PROMPT_RECOMMENDATION, cid)
-            genre_completion = self._chat(
-                query,
-                f"Given the description from the user, write out the genres that apply from the following list:\n{genres}",
-                cid
-            )
-            output_json = self._verify_traits_json(traits_completion, cid)
-            if output_json is None:
-                continue
-            output_json = self._extract_genres(genre_completion, output_json, cid)
+        logger.info("Getting song traits from query: %s - [%s]", query, cid)
+        output_json = await asyncio.to_thread(self._cached_traits, query, cid)
+        if output_json is not None:
+            return output_json
+
+        if self.traits_mode == TRAITS_MODE_STRUCTURED:
+            for attempt in range(3): # Try 3 times
+                self._count_retry(attempt, "structured_traits")
+                output_json = self._verify_structured_traits(
+                    await self._chat(query, SYS_PROMPT_STRUCTURED_TRAITS, cid, response_format=TRAITS_RESPONSE_FORMAT),
+                    cid
+                )
+                if output_json is not None:
+                    logger.info("Got song traits: %s - [%s]", output_json, cid, extra=PAYLOAD)
+                    await asyncio.to_thread(self._cache_traits, query, output_json)
+                    return output_json
+            logger.error("Failed to get song traits: %s - [%s]", query, cid)
+            raise HTTPException(status_code=500, detail="Failed get song traits")
+
+        output_json, song_genres = None, None
+        for attempt in range(3): # Try 3 times, only redoing the completion that failed
+            # Traits and genres are independent, so both completions are in flight at once
+            calls = {}
             if output_json is None:
+                self._count_retry(attempt, "traits")
+                calls["traits"] = self._chat(query, SYS_PROMPT_RECOMMENDATION, cid)
+            if song_genres is None:
+                self._count_retry(attempt, "genres")
+                calls["genres"] = self._chat(query, GENRE_PROMPT, cid)
+            completions = dict(zip(calls, await asyncio.gather(*calls.values())))
+            if "traits" in completions:
+                output_json = self._verify_traits_json(completions["traits"], cid)
+            if "genres" in completions:
+                song_genres = self._extract_genres(completions["genres"], cid)
+            if output_json is None or song_genres is None:
                 continue
-            logger.info(f"Got song traits: {output_json} - [{cid}]")
+            output_json["genres"] = song_genres
+            logger.info("Got song traits: %s - [%s]", output_json, cid, extra=PAYLOAD)
+            await asyncio.to_thread(self._cache_traits, query, output_json)
             return output_json
-        logger.error(f"Failed to get song traits: {query} - [{cid}]")
+        logger.error("Failed to get song traits: %s - [%s]", query, cid)
         raise HTTPException(status_code=500, detail="Failed get song traits")
 
-    def analyze_user_preference(self, chat_history: list[ChatDetails], cid: str) -> str:
-        """Analyze the user preference with given chat history, return agent message"""
-        query = "**User's Chat History:**"
-        logger.info(f"Analyzing user preference. Chat history: {chat_history} - [{cid}]")
-        for chat in chat_history:
-            query += f"\n{str(chat.created_at)} - {chat.content}"
-
-        preference_completion = self._chat(
-            query,
+    async def analyze_user_preference(self, chat_history: list[ChatDetails], cid: str,
+                                      summary: Optional[str] = None) -> str:
+        """
+        Analyze the user preference with given chat history, return agent message. The chat
+        history may be replaced or preceded by a summary of it, see summarize_chat_history.
+        """
+        logger.info("Analyzing user preference of %s messages - [%s]", len(chat_history), cid)
+        preference_completion = await self._chat(
+            self._preference_query(chat_history, cid, summary),
             SYS_PROMPT_PREFERENCE,
             cid
         )
-        logger.info(f"Got user preferences: {preference_completion} - [{cid}]")
+        logger.info("Got user preferences: %s - [%s]", preference_completion, cid, extra=PAYLOAD)
         return preference_completion
 
-    def general_chat(self, query: str, chat_history: list[ChatDetails], cid: str) -> dict:
+    async def summarize_chat_history(self, summary: Optional[str], chat_history: list[ChatDetails], cid: str) -> Optional[str]:
+        """Fold new messages into a rolling summary of the user's chat history, None on failure"""
+        logger.info("Summarizing %s new messages - [%s]", len(chat_history), cid)
+        return await self._chat(self._summary_query(summary, chat_history, cid), SYS_PROMPT_SUMMARY, cid)
+
+    async def general_chat(self, query: str, chat_history: list[ChatDetails], cid: str) -> dict:
         """
         Generate the multiple rounds chat with user, return with a json in the format of
         {
@@ -340,87 +604,109 @@ class OpenAIService:
             "need_recommendation": True
         }
         """
-        logger.info(f"Generating standard chat response for: {query} - [{cid}]")
-        formatted_history = "### User Chat History ###"
-        for chat in chat_history:
-            formatted_history += f"\n{chat.role}: {chat.content}"
-
-        formatted_input = formatted_history + f"\n\n### User New Input ###\n{query}"
+        logger.info("Generating standard chat response for: %s - [%s]", query, cid)
+        formatted_input = self._general_chat_input(query, chat_history, cid)
 
         try:
-            chat_completion = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": SYS_PROMPT_CHAT},
-                    {
-                        "role": "user",
-                        "content": formatted_input
-                    }
-                ],
+            chat_response = await self.backend.complete(
+                self._messages(formatted_input, SYS_PROMPT_CHAT),
+                model=self.model,
                 response_format={
                     "type": "json_object"
                 },
             )
         except Exception as e:
-            logger.error(f"OpenAI failure: {e} - [{cid}]")
+            logger.error("OpenAI failure: %s - [%s]", e, cid)
             raise HTTPException(status_code=500, detail=str(e))
-        
-        chat_response = chat_completion.choices[0].message.content
+
         chat_response = json.loads(chat_response)
-        logger.info(f"Got chat response: {chat_response} - [{cid}]")
+        logger.info("Got chat response: %s - [%s]", chat_response, cid, extra=PAYLOAD)
         return chat_response
 
+    async def general_chat_stream(self, query: str, chat_history: list[ChatDetails], cid: str):
+        """
+        Streaming general_chat. Yields the "content" of the answer piece by piece as it is
+        generated, then the whole answer as a dict, the same that general_chat returns.
+        """
+        logger.info("Streaming standard chat response for: %s - [%s]", query, cid)
+        formatted_input = self._general_chat_input(query, chat_history, cid)
 
-    def _chat(self, query: str, sys_prompt: str, cid: str, model="gpt-4o-mini"):
-        """Send a request to GPT"""
         try:
-            completion = self.client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": sys_prompt},
-                        {
-                            "role": "user",
-                            "content": query
-                        }
-                    ]
+            stream = self.backend.stream(
+                self._messages(formatted_input, SYS_PROMPT_CHAT),
+                model=self.model,
+                response_format={
+                    "type": "json_object"
+                },
             )
+            extractor = JsonStringFieldExtractor("content")
+            chunks = []
+            async for delta in stream:
+                chunks.append(delta)
+                content = extractor.feed(delta)
+                if content:
+                    yield content
+            chat_response = json.loads("".join(chunks))
         except Exception as e:
-            logger.error(f"OpenAI failure: {e} - [{cid}]")
-            return None
-        return completion.choices[0].message.content
+            logger.error("OpenAI failure: %s - [%s]", e, cid)
+            raise HTTPException(status_code=500, detail=str(e))
 
-    def _verify_traits_json(self, output: str, cid: str):
-        """Verify the JSON provided from GPT and add missing fields"""
-        logger.info(f"Verifying json: {output} - [{cid}]")
+        logger.info("Got chat response: %s - [%s]", chat_response, cid, extra=PAYLOAD)
+        yield chat_response
+
+    async def _chat(self, query: str, sys_prompt: str, cid: str, model=None, response_format=None):
+        """Send a request to GPT, concurrent identical requests share one completion"""
+        model = model or self.model
+        return await self.single_flight.do(
+            self._chat_key(query, sys_prompt, model, response_format),
+            lambda: self._complete(query, sys_prompt, cid, model, response_format)
+        )
+
+    async def _complete(self, query: str, sys_prompt: str, cid: str, model: str, response_format):
         try:
-            start = output.index("{")
-            end = output.index("}")
-            output_json = json.loads(output[start:end+1])
+            return await self.backend.complete(self._messages(query, sys_prompt), model=model,
+                                               response_format=response_format)
         except Exception as e:
-            logger.error(f"JSON decode error: {output} - [{cid}]")
+            logger.error("OpenAI failure: %s - [%s]", e, cid)
             return None
-        for trait in TRAITS:
-            if trait not in output_json:
-                logger.error(f"Missing trait: {trait} - [{cid}]")
-                return None
-        for key in output_json:
-            if key not in TRAITS:
-                logger.error(f"Extra key: {key} - [{cid}]")
-                return None
-            
-        output_json["limit"] = 3
-        output_json["market"] = "US"
-        
-        return output_json
 
-    def _extract_genres(self, output: str, curr_json, cid: str):
-        """Extract genres from GPT response"""
-        logger.info(f"Extracting genres: {output} - [{cid}]")
-        curr_json["genres"] = []
-        for genre in genres:
-            if genre in output:
-                curr_json["genres"].append(genre)
-        if len(curr_json["genres"]) == 0:
-            logger.error(f"No genres found: {output} - [{cid}]")
-            return None
-        return curr_json
\ No newline at end of file
+
+class OpenAIService:
+    """
+    Blocking AsyncOpenAIService for scripts and other sync callers. The async service runs on
+    an event loop of its own in a background thread, each call waits for its result.
+    """
+
+    def __init__(self, token=None, org=None, **kwargs):
+        """Takes the arguments of AsyncOpenAIService"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="openai-service", daemon=True)
+        self._thread.start()
+
+        async def create():
+            return AsyncOpenAIService(token=token, org=org, **kwargs)
+
+        self.service = self._run(create())
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def close(self):
+        """Close the HTTP connections of the service and stop its event loop"""
+        self._run(self.service.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def extract_song_traits(self, query: str, cid: str) -> Optional[Traits]:
+        return self._run(self.service.extract_song_traits(query, cid))
+
+    def analyze_user_preference(self, chat_history: list[ChatDetails], cid: str,
+                                summary: Optional[str] = None) -> str:
+        return self._run(self.service.analyze_user_preference(chat_history, cid, summary=summary))
+
+    def summarize_chat_history(self, summary: Optional[str], chat_history: list[ChatDetails], cid: str) -> Optional[str]:
+        return self._run(self.service.summarize_chat_history(summary, chat_history, cid))
+
+    def general_chat(self, query: str, chat_history: list[ChatDetails], cid: str) -> dict:
+        return self._run(self.service.general_chat(query, chat_history, cid))
@@ -0,0 +1,116 @@
+from typing import List
+
+# Table layout of the chat collections. Indexes are named after their table so several
+# deployments with different collection names can share a database.
+CHAT_INFO_COLUMNS = [
+    ("chat_id", "VARCHAR(36) NOT NULL"),
+    ("user_id", "VARCHAR(36)"),
+    ("user_name", "VARCHAR(255)"),
+    ("agent_id", "VARCHAR(36)"),
+    ("agent_name", "VARCHAR(64)"),
+    ("created_at", "DATETIME"),
+]
+
+# user_id and agent_name are copied from the chat_info row of the message, so a user's
+# messages over all chats are read in order from one index without a JOIN.
+CHAT_DETAILS_COLUMNS = [
+    ("message_id", "VARCHAR(36) NOT NULL"),
+    ("chat_id", "VARCHAR(36)"),
+    ("user_id", "VARCHAR(36)"),
+    ("agent_name", "VARCHAR(64)"),
+    ("role", "VARCHAR(16)"),
+    ("content", "TEXT"),
+    ("created_at", "DATETIME"),
+]
+
+# One rolling summary of a user's messages per agent, covering the messages up to the
+# (watermark_created_at, watermark_message_id) keyset of chat_details. watermark_position is
+# the number of messages it covers before that keyset, messages written behind the watermark
+# later change that number.
+USER_SUMMARIES_COLUMNS = [
+    ("summary_id", "VARCHAR(128) NOT NULL"),
+    ("user_id", "VARCHAR(36)"),
+    ("agent_name", "VARCHAR(64)"),
+    ("summary", "TEXT"),
+    ("watermark_created_at", "DATETIME"),
+    ("watermark_message_id", "VARCHAR(36)"),
+    ("watermark_position", "INTEGER"),
+    ("updated_at", "DATETIME"),
+]
+
+
+def chat_tables(info_collection: str, details_collection: str,
+                summaries_collection: str = "user_summaries") -> List[dict]:
+    """Describe the chat tables: columns, primary key and secondary indexes"""
+    return [
+        {
+            "name": info_collection,
+            "columns": CHAT_INFO_COLUMNS,
+            "primary_key": ["chat_id"],
+            "indexes": {
+                # A user's chats, optionally for one agent, in creation order
+                f"ix_{info_collection}_user_agent": ["user_id", "agent_name", "created_at"],
+            },
+        },
+        {
+            "name": details_collection,
+            "columns": CHAT_DETAILS_COLUMNS,
+            "primary_key": ["message_id"],
+            "indexes": {
+                # The messages of a chat in (created_at, message_id) keyset order. The owner
+                # makes it the better match whenever a chat_id is given with the user_id.
+                f"ix_{details_collection}_chat_user_created": ["chat_id", "user_id", "created_at", "message_id"],
+                # All the messages of a user in the same order, for history without a chat_id
+                f"ix_{details_collection}_user_created": ["user_id", "created_at", "message_id"],
+            },
+        },
+        {
+            "name": summaries_collection,
+            "columns": USER_SUMMARIES_COLUMNS,
+            # Derived from user_id and agent_name, see ChatResource.summary_id
+            "primary_key": ["summary_id"],
+            "indexes": {},
+        },
+    ]
+
+
+def backfill_statements(table, info_collection: str, details_collection: str) -> List[str]:
+    """
+    Statements filling the columns added to existing rows, safe to run repeatedly.
+
+    :param table: Callable returning the qualified name of a collection.
+    """
+    info, details = table(info_collection), table(details_collection)
+    copied = ", ".join(
+        f"{field} = (SELECT i.{field} FROM {info} i WHERE i.chat_id = {details}.chat_id)"
+        for field in ("user_id", "agent_name")
+    )
+    return [f"UPDATE {details} SET {copied} WHERE user_id IS NULL"]
+
+
+def sqlite_schema(info_collection: str, details_collection: str,
+                  summaries_collection: str = "user_summaries") -> List[str]:
+    """DDL creating the chat tables and their indexes in SQLite, safe to run repeatedly"""
+    statements = []
+    for table in chat_tables(info_collection, details_collection, summaries_collection):
+        columns = [f"{name} {column_type}" for name, column_type in table["columns"]]
+        columns.append(f"PRIMARY KEY ({', '.join(table['primary_key'])})")
+        statements.append(f"CREATE TABLE IF NOT EXISTS {table['name']} ({', '.join(columns)})")
+        for index_name, index_columns in table["indexes"].items():
+            statements.append(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {table['name']} ({', '.join(index_columns)})"
+            )
+    return statements
+
+
+def mysql_schema(database: str, info_collection: str, details_collection: str,
+                 summaries_collection: str = "user_summaries") -> List[str]:
+    """DDL creating the chat tables with their indexes in MySQL, safe to run repeatedly"""
+    statements = [f"CREATE DATABASE IF NOT EXISTS {database}"]
+    for table in chat_tables(info_collection, details_collection, summaries_collection):
+        columns = [f"{name} {column_type}" for name, column_type in table["columns"]]
+        columns.append(f"PRIMARY KEY ({', '.join(table['primary_key'])})")
+        for index_name, index_columns in table["indexes"].items():
+            columns.append(f"INDEX {index_name} ({', '.join(index_columns)})")
+        statements.append(f"CREATE TABLE IF NOT EXISTS {database}.{table['name']} ({', '.join(columns)})")
+    return statements
@@ -1,39 +1,113 @@
 from framework.services.service_factory import BaseServiceFactory
 import app.resources.chat_resource as chat_resource
 from framework.services.data_access.MySQLRDBDataService import MySQLRDBDataService
-from app.services.openai import OpenAIService
+from framework.services.data_access.AsyncDataService import AsyncDataService
+from framework.services.data_access.SQLiteDataService import SQLiteDataService
+from app.services.schema import sqlite_schema
+from framework.utils.metrics import register_cache_stats
+from framework.utils.persistent_cache import PersistentCache
+from framework.utils.similarity_cache import SimilarityCache
+from app.services.openai import AsyncOpenAIService, OpenAIService, DEFAULT_MODEL, TRAITS_MODE_COMPLETIONS
 import dotenv, os
 
 dotenv.load_dotenv()
+backend = os.getenv('DB_BACKEND', 'mysql').lower()
+sqlite_path = os.getenv('SQLITE_PATH', ':memory:')
 user = os.getenv('DB_USER')
 password = os.getenv('DB_PASS')
 host = os.getenv('DB_HOST')
-port = int(os.getenv('DB_PORT'))
+port = int(os.getenv('DB_PORT', 3306))
+pool_min_size = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+pool_max_size = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+pool_max_lifetime = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', 10))
+executor_workers = int(os.getenv('DB_EXECUTOR_WORKERS', pool_max_size))
 token = os.getenv('OPENAI_API_KEY')
 org = os.getenv('OPENAI_ORG')
+# Any server speaking the chat completions API, e.g. http://localhost:8100/v1 for benchmarks/llm_server.py
+openai_base_url = os.getenv('OPENAI_BASE_URL') or None
+openai_max_connections = int(os.getenv('OPENAI_MAX_CONNECTIONS', 100))
+openai_max_keepalive = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 20))
+openai_timeout = float(os.getenv('OPENAI_TIMEOUT', 60))
+openai_traits_mode = os.getenv('OPENAI_TRAITS_MODE', TRAITS_MODE_COMPLETIONS)
+openai_model = os.getenv('OPENAI_MODEL', DEFAULT_MODEL)
+traits_cache_path = os.getenv('TRAITS_CACHE_PATH', 'traits_cache.db')
+traits_cache_size = int(os.getenv('TRAITS_CACHE_SIZE', 100000))
+traits_cache_memory_size = int(os.getenv('TRAITS_CACHE_MEMORY_SIZE', 1000))
+traits_cache_ttl = float(os.getenv('TRAITS_CACHE_TTL', 7 * 24 * 3600))
+# Minimum similarity of a paraphrase served cached traits, e.g. 0.9. Empty, the default, only
+# records the similarities seen, see the traits_similarity cache stats
+traits_similarity_threshold = os.getenv('TRAITS_SIMILARITY_THRESHOLD', '')
+traits_similarity_size = int(os.getenv('TRAITS_SIMILARITY_SIZE', 10000))
+# Tokens of chat history sent to the model per endpoint
+context_budgets = {
+    'general_chat': int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', 4000)),
+    'analyze_preference': int(os.getenv('PREFERENCE_CONTEXT_TOKEN_BUDGET', 8000)),
+}
 
 
 class ServiceFactory(BaseServiceFactory):
+    """
+    Services of the app, created once per process on first use and shared by all requests.
+    Call close_services on shutdown to release their connection pools and HTTP clients.
+    """
 
     def __init__(self):
         super().__init__()
 
     @classmethod
-    def get_service(cls, service_name):
+    def create_service(cls, service_name):
 
         if service_name == 'ChatResource':
             result = chat_resource.ChatResource(config=None)
+            for cache in result.cache_stats():
+                register_cache_stats(cache, lambda cache=cache: chat_resource.ChatResource.cache_stats()[cache])
+        elif service_name == 'ChatResourceDataService' and backend == 'sqlite':
+            schema = sqlite_schema(chat_resource.info_collection, chat_resource.details_collection,
+                                   chat_resource.summaries_collection)
+            result = SQLiteDataService(context=dict(path=sqlite_path, schema=schema))
         elif service_name == 'ChatResourceDataService':
-            context = dict(user=user, password=password, host=host, port=port)
+            context = dict(user=user, password=password, host=host, port=port,
+                           pool_min_size=pool_min_size, pool_max_size=pool_max_size,
+                           pool_max_lifetime=pool_max_lifetime, pool_timeout=pool_timeout)
             data_service = MySQLRDBDataService(context=context)
             result = data_service
+        elif service_name == 'AsyncChatResourceDataService':
+            result = AsyncDataService(cls.get_service('ChatResourceDataService'), max_workers=executor_workers)
         elif service_name == 'OpenAI':
-            result = OpenAIService(token=token, org=org)
+            result = OpenAIService(token=token, org=org, max_connections=openai_max_connections,
+                                   max_keepalive_connections=openai_max_keepalive, timeout=openai_timeout,
+                                   traits_mode=openai_traits_mode,
+                                   traits_cache=cls.get_service('TraitsCache'),
+                                   similarity_cache=cls.get_service('TraitsSimilarityCache'),
+                                   context_budgets=context_budgets, base_url=openai_base_url, model=openai_model)
+            register_cache_stats('completions', cls._single_flight_stats(result.service.single_flight))
+        elif service_name == 'AsyncOpenAI':
+            result = AsyncOpenAIService(token=token, org=org, max_connections=openai_max_connections,
+                                        max_keepalive_connections=openai_max_keepalive, timeout=openai_timeout,
+                                        traits_mode=openai_traits_mode,
+                                        traits_cache=cls.get_service('TraitsCache'),
+                                        similarity_cache=cls.get_service('TraitsSimilarityCache'),
+                                        context_budgets=context_budgets, base_url=openai_base_url,
+                                        model=openai_model)
+            register_cache_stats('async_completions', cls._single_flight_stats(result.single_flight))
+        elif service_name == 'TraitsCache':
+            result = PersistentCache(path=traits_cache_path, max_size=traits_cache_size, ttl=traits_cache_ttl,
+                                     memory_size=traits_cache_memory_size)
+            register_cache_stats('traits', result.stats)
+        elif service_name == 'TraitsSimilarityCache':
+            threshold = float(traits_similarity_threshold) if traits_similarity_threshold else None
+            result = SimilarityCache(threshold=threshold, max_size=traits_similarity_size, ttl=traits_cache_ttl)
+            register_cache_stats('traits_similarity', result.stats)
         else:
             result = None
 
         return result
 
-
-
-
+    @staticmethod
+    def _single_flight_stats(single_flight):
+        # A completion shared with a call already in flight counts as a hit
+        def stats():
+            result = single_flight.stats()
+            return dict(hits=result["followers"], misses=result["leaders"])
+        return stats
@@ -0,0 +1,68 @@
+import math
+from typing import List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Messages that no longer fit verbatim are cut to this many characters
+COMPRESSED_CHARS = 200
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens of text for the gpt-4o family. Exact with tiktoken installed, otherwise estimated
+    at four characters per token, which is close for English text.
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def fit_to_budget(lines: List[str], budget: Optional[int]) -> Tuple[List[str], int]:
+    """
+    Keep the most recent lines, the last ones, within a token budget. Recent lines are kept
+    verbatim while they fit, older lines are cut to COMPRESSED_CHARS characters while those
+    fit, and the remaining oldest lines are replaced by a note saying how many were omitted.
+
+    :param budget: Maximum number of tokens of the kept lines, None for no limit.
+    :return: The kept lines, oldest first, and the number of tokens trimmed.
+    """
+    if budget is None:
+        return lines, 0
+
+    kept = []
+    used = 0
+    total = 0
+    compressing = full = False
+    for line in reversed(lines):
+        tokens = count_tokens(line)
+        total += tokens
+        if full:
+            continue
+        if not compressing and used + tokens <= budget:
+            kept.append(line)
+            used += tokens
+            continue
+        compressing = True
+        if len(line) > COMPRESSED_CHARS:
+            line = line[:COMPRESSED_CHARS] + "..."
+            tokens = count_tokens(line)
+        if used + tokens <= budget:
+            kept.append(line)
+            used += tokens
+        else:
+            # Keep the kept lines contiguous, everything older is omitted
+            full = True
+
+    omitted = len(lines) - len(kept)
+    kept.reverse()
+    if omitted:
+        kept.insert(0, f"[{omitted} earlier messages omitted]")
+    return kept, total - used
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+from app.models.chat_details import ChatDetails
+
+
+class _Conversation:
+
+    def __init__(self, user_id: str, agent_name: Optional[str], messages: List[ChatDetails],
+                 window_size: int, expires_at: Optional[float]):
+        self.user_id = user_id
+        self.agent_name = agent_name
+        self.messages = deque(messages, maxlen=window_size)
+        self.expires_at = expires_at
+
+
+class ConversationCache:
+    """
+    In-process window over the most recent messages of each chat, keyed by chat_id.
+
+    A window is seeded from the database the first time a chat is read and is then kept up to
+    date by appending every message written to the chat, so later turns read it without a
+    query. Memory is bounded globally by the total number of cached messages, least recently
+    used chats are evicted first. Entries expire after a time to live, which bounds how stale
+    a window can get when another worker writes to the same chat.
+
+    A write may land while a window is being read from the database, after the read but before
+    the window is seeded. Readers take a version() before reading and pass it to seed(), which
+    drops the window if the chat was written since.
+    """
+
+    def __init__(self, window_size: int = 50, max_messages: int = 100000, ttl: Optional[float] = 600,
+                 max_tracked_writes: int = 10000):
+        """
+        :param window_size: Number of most recent messages kept per chat.
+        :param max_messages: Maximum number of messages cached over all chats. 0 disables the cache.
+        :param ttl: Seconds a window stays valid after it was seeded, None for no expiry.
+        :param max_tracked_writes: Chats whose last write version is remembered. A read that
+            started before the oldest remembered write is not seeded.
+        """
+        self.window_size = window_size
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._conversations = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self.max_tracked_writes = max_tracked_writes
+        self._version = 0
+        # Version of the last write per chat, most recent last, and the newest one forgotten
+        self._writes = OrderedDict()
+        self._forgotten = 0
+        self._stats = {"hits": 0, "misses": 0, "appends": 0, "evictions": 0, "expirations": 0,
+                       "stale_seeds": 0}
+
+    def _drop(self, chat_id: str):
+        conversation = self._conversations.pop(chat_id)
+        self._total -= len(conversation.messages)
+
+    def _evict(self):
+        while self._total > self.max_messages and self._conversations:
+            self._drop(next(iter(self._conversations)))
+            self._stats["evictions"] += 1
+
+    def _written(self, chat_id: str):
+        self._version += 1
+        self._writes[chat_id] = self._version
+        self._writes.move_to_end(chat_id)
+        while len(self._writes) > self.max_tracked_writes:
+            _, self._forgotten = self._writes.popitem(last=False)
+
+    def version(self) -> int:
+        """Take before reading a window from the database, then pass it to seed()"""
+        with self._lock:
+            return self._version
+
+    def get(self, chat_id: str, user_id: str, agent_name: Optional[str] = None) -> Optional[List[ChatDetails]]:
+        """
+        :return: The cached window of the chat, oldest message first, or None if the chat is not
+            cached for this user and agent.
+        """
+        with self._lock:
+            conversation = self._conversations.get(chat_id)
+            if conversation is not None and conversation.expires_at is not None \
+                    and conversation.expires_at <= time.monotonic():
+                self._drop(chat_id)
+                self._stats["expirations"] += 1
+                conversation = None
+            if conversation is None or conversation.user_id != user_id or conversation.agent_name != agent_name:
+                self._stats["misses"] += 1
+                return None
+            self._conversations.move_to_end(chat_id)
+            self._stats["hits"] += 1
+            return list(conversation.messages)
+
+    def seed(self, chat_id: str, user_id: str, agent_name: Optional[str], messages: List[ChatDetails],
+             version: Optional[int] = None):
+        """
+        Cache the window of a chat read from the database, messages are oldest first.
+
+        :param version: The version() taken before the read. The window is not cached if the
+            chat was written since, it may miss that message.
+        """
+        if self.max_messages <= 0:
+            return
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            if version is not None and (version < self._forgotten or self._writes.get(chat_id, 0) > version):
+                self._stats["stale_seeds"] += 1
+                return
+            if chat_id in self._conversations:
+                self._drop(chat_id)
+            conversation = _Conversation(user_id, agent_name, messages, self.window_size, expires_at)
+            self._conversations[chat_id] = conversation
+            self._total += len(conversation.messages)
+            self._evict()
+
+    def append(self, chat_id: str, message: ChatDetails) -> bool:
+        """
+        Add a message just written to a cached chat, dropping its oldest message once the
+        window is full. Chats that are not cached are left alone, they are seeded on next read.
+
+        :return: True if the chat was cached.
+        """
+        with self._lock:
+            self._written(chat_id)
+            conversation = self._conversations.get(chat_id)
+            if conversation is None:
+                return False
+            before = len(conversation.messages)
+            conversation.messages.append(message)
+            self._total += len(conversation.messages) - before
+            self._stats["appends"] += 1
+            self._evict()
+            return True
+
+    def invalidate(self, chat_id: str):
+        with self._lock:
+            self._written(chat_id)
+            if chat_id in self._conversations:
+                self._drop(chat_id)
+
+    def clear(self):
+        with self._lock:
+            self._conversations.clear()
+            self._total = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._stats)
+            result.update(chats=len(self._conversations), messages=self._total, max_messages=self.max_messages)
+        return result
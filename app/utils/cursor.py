@@ -0,0 +1,25 @@
+import base64
+import json
+from datetime import datetime
+from typing import Tuple, Union
+
+
+def encode_cursor(created_at: Union[datetime, str], message_id: str) -> str:
+    """Encode the (created_at, message_id) keyset of a message into an opaque page cursor"""
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat(sep=" ")
+    raw = json.dumps([created_at, message_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a page cursor back into its (created_at, message_id) keyset, raise ValueError if invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, message_id = json.loads(raw)
+        datetime.fromisoformat(created_at)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(message_id, str):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return created_at, message_id
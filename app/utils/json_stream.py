@@ -0,0 +1,79 @@
+import json
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonStringFieldExtractor:
+    """
+    Decodes the value of one top level string field of a JSON object while the object is still
+    being received, e.g. the "content" of a streamed chat completion. feed() returns the part
+    of the value decoded so far that was not returned before.
+    """
+
+    def __init__(self, field: str):
+        self._key = json.dumps(field)
+        self._buffer = ""
+        # Before the value, inside it, or after its closing quote
+        self._state = "search"
+        self._escape = None
+        self._high_surrogate = ""
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> str:
+        if self._state == "done":
+            return ""
+        self._buffer += chunk
+        if self._state == "search" and not self._find_value():
+            return ""
+
+        decoded = []
+        i = 0
+        buffer = self._buffer
+        while i < len(buffer):
+            char = buffer[i]
+            if self._escape is not None:
+                self._escape += char
+                if self._escape[1] == "u":
+                    if len(self._escape) < 6:
+                        i += 1
+                        continue
+                    decoded.append(chr(int(self._escape[2:], 16)))
+                else:
+                    decoded.append(_ESCAPES.get(self._escape[1], self._escape[1]))
+                self._escape = None
+            elif char == "\\":
+                self._escape = char
+            elif char == '"':
+                self._state = "done"
+                break
+            else:
+                decoded.append(char)
+            i += 1
+        self._buffer = ""
+        return self._join(decoded)
+
+    def _find_value(self) -> bool:
+        """Skip the buffer up to the opening quote of the value, if it has been received"""
+        start = self._buffer.find(self._key)
+        if start < 0:
+            return False
+        rest = self._buffer[start + len(self._key):].lstrip()
+        if not rest.startswith(":"):
+            return False
+        rest = rest[1:].lstrip()
+        if not rest.startswith('"'):
+            return False
+        self._buffer = rest[1:]
+        self._state = "value"
+        return True
+
+    def _join(self, decoded: list) -> str:
+        # Characters outside the BMP arrive as two \u escapes, possibly in different chunks
+        text = self._high_surrogate + "".join(decoded)
+        self._high_surrogate = ""
+        if text and "\ud800" <= text[-1] <= "\udbff" and self._state != "done":
+            text, self._high_surrogate = text[:-1], text[-1]
+        return text.encode("utf-16", "surrogatepass").decode("utf-16")
@@ -0,0 +1,182 @@
+"""
+Stand-in for the OpenAI chat completions API, to run and load test the service without a
+network connection or an API key. Answers are canned but valid for every prompt of
+app/services/openai.py, and the same query always gets the same answer. Latency, errors and
+streaming speed are configurable and drawn from a seeded generator.
+
+    python -m benchmarks.llm_server --port 8100 --latency lognormal:0.5:0.4 --error-rate 0.01
+
+then start the service with OPENAI_BASE_URL=http://localhost:8100/v1 and any OPENAI_API_KEY.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.services.openai import (GENRE_PROMPT, SYS_PROMPT_CHAT, SYS_PROMPT_PREFERENCE, SYS_PROMPT_RECOMMENDATION,
+                                 SYS_PROMPT_STRUCTURED_TRAITS, SYS_PROMPT_SUMMARY, TRAITS, genres)
+from app.utils.context_window import count_tokens
+
+
+@dataclass
+class Latency:
+    """
+    Seconds before the first token, parsed from "fixed:SECONDS", "uniform:LOW:HIGH" or
+    "lognormal:MEDIAN:SIGMA". A lognormal has the long tail of real completions.
+    """
+    kind: str = "fixed"
+    first: float = 0.0
+    second: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        kind, *params = spec.split(":")
+        if kind not in ("fixed", "uniform", "lognormal") or len(params) != (1 if kind == "fixed" else 2):
+            raise ValueError(f"Invalid latency: {spec}")
+        return cls(kind, *map(float, params))
+
+    def sample(self, generator: random.Random) -> float:
+        if self.kind == "uniform":
+            return generator.uniform(self.first, self.second)
+        if self.kind == "lognormal":
+            return generator.lognormvariate(math.log(self.first), self.second)
+        return self.first
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+
+
+def _pick_genres(query: str) -> list:
+    # Two to three genres, named in the query when it names some, otherwise derived from it
+    named = [genre for genre in genres if genre in query.lower()]
+    if named:
+        return named[:3]
+    digest = _digest(query)
+    return [genres[(digest >> shift) % len(genres)] for shift in (0, 16, 32)][:2 + digest % 2]
+
+
+def _traits(query: str) -> dict:
+    digest = _digest(query)
+    traits = {trait: None for trait in TRAITS}
+    traits["target_energy"] = round((digest % 100) / 100, 2)
+    traits["target_danceability"] = round(((digest >> 8) % 100) / 100, 2)
+    traits["min_tempo"] = 60 + (digest >> 16) % 80
+    return traits
+
+
+def canned_answer(messages: list, response_format: Optional[dict]) -> str:
+    """Content of the answer to a prompt of OpenAIService"""
+    sys_prompt = messages[0]["content"] if messages else ""
+    query = messages[-1]["content"] if messages else ""
+    if sys_prompt == SYS_PROMPT_STRUCTURED_TRAITS or (response_format or {}).get("type") == "json_schema":
+        return json.dumps(dict(_traits(query), genres=_pick_genres(query)))
+    if sys_prompt == SYS_PROMPT_RECOMMENDATION:
+        return json.dumps(_traits(query))
+    if sys_prompt == GENRE_PROMPT:
+        return ", ".join(_pick_genres(query))
+    if sys_prompt == SYS_PROMPT_CHAT:
+        new_input = query.rsplit("### User New Input ###", 1)[-1].strip()
+        need_recommendation = any(word in new_input.lower() for word in ("recommend", "suggest", "play"))
+        return json.dumps({
+            "content": f"Great question! Here is what I think about \"{new_input[:80]}\". "
+                       f"What else are you listening to these days?",
+            "need_recommendation": need_recommendation
+        })
+    if sys_prompt == SYS_PROMPT_SUMMARY:
+        return f"The user talks about {', '.join(_pick_genres(query))} music."
+    if sys_prompt == SYS_PROMPT_PREFERENCE:
+        return f"You seem to enjoy {' and '.join(_pick_genres(query))}, with energetic and upbeat moods."
+    return "OK"
+
+
+def create_app(latency: Latency = Latency(), error_rate: float = 0.0, error_status: int = 500,
+               chunk_size: int = 8, chunk_delay: float = 0.0, seed: int = 0) -> FastAPI:
+    """
+    :param latency: Delay before the answer, or before the first chunk of a streamed answer.
+    :param error_rate: Fraction of requests answered with error_status instead.
+    :param chunk_size: Characters per chunk of a streamed answer.
+    :param chunk_delay: Seconds between the chunks of a streamed answer.
+    :param seed: Seed of the latencies and errors.
+    """
+    app = FastAPI()
+    generator = random.Random(seed)
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        await asyncio.sleep(latency.sample(generator))
+        if generator.random() < error_rate:
+            return JSONResponse(status_code=error_status,
+                                content={"error": {"message": "Stub error", "type": "server_error", "code": None}})
+
+        messages = body.get("messages", [])
+        content = canned_answer(messages, body.get("response_format"))
+        model = body.get("model", "gpt-4o-mini")
+        completion_id = f"chatcmpl-stub{app.state.requests}"
+        created = int(time.time())
+        prompt_tokens = sum(count_tokens(message.get("content") or "") for message in messages)
+        completion_tokens = count_tokens(content)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        if not body.get("stream"):
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            }
+
+        async def events():
+            for i in range(0, len(content), chunk_size):
+                if i and chunk_delay:
+                    await asyncio.sleep(chunk_delay)
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": content[i:i + chunk_size]},
+                                      "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [], "usage": usage}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in for the OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=Latency.parse, default=Latency(),
+                        help="fixed:SECONDS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=8)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(create_app(args.latency, args.error_rate, args.error_status, args.chunk_size, args.chunk_delay,
+                           args.seed),
+                host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+End to end benchmark of the chat endpoints. The app runs in process on an SQLite database
+seeded with chat history, and the stand-in LLM server of benchmarks/llm_server.py answers
+the completions, so the numbers measure the service itself: routing, data access, prompt
+building and response validation, plus whatever LLM latency is configured.
+
+    python -m benchmarks.run --requests 500 --concurrency 20
+    python -m benchmarks.run --save-baseline
+
+Reports throughput and p50/p95/p99 latency per endpoint and per stage, from the
+Server-Timing header, as the median of --repeat runs. Exits with status 1 when the p50 or p95
+latency of an endpoint is more than --tolerance and --min-delta-ms above
+benchmarks/baseline.json, and with --compare-stages also of a stage. Stage timings include
+waiting for the event loop under concurrency, and p99 is a handful of outliers, so both are
+noisier. Baselines are only comparable on the same machine.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.dependencies import get_async_openai_service, get_chat_resource
+from app.main import app
+from app.resources.chat_resource import ChatResource
+from app.routers.chats import ChatBatchItem
+from app.services.llm_backend import AsyncOpenAIBackend
+from app.services.openai import AsyncOpenAIService
+from app.services.schema import sqlite_schema
+from framework.services.data_access.AsyncDataService import AsyncDataService
+from framework.services.data_access.SQLiteDataService import SQLiteDataService
+from framework.utils.timing import parse_server_timing
+from benchmarks.llm_server import Latency, create_app
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+PERCENTILES = (50, 95, 99)
+# Compared against the baseline, p99 of a few hundred requests is a handful of outliers
+COMPARED_METRICS = ("p50_ms", "p95_ms")
+
+QUERIES = [
+    "I want some chill lo-fi beats to study",
+    "Can you recommend upbeat pop songs for running?",
+    "What do you think about jazz fusion?",
+    "Suggest sad acoustic songs for a rainy day",
+    "Who are the best hip-hop producers?",
+    "Play some energetic rock for the gym",
+]
+
+
+class Fixture:
+    """Seeded database, stand-in LLM and the in process client of one benchmark run"""
+
+    def __init__(self, directory: str, llm_latency: Latency, llm_error_rate: float, seed: int):
+        self.random = random.Random(seed)
+        self.resource = ChatResource(config=None)
+        self.resource.data_service = SQLiteDataService(context=dict(
+            path=os.path.join(directory, "chat.db"),
+            schema=sqlite_schema(self.resource.info_collection, self.resource.details_collection,
+                                 self.resource.summaries_collection)
+        ))
+        self.resource.async_data_service = AsyncDataService(self.resource.data_service, max_workers=10)
+        self.resource.conversation_cache.clear()
+
+        llm = create_app(latency=llm_latency, error_rate=llm_error_rate, seed=seed)
+        backend = AsyncOpenAIBackend(client=AsyncOpenAI(
+            api_key="stub", base_url="http://llm/v1", max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=llm))
+        ))
+        self.openai_service = AsyncOpenAIService(backend=backend, context_budgets={
+            "general_chat": 4000, "analyze_preference": 8000
+        })
+
+        self.chats = []
+        app.dependency_overrides[get_chat_resource] = lambda: self.resource
+        app.dependency_overrides[get_async_openai_service] = lambda: self.openai_service
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://service")
+
+    async def seed(self, users: int, chats_per_user: int, messages_per_chat: int):
+        start = datetime(2024, 1, 1)
+        for user in range(users):
+            user_id = f"user-{user}"
+            for _ in range(chats_per_user):
+                chat_id = str(uuid.uuid4())
+                self.chats.append((user_id, chat_id))
+                batch = [
+                    ChatBatchItem(chat_id=chat_id, role="human" if i % 2 == 0 else "agent",
+                                  content=self.random.choice(QUERIES), user_id=user_id, user_name=user_id,
+                                  agent_id="agent", agent_name="Chat", created_at=start + timedelta(minutes=i))
+                    for i in range(messages_per_chat)
+                ]
+                await self.resource.update_chats(batch)
+
+    async def close(self):
+        app.dependency_overrides.clear()
+        await self.client.aclose()
+        await self.openai_service.close()
+        self.resource.async_data_service.close()
+        SQLiteDataService.close_connections()
+
+
+def _scenarios(fixture: Fixture) -> Dict[str, Callable[[int], dict]]:
+    """Arguments of the i-th request to each endpoint"""
+
+    def chat(i):
+        return fixture.chats[i % len(fixture.chats)]
+
+    def general_chat(i):
+        user_id, chat_id = chat(i)
+        return dict(method="POST", url="/general_chat",
+                    params=dict(user_id=user_id, chat_id=chat_id, query=f"{QUERIES[i % len(QUERIES)]} #{i}"))
+
+    def extract_traits(i):
+        return dict(method="POST", url="/extract_traits", json={"query": f"{QUERIES[i % len(QUERIES)]} #{i}"})
+
+    def chat_history(i):
+        user_id, _ = chat(i)
+        return dict(method="GET", url="/chat_history", params=dict(user_id=user_id, limit=50))
+
+    def update_chat(i):
+        user_id, chat_id = chat(i)
+        return dict(method="POST", url="/update_chat",
+                    json=dict(chat_id=chat_id, role="human", content=QUERIES[i % len(QUERIES)], user_id=user_id,
+                              user_name=user_id, agent_id="agent", agent_name="Chat"))
+
+    def analyze_preference(i):
+        user_id, chat_id = chat(i)
+        return dict(method="POST", url="/analyze_preference", params=dict(user_id=user_id, chat_id=chat_id))
+
+    return {
+        "general_chat": general_chat,
+        "extract_traits": extract_traits,
+        "chat_history": chat_history,
+        "update_chat": update_chat,
+        "analyze_preference": analyze_preference,
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _summary(values: List[float]) -> dict:
+    return {f"p{p}_ms": round(percentile(values, p) * 1000, 3) for p in PERCENTILES}
+
+
+async def run_endpoint(client: httpx.AsyncClient, scenario: Callable[[int], dict], requests: int,
+                       concurrency: int, warmup: int) -> dict:
+    for i in range(warmup):
+        await client.request(**scenario(-1 - i))
+
+    latencies = []
+    stages = {}
+    errors = 0
+    next_request = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in next_request:
+            start = time.perf_counter()
+            response = await client.request(**scenario(i))
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+            for stage, seconds in parse_server_timing(response.headers.get("server-timing", "")).items():
+                # The server side total is the latency minus the transport, already reported
+                if stage != "total":
+                    stages.setdefault(stage, []).append(seconds)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return dict(
+        requests=requests,
+        errors=errors,
+        throughput_rps=round(requests / elapsed, 2) if elapsed else 0.0,
+        latency=_summary(latencies),
+        stages={stage: _summary(values) for stage, values in sorted(stages.items())},
+    )
+
+
+def _median_result(results: List[dict]) -> dict:
+    """Median of every number of the results of repeated runs"""
+    first = results[0]
+    if isinstance(first, dict):
+        return {key: _median_result([result[key] for result in results if key in result]) for key in first}
+    return sorted(results)[len(results) // 2]
+
+
+async def run(endpoints: Optional[List[str]] = None, requests: int = 200, concurrency: int = 10, warmup: int = 5,
+              repeat: int = 3, users: int = 20, chats_per_user: int = 5, messages_per_chat: int = 20,
+              llm_latency: Latency = Latency(), llm_error_rate: float = 0.0, seed: int = 0) -> dict:
+    """Benchmark the endpoints one after the other, repeat times, return the report"""
+    with tempfile.TemporaryDirectory() as directory:
+        fixture = Fixture(directory, llm_latency, llm_error_rate, seed)
+        try:
+            await fixture.seed(users, chats_per_user, messages_per_chat)
+            scenarios = _scenarios(fixture)
+            report = {}
+            for endpoint in endpoints or scenarios:
+                results = [await run_endpoint(fixture.client, scenarios[endpoint], requests, concurrency, warmup)
+                           for _ in range(repeat)]
+                report[endpoint] = _median_result(results)
+            return report
+        finally:
+            await fixture.close()
+
+
+def compare(report: dict, baseline: dict, tolerance: float, min_delta_ms: float = 1.0,
+            stages: bool = False) -> List[str]:
+    """
+    Latencies of the report more than tolerance, a fraction, and min_delta_ms above the
+    baseline. The absolute margin keeps sub-millisecond stages from flagging noise.
+
+    :param stages: Also compare the stages, not only the endpoint latencies.
+    """
+    regressions = []
+    for endpoint, result in report.items():
+        expected = baseline.get(endpoint)
+        if expected is None:
+            continue
+        series = [("total", result["latency"], expected["latency"])]
+        if stages:
+            series += [(stage, values, expected.get("stages", {}).get(stage))
+                       for stage, values in result["stages"].items()]
+        for name, values, expected_values in series:
+            for metric in COMPARED_METRICS:
+                value, limit = values.get(metric), (expected_values or {}).get(metric)
+                if value and limit and value > limit * (1 + tolerance) and value - limit > min_delta_ms:
+                    regressions.append(f"{endpoint} {name} {metric}: {value} ms, baseline {limit} ms")
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':<20} {'stage':<8} {'rps':>9} {'errors':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for endpoint, result in report.items():
+        latency = result["latency"]
+        print(f"{endpoint:<20} {'total':<8} {result['throughput_rps']:>9} {result['errors']:>7} "
+              f"{latency['p50_ms']:>10} {latency['p95_ms']:>10} {latency['p99_ms']:>10}")
+        for stage, values in result["stages"].items():
+            print(f"{'':<20} {stage:<8} {'':>9} {'':>7} "
+                  f"{values['p50_ms']:>10} {values['p95_ms']:>10} {values['p99_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat endpoints against local stand-ins")
+    parser.add_argument("--endpoint", action="append", dest="endpoints",
+                        help="Endpoint to benchmark, repeatable, all by default")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per endpoint, the median is reported")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--chats-per-user", type=int, default=5)
+    parser.add_argument("--messages-per-chat", type=int, default=20)
+    parser.add_argument("--llm-latency", type=Latency.parse, default=Latency(),
+                        help="fixed:SECONDS, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown over the baseline")
+    parser.add_argument("--compare-stages", action="store_true", help="Also fail on slower stages")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Allowed slowdown in milliseconds")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.endpoints, args.requests, args.concurrency, args.warmup, args.repeat, args.users,
+                             args.chats_per_user, args.messages_per_chat, args.llm_latency, args.llm_error_rate,
+                             args.seed))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(report, json.load(f), args.tolerance, args.min_delta_ms, args.compare_stages)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
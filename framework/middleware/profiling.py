@@ -0,0 +1,103 @@
+import asyncio
+import hmac
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+logger = logging.getLogger("uvicorn")
+
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILE_HEADER = "X-Profile"
+
+
+class ProfilingMiddleware:
+    """
+    Runs selected requests under a profiler and stores one profile per request in a local
+    directory, named after the X-Correlation-ID of the request. A request is profiled when it
+    carries the admin token in the X-Profile-Token header, or at random with sample_rate. The
+    response of a profiled request names its profile in the X-Profile header.
+
+    The profile is a pyinstrument call tree of the request's own coroutines, sampled every
+    millisecond, as HTML. It does not see the database calls that run on the executor threads,
+    their wait shows up where the request awaits them. One request is profiled at a time per
+    worker, others are served normally meanwhile.
+    """
+
+    def __init__(self, app, directory: str = "profiles", token: Optional[str] = None, sample_rate: float = 0.0,
+                 max_files: int = 100):
+        """
+        :param directory: Where profiles are stored, created if missing.
+        :param token: Admin token enabling profiling per request, None to only sample.
+        :param sample_rate: Fraction of requests profiled without the token.
+        :param max_files: Profiles kept, the oldest are deleted.
+        """
+        if Profiler is None:
+            raise RuntimeError("Profiling is enabled but pyinstrument is not installed")
+        self.app = app
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self._active = False
+
+    def _selected(self, scope) -> bool:
+        if self.token:
+            for name, value in scope.get("headers", []):
+                if name == PROFILE_TOKEN_HEADER.lower().encode():
+                    return hmac.compare_digest(value, self.token.encode())
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def _profile_name(scope) -> str:
+        cid = next((value.decode("latin-1") for name, value in scope.get("headers", [])
+                    if name == b"x-correlation-id"), "") or "no-cid"
+        # The correlation id comes from the client, only keep characters safe in a file name
+        cid = re.sub(r"[^A-Za-z0-9._-]", "_", cid)[:100]
+        return f"{cid}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active or not self._selected(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        file_name = f"{self._profile_name(scope)}.html"
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (PROFILE_HEADER.lower().encode(), file_name.encode())]
+            await send(message)
+
+        profiler = Profiler(interval=0.001, async_mode="enabled")
+        profiler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            profiler.stop()
+            self._active = False
+            elapsed = time.perf_counter() - start
+            # Writing a profile takes a while, keep it off the event loop
+            await asyncio.to_thread(self._save, profiler, file_name)
+            logger.info("Profiled %s %s in %.3fs: %s", scope.get('method'), scope.get('path'), elapsed, file_name)
+
+    def _save(self, profiler, file_name: str):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, file_name)
+        with open(path, "w") as f:
+            f.write(profiler.output_html())
+
+        profiles = sorted((entry for entry in os.scandir(self.directory)
+                           if entry.is_file() and entry.name.endswith(".html")),
+                          key=lambda entry: entry.stat().st_mtime)
+        for entry in profiles[:max(0, len(profiles) - self.max_files)]:
+            os.remove(entry.path)
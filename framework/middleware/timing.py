@@ -0,0 +1,50 @@
+import time
+from typing import Callable, Optional
+
+from framework.utils.timing import server_timing, start_timings
+
+
+class ServerTimingMiddleware:
+    """
+    Reports where each request spent its time in a Server-Timing header: the stages recorded
+    with framework.utils.timing.timed, e.g. "db" and "llm", and the total. The header of a
+    streamed response only has the stages finished before the first byte was sent, on_response
+    gets all of them.
+    """
+
+    def __init__(self, app, on_request: Optional[Callable[[dict], None]] = None,
+                 on_response: Optional[Callable[[dict, int, dict], None]] = None):
+        """
+        :param on_request: Called with the scope in the context of the request before it is
+            handled, e.g. framework.utils.metrics.track_request.
+        :param on_response: Called with the scope, the status and the stage timings, "total"
+            included, once the response was sent, e.g. framework.utils.metrics.observe_request.
+        """
+        self.app = app
+        self.on_request = on_request
+        self.on_response = on_response
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings = start_timings()
+        status = 500
+        if self.on_request is not None:
+            self.on_request(scope)
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                value = server_timing(dict(timings, total=time.perf_counter() - start))
+                message["headers"] = [*message.get("headers", []), (b"server-timing", value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if self.on_response is not None:
+                self.on_response(scope, status, dict(timings, total=time.perf_counter() - start))
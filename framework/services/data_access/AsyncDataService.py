@@ -0,0 +1,105 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from framework.utils.timing import timed
+from .BaseDataService import DataDataService
+
+
+class AsyncDataService(DataDataService):
+    """
+    Awaitable data service. It wraps a synchronous data service and runs every call on a
+    dedicated, bounded thread pool, so coroutines awaiting a query do not block the event
+    loop and concurrent requests overlap their database waits.
+
+    The executor should not be larger than the connection pool of the wrapped service,
+    otherwise the extra threads only queue up on the pool checkout.
+    """
+
+    def __init__(self, data_service: DataDataService, max_workers: int = 10):
+        """
+        :param data_service: The synchronous data service doing the actual work.
+        :param max_workers: Maximum number of queries in flight at the same time.
+        """
+        super().__init__(data_service.context)
+        self.data_service = data_service
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="data-service")
+
+    async def _run(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # The call sees the context of the caller, e.g. the request its metrics are labeled with
+        context = contextvars.copy_context()
+        with timed("db"):
+            return await loop.run_in_executor(self.executor, functools.partial(context.run, method, *args, **kwargs))
+
+    def _get_connection(self):
+        return self.data_service._get_connection()
+
+    def close(self):
+        """
+        Stop accepting new calls. Calls already queued still run to completion.
+        """
+        self.executor.shutdown(wait=False)
+
+    async def get_data_object(self,
+                              database_name: str,
+                              collection_name: str,
+                              key_field: str,
+                              key_value: str):
+        return await self._run(self.data_service.get_data_object,
+                               database_name, collection_name, key_field, key_value)
+
+    async def get_all_data_object(self,
+                                  database_name: str,
+                                  collection_name: str,
+                                  key_field: str,
+                                  key_value: str,
+                                  **kwargs):
+        return await self._run(self.data_service.get_all_data_object,
+                               database_name, collection_name, key_field, key_value, **kwargs)
+
+    async def get_data_objects(self,
+                               database_name: str,
+                               collection_name: str,
+                               **kwargs):
+        return await self._run(self.data_service.get_data_objects,
+                               database_name, collection_name, **kwargs)
+
+    async def count_data_objects(self,
+                                 database_name: str,
+                                 collection_name: str,
+                                 **kwargs) -> Optional[int]:
+        return await self._run(self.data_service.count_data_objects,
+                               database_name, collection_name, **kwargs)
+
+    async def add_data_object(self,
+                              database_name: str,
+                              collection_name: str,
+                              data: dict):
+        return await self._run(self.data_service.add_data_object,
+                               database_name, collection_name, data)
+
+    async def add_data_objects(self,
+                               database_name: str,
+                               collection_name: str,
+                               data: List[dict],
+                               **kwargs) -> List[Optional[str]]:
+        return await self._run(self.data_service.add_data_objects,
+                               database_name, collection_name, data, **kwargs)
+
+    async def add_data_objects_in_transaction(self,
+                                              database_name: str,
+                                              writes: List[tuple]):
+        return await self._run(self.data_service.add_data_objects_in_transaction,
+                               database_name, writes)
+
+    async def update_data_object(self,
+                                 database_name: str,
+                                 collection_name: str,
+                                 key_field: str,
+                                 key_value: str,
+                                 update_data: dict):
+        return await self._run(self.data_service.update_data_object,
+                               database_name, collection_name, key_field, key_value, update_data)
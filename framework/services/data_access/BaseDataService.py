@@ -20,6 +20,7 @@ class DataDataService(ABC):
     def _get_connection(self):
         """
         Create and return a connection to the database instance for this data services.
+        Implementations may hand out a connection borrowed from a pool instead.
         :return: A connection.
         """
         raise NotImplementedError('Abstract method _get_connection()')
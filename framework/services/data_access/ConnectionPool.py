@@ -0,0 +1,250 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """
+    Raised when no connection could be checked out of a pool before the checkout timeout expired.
+    """
+    pass
+
+
+class _PooledConnection:
+    """
+    Book-keeping wrapper around a raw DB-API connection owned by a ConnectionPool.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class ConnectionPool:
+    """
+    A thread-safe, bounded pool of DB-API connections. The pool does not know anything about
+    a specific database. It is given a factory that opens a new connection and, optionally, a
+    health check that is run on checkout.
+
+    Connections are handed out in LIFO order so that a small number of hot connections are
+    reused and the idle ones age out through max_lifetime recycling.
+    """
+
+    def __init__(self,
+                 creator,
+                 min_size: int = 1,
+                 max_size: int = 10,
+                 max_lifetime: float = 1800.0,
+                 timeout: float = 10.0,
+                 health_check=None,
+                 health_check_idle: float = 5.0):
+        """
+        :param creator: Zero argument callable that opens and returns a new connection.
+        :param min_size: Number of connections opened eagerly and kept around when idle.
+        :param max_size: Hard upper bound of connections open at any time.
+        :param max_lifetime: Seconds after which a connection is closed and replaced on checkout.
+        :param timeout: Seconds a checkout waits for a free connection before PoolTimeoutError.
+        :param health_check: Callable taking a connection, returning False or raising when the
+            connection can no longer be used.
+        :param health_check_idle: Only run the health check on connections that have been idle
+            for at least this many seconds, so hot connections do not pay an extra round trip.
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if min_size < 0 or min_size > max_size:
+            raise ValueError("min_size must be between 0 and max_size")
+
+        self.creator = creator
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.health_check = health_check
+        self.health_check_idle = health_check_idle
+
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition(threading.Lock())
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "created": 0,
+            "closed": 0,
+            "recycled": 0,
+            "failed_health_checks": 0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append(self._open())
+            self._size += 1
+            self._stats["created"] += 1
+
+    def _open(self) -> _PooledConnection:
+        return _PooledConnection(self.creator())
+
+    def _close(self, pooled: _PooledConnection):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+    def _unusable_reason(self, pooled: _PooledConnection):
+        """
+        :return: The stats counter explaining why an idle connection cannot be reused, or None
+            when it can. Runs without the lock held, since the health check is a round trip.
+        """
+        if self.max_lifetime is not None and time.monotonic() - pooled.created_at > self.max_lifetime:
+            return "recycled"
+        idle_for = time.monotonic() - pooled.last_used_at
+        if self.health_check is not None and idle_for >= self.health_check_idle:
+            try:
+                healthy = self.health_check(pooled.connection) is not False
+            except Exception:
+                healthy = False
+            if not healthy:
+                return "failed_health_checks"
+        return None
+
+    def _checkout(self, deadline: float, timeout: float, waited: bool):
+        """
+        Take an idle connection or reserve a slot for a new one, waiting for a release if
+        neither is possible. Must be called with the lock held.
+
+        :return: (idle connection or None when a slot was reserved, whether the caller waited)
+        """
+        while True:
+            if self._closed:
+                raise PoolTimeoutError("Connection pool is closed")
+            if self._idle:
+                return self._idle.pop(), waited
+            if self._size < self.max_size:
+                # Reserve the slot before opening so concurrent callers respect max_size.
+                self._size += 1
+                return None, waited
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._stats["timeouts"] += 1
+                raise PoolTimeoutError(
+                    f"Timed out after {timeout}s waiting for a connection ({self.max_size} in use)"
+                )
+            if not waited:
+                self._stats["waits"] += 1
+                waited = True
+            self._condition.wait(remaining)
+
+    def acquire(self, timeout: float = None) -> _PooledConnection:
+        """
+        Check a connection out of the pool. Idle connections are health checked and recycled
+        if they are too old, a new connection is opened if the pool is below max_size, and
+        otherwise the caller waits for a connection to be released. Health checks, opening and
+        closing happen outside the pool lock, so a slow server does not hold up other callers.
+
+        :param timeout: Overrides the pool checkout timeout for this call.
+        :return: The pooled connection. It must be handed back with release().
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+
+        while True:
+            with self._condition:
+                pooled, waited = self._checkout(deadline, timeout, waited)
+
+            # The connection, or the reserved slot, counts towards _size while it is checked
+            if pooled is None:
+                try:
+                    pooled = self._open()
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self._stats["created"] += 1
+                    self._stats["checkouts"] += 1
+                pooled.last_used_at = time.monotonic()
+                return pooled
+
+            reason = self._unusable_reason(pooled)
+            if reason is None:
+                with self._condition:
+                    self._stats["checkouts"] += 1
+                pooled.last_used_at = time.monotonic()
+                return pooled
+
+            self._close(pooled)
+            with self._condition:
+                self._stats[reason] += 1
+                self._stats["closed"] += 1
+                self._size -= 1
+                self._condition.notify()
+
+    def release(self, pooled: _PooledConnection, discard: bool = False):
+        """
+        Return a connection to the pool.
+
+        :param pooled: A connection previously returned by acquire().
+        :param discard: Close the connection instead of reusing it, e.g. after an error left
+            it in an unknown state.
+        """
+        with self._condition:
+            discard = discard or self._closed
+            if discard:
+                self._size -= 1
+                self._stats["closed"] += 1
+            else:
+                pooled.last_used_at = time.monotonic()
+                self._idle.append(pooled)
+            self._condition.notify()
+        if discard:
+            self._close(pooled)
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """
+        Context manager that borrows a raw connection and always gives it back. The
+        connection is discarded if the block raises, since its state is unknown.
+        """
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled.connection
+        except BaseException:
+            self.release(pooled, discard=True)
+            raise
+        else:
+            self.release(pooled)
+
+    def close(self):
+        """
+        Close all idle connections and refuse further checkouts. Connections currently
+        checked out are closed when they are released.
+        """
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._stats["closed"] += len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self) -> dict:
+        """
+        :return: A snapshot of the pool usage counters and current sizes.
+        """
+        with self._condition:
+            result = dict(self._stats)
+            result.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
+        return result
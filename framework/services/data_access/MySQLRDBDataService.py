@@ -1,18 +1,31 @@
+import threading
+
 import pymysql
-from .BaseDataService import DataDataService
+from .RDBDataService import RDBDataService
+from .ConnectionPool import ConnectionPool
 
 
-class MySQLRDBDataService(DataDataService):
+class MySQLRDBDataService(RDBDataService):
     """
     A generic data service for MySQL databases. The class implement common
     methods from BaseDataService and other methods for MySQL. More complex use cases
     can subclass, reuse methods and extend.
+
+    Connections come from a process wide pool, shared by every instance configured
+    with the same host, port and user. The pool is sized and tuned through optional
+    context keys: pool_min_size, pool_max_size, pool_max_lifetime and pool_timeout.
     """
 
+    _pools = {}
+    _pools_lock = threading.Lock()
+
     def __init__(self, context):
         super().__init__(context)
 
-    def _get_connection(self):
+    def _pool_key(self):
+        return self.context["host"], self.context["port"], self.context["user"]
+
+    def _connect(self):
         connection = pymysql.connect(
             host=self.context["host"],
             port=self.context["port"],
@@ -23,117 +36,76 @@ class MySQLRDBDataService(DataDataService):
         )
         return connection
 
-    def get_data_object(self,
-                        database_name: str,
-                        collection_name: str,
-                        key_field: str,
-                        key_value: str):
-
-        connection = None
-        result = None
-
-        try:
-            sql_statement = f"SELECT * FROM {database_name}.{collection_name} " + \
-                            f"where {key_field}=%s"
-            connection = self._get_connection()
-            cursor = connection.cursor()
-            cursor.execute(sql_statement, [key_value])
-            result = cursor.fetchone()
-        except Exception as e:
-            print(f"Error getting data into {database_name}.{collection_name}: {e}")
-            if connection:
-                connection.close()
-
-        return result
-
-    def get_all_data_object(self,
-                        database_name: str,
-                        collection_name: str,
-                        key_field: str,
-                        key_value: str,
-                        order_field: str = "created_at",
-                        order_direction: str = "ASC"):
-
-        connection = None
-        result = None
-
-        try:
-            sql_statement = f"SELECT * FROM {database_name}.{collection_name} " + \
-                            f"where {key_field}=%s" + \
-                            f"ORDER BY {order_field} {order_direction.upper()}"
-            connection = self._get_connection()
-            cursor = connection.cursor()
-            cursor.execute(sql_statement, [key_value])
-            result = cursor.fetchall()
-        except Exception as e:
-            print(f"Error getting data into {database_name}.{collection_name}: {e}")
-            if connection:
-                connection.close()
-
-        return result
-
-    def add_data_object(self,
-                        database_name: str,
-                        collection_name: str,
-                        data: dict):
-
-        connection = None
-        result = None
-
-        try:
-            columns = ', '.join(data.keys())
-            placeholders = ', '.join(['%s'] * len(data))
-            sql_statement = f"INSERT INTO {database_name}.{collection_name} ({columns}) VALUES ({placeholders})"
-            values = list(data.values())
-
-            connection = self._get_connection()
-            cursor = connection.cursor()
-            cursor.execute(sql_statement, values)
-
-            if 'chat_id' in data:
-                result = data['chat_id']
-            elif 'message_id' in data:
-                result = data['message_id']
-            else:
-                result = cursor.lastrowid
-
-        except Exception as e:
-            print(f"Error inserting data into {database_name}.{collection_name}: {e}")
-            if connection:
-                connection.rollback()
-        finally:
-            if connection:
-                connection.close()
-
-        return result
-
-    def update_data_object(self,
-                           database_name: str,
-                           collection_name: str,
-                           key_field: str,
-                           key_value: str,
-                           update_data: dict):
-
-        connection = None
-        result = None
-
-        try:
-            set_clause = ', '.join([f"{field}=%s" for field in update_data.keys()])
-            sql_statement = f"UPDATE {database_name}.{collection_name} SET {set_clause} WHERE {key_field}=%s"
-            values = list(update_data.values()) + [key_value]
-
-            connection = self._get_connection()
-            cursor = connection.cursor()
-            cursor.execute(sql_statement, values)
-
-            result = cursor.fetchone()
-
-        except Exception as e:
-            print(f"Error updating data in {database_name}.{collection_name}: {e}")
-            if connection:
-                connection.rollback()
-        finally:
-            if connection:
-                connection.close()
-
-        return result
+    @staticmethod
+    def _ping(connection):
+        connection.ping(reconnect=False)
+
+    def _get_pool(self) -> ConnectionPool:
+        key = self._pool_key()
+        pool = MySQLRDBDataService._pools.get(key)
+        if pool is None:
+            with MySQLRDBDataService._pools_lock:
+                pool = MySQLRDBDataService._pools.get(key)
+                if pool is None:
+                    pool = ConnectionPool(
+                        creator=self._connect,
+                        min_size=int(self.context.get("pool_min_size", 1)),
+                        max_size=int(self.context.get("pool_max_size", 10)),
+                        max_lifetime=float(self.context.get("pool_max_lifetime", 1800)),
+                        timeout=float(self.context.get("pool_timeout", 10)),
+                        health_check=self._ping,
+                    )
+                    MySQLRDBDataService._pools[key] = pool
+        return pool
+
+    def _get_connection(self):
+        """
+        Borrow a connection from the pool. Use it as a context manager, the connection is
+        returned to the pool when the block exits and discarded if the block raised.
+        """
+        return self._get_pool().connection()
+
+    def get_pool_stats(self) -> dict:
+        """
+        :return: Usage counters of the connection pool backing this data service.
+        """
+        return self._get_pool().stats()
+
+    def close(self):
+        """
+        Close the pool backing this data service, other pools are left open.
+        """
+        with MySQLRDBDataService._pools_lock:
+            pool = MySQLRDBDataService._pools.pop(self._pool_key(), None)
+        if pool is not None:
+            pool.close()
+
+    @classmethod
+    def close_pools(cls):
+        """
+        Close every pool opened by this process, e.g. on application shutdown.
+        """
+        with cls._pools_lock:
+            for pool in cls._pools.values():
+                pool.close()
+            cls._pools.clear()
+
+    def _ignore_duplicate_clause(self, columns):
+        # A no-op assignment, unlike INSERT IGNORE this does not swallow other errors.
+        return f"ON DUPLICATE KEY UPDATE {columns[0]}={columns[0]}"
+
+    def _explain(self, connection, sql_statement, values):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql_statement}", values)
+            rows = cursor.fetchall()
+        # An "ALL" access without any candidate index reads the whole table. With a candidate
+        # index the optimizer may still prefer ALL on tiny tables, which is not a schema problem.
+        return [
+            {
+                "table": row.get("table"),
+                "full_scan": row.get("type") == "ALL" and not row.get("possible_keys"),
+                "sort": "Using filesort" in (row.get("Extra") or ""),
+                "detail": row,
+            }
+            for row in rows
+        ]
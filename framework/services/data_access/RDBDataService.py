@@ -0,0 +1,448 @@
+from contextlib import closing
+from typing import List, Optional, Tuple
+
+from framework.utils.metrics import observe_query
+from .BaseDataService import DataDataService
+
+
+class RDBDataService(DataDataService):
+    """
+    Generic data service for relational databases reached through a DB-API driver. It
+    implements the BaseDataService methods with plain SQL. Concrete subclasses supply the
+    connection and the few dialect specific pieces: the parameter placeholder, how a table
+    is qualified, how a transaction is started and how a duplicate insert is ignored.
+
+    _get_connection() must return a context manager yielding a connection whose rows are
+    returned as dicts.
+    """
+
+    _placeholder = "%s"
+
+    def __init__(self, context):
+        super().__init__(context)
+
+    def _table(self, database_name: str, collection_name: str) -> str:
+        return f"{database_name}.{collection_name}"
+
+    def _begin(self, connection):
+        connection.begin()
+
+    def _ignore_duplicate_clause(self, columns: List[str]) -> str:
+        raise NotImplementedError('Abstract method _ignore_duplicate_clause()')
+
+    def _insert_statement(self,
+                          database_name: str,
+                          collection_name: str,
+                          columns: List[str],
+                          ignore_duplicate: bool = False,
+                          copy_from: Optional[Tuple[str, str, List[str]]] = None) -> str:
+        """
+        Build a parameterized INSERT for the given columns. With ignore_duplicate, a row that
+        collides with an existing unique key is left untouched instead of raising. With copy_from,
+        see add_data_objects(), the copied columns are selected from the source row and the
+        statement takes the key value as its last parameter.
+        """
+        placeholders = ', '.join([self._placeholder] * len(columns))
+        table = self._table(database_name, collection_name)
+        if copy_from is None:
+            sql_statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        else:
+            source_collection, key_field, copied = copy_from
+            sql_statement = f"INSERT INTO {table} ({', '.join(columns + copied)}) " + \
+                            f"SELECT {placeholders}, {', '.join(['s.' + c for c in copied])} " + \
+                            f"FROM {self._table(database_name, source_collection)} s " + \
+                            f"WHERE s.{key_field}={self._placeholder}"
+        if ignore_duplicate:
+            sql_statement += " " + self._ignore_duplicate_clause(columns)
+        return sql_statement
+
+    @staticmethod
+    def _insert_values(data: dict, copy_from: Optional[Tuple[str, str, List[str]]] = None) -> list:
+        values = list(data.values())
+        if copy_from is not None:
+            values.append(data[copy_from[1]])
+        return values
+
+    @staticmethod
+    def _check_inserted(cursor, count: int, copy_from: Optional[Tuple[str, str, List[str]]]):
+        # An INSERT ... SELECT writes nothing, without raising, when the source row is missing.
+        if copy_from is not None and cursor.rowcount < count:
+            raise ValueError(f"No {copy_from[0]} object to copy {', '.join(copy_from[2])} from")
+
+    def _explain(self, connection, sql_statement: str, values: list) -> List[dict]:
+        raise NotImplementedError('Abstract method _explain()')
+
+    def execute_statement(self, sql_statement: str, values: Optional[list] = None) -> list:
+        """
+        Run a single statement, e.g. DDL or an administrative query, and return its rows.
+        Unlike the data object methods, errors are raised to the caller.
+        """
+        with self._get_connection() as connection:
+            with closing(connection.cursor()) as cursor:
+                cursor.execute(sql_statement, values or [])
+                return list(cursor.fetchall() or [])
+
+    def create_schema(self, statements: List[str]):
+        """
+        Run DDL statements, e.g. CREATE TABLE IF NOT EXISTS, on the database.
+        """
+        for statement in statements:
+            self.execute_statement(statement)
+
+    def explain(self, sql_statement: str, values: Optional[list] = None) -> List[dict]:
+        """
+        Ask the database how it would execute a query.
+
+        :return: One entry per step with the keys "table", "full_scan", True when every row of
+            the table is read because no index can be used, "sort", True when the matching rows
+            are sorted instead of read in index order, and "detail", the raw plan.
+        """
+        with self._get_connection() as connection:
+            return self._explain(connection, sql_statement, values or [])
+
+    @observe_query
+    def get_data_object(self,
+                        database_name: str,
+                        collection_name: str,
+                        key_field: str,
+                        key_value: str):
+
+        result = None
+
+        try:
+            p = self._placeholder
+            sql_statement = f"SELECT * FROM {self._table(database_name, collection_name)} " + \
+                            f"where {key_field}={p}"
+            with self._get_connection() as connection:
+                with closing(connection.cursor()) as cursor:
+                    cursor.execute(sql_statement, [key_value])
+                    result = cursor.fetchone()
+        except Exception as e:
+            print(f"Error getting data into {database_name}.{collection_name}: {e}")
+
+        return result
+
+    @observe_query
+    def get_all_data_object(self,
+                        database_name: str,
+                        collection_name: str,
+                        key_field: str,
+                        key_value: str,
+                        order_field: str = "created_at",
+                        order_direction: str = "ASC",
+                        limit: Optional[int] = None):
+
+        result = None
+
+        try:
+            p = self._placeholder
+            sql_statement = f"SELECT * FROM {self._table(database_name, collection_name)} " + \
+                            f"where {key_field}={p} " + \
+                            f"ORDER BY {order_field} {order_direction.upper()}"
+            values = [key_value]
+            if limit is not None:
+                sql_statement += f" LIMIT {p}"
+                values.append(int(limit))
+            with self._get_connection() as connection:
+                with closing(connection.cursor()) as cursor:
+                    cursor.execute(sql_statement, values)
+                    result = cursor.fetchall()
+        except Exception as e:
+            print(f"Error getting data into {database_name}.{collection_name}: {e}")
+
+        return result
+
+    def _keyset_predicates(self,
+                           order_field: str,
+                           order_direction: str,
+                           tiebreak_field: Optional[str],
+                           after: Optional[tuple],
+                           before: Optional[tuple]) -> Tuple[List[str], list]:
+        p = self._placeholder
+        predicates = []
+        values = []
+        ascending = order_direction.upper() == "ASC"
+        for keyset, forward in ((after, True), (before, False)):
+            if keyset is not None:
+                operator = ">" if forward == ascending else "<"
+                predicates.append(
+                    f"(c.{order_field} {operator} {p} OR "
+                    f"(c.{order_field} = {p} AND c.{tiebreak_field} {operator} {p}))"
+                )
+                values += [keyset[0], keyset[0], keyset[1]]
+        return predicates, values
+
+    def _equality_predicates(self, alias: str, filters: Optional[dict]) -> Tuple[List[str], list]:
+        predicates = []
+        values = []
+        for field, value in (filters or {}).items():
+            if value is not None:
+                predicates.append(f"{alias}.{field}={self._placeholder}")
+                values.append(value)
+        return predicates, values
+
+    @observe_query
+    def get_data_objects(self,
+                         database_name: str,
+                         collection_name: str,
+                         filters: Optional[dict] = None,
+                         order_field: str = "created_at",
+                         order_direction: str = "ASC",
+                         tiebreak_field: Optional[str] = None,
+                         after: Optional[tuple] = None,
+                         before: Optional[tuple] = None,
+                         limit: Optional[int] = None):
+        """
+        Gets the data objects of a collection matching equality filters, ordered by a field.
+
+        The result can be paged with a keyset (seek) on (order_field, tiebreak_field) instead of
+        an OFFSET, so a page does not re-read the rows of the pages before it. A page only costs
+        its own rows when an index starts with filtered fields and continues with
+        (order_field, tiebreak_field). Otherwise every matching row is sorted for each page.
+
+        :param filters: Equality predicates. None values are ignored.
+        :param tiebreak_field: Unique field that makes the ordering total.
+            Required when after or before is given.
+        :param after: (order_field, tiebreak_field) values, only return objects after them.
+        :param before: (order_field, tiebreak_field) values, only return objects before them.
+            The page closest to the keyset is returned, still ordered by order_direction.
+        :param limit: Maximum number of objects to return.
+        :return: The list of matching objects ordered by order_field.
+        """
+        result = None
+
+        try:
+            p = self._placeholder
+            predicates, values = self._equality_predicates("c", filters)
+            keyset_predicates, keyset_values = self._keyset_predicates(
+                order_field, order_direction, tiebreak_field, after, before
+            )
+            predicates += keyset_predicates
+            values += keyset_values
+
+            ascending = order_direction.upper() == "ASC"
+            # Seeking backwards reads the rows closest to the keyset first and flips them after.
+            reverse = before is not None and after is None
+            direction = "ASC" if ascending != reverse else "DESC"
+            order_clause = f"ORDER BY c.{order_field} {direction}"
+            if tiebreak_field:
+                order_clause += f", c.{tiebreak_field} {direction}"
+            where_clause = f"WHERE {' AND '.join(predicates)} " if predicates else ""
+            limit_clause = ""
+            if limit is not None:
+                limit_clause = f" LIMIT {p}"
+                values.append(int(limit))
+
+            sql_statement = f"SELECT c.* FROM {self._table(database_name, collection_name)} c " + \
+                where_clause + order_clause + limit_clause
+            with self._get_connection() as connection:
+                with closing(connection.cursor()) as cursor:
+                    cursor.execute(sql_statement, values)
+                    result = list(cursor.fetchall())
+            if reverse:
+                result.reverse()
+        except Exception as e:
+            print(f"Error getting data from {database_name}.{collection_name}: {e}")
+
+        return result
+
+
+    @observe_query
+    def count_data_objects(self,
+                           database_name: str,
+                           collection_name: str,
+                           filters: Optional[dict] = None,
+                           order_field: str = "created_at",
+                           order_direction: str = "ASC",
+                           tiebreak_field: Optional[str] = None,
+                           after: Optional[tuple] = None,
+                           before: Optional[tuple] = None) -> Optional[int]:
+        """
+        Counts the data objects get_data_objects() returns for the same arguments without a limit.
+        The count reads every matching entry of the index, its cost grows with the result.
+
+        :return: The number of matching objects, None if the query failed.
+        """
+        result = None
+
+        try:
+            predicates, values = self._equality_predicates("c", filters)
+            keyset_predicates, keyset_values = self._keyset_predicates(
+                order_field, order_direction, tiebreak_field, after, before
+            )
+            predicates += keyset_predicates
+            values += keyset_values
+            where_clause = f" WHERE {' AND '.join(predicates)}" if predicates else ""
+            sql_statement = f"SELECT COUNT(*) AS matching FROM {self._table(database_name, collection_name)} c" + \
+                where_clause
+            with self._get_connection() as connection:
+                with closing(connection.cursor()) as cursor:
+                    cursor.execute(sql_statement, values)
+                    row = cursor.fetchone()
+                    result = row["matching"] if row is not None else None
+        except Exception as e:
+            print(f"Error counting data in {database_name}.{collection_name}: {e}")
+
+        return result
+
+    @observe_query
+    def add_data_object(self,
+                        database_name: str,
+                        collection_name: str,
+                        data: dict):
+
+        result = None
+
+        try:
+            sql_statement = self._insert_statement(database_name, collection_name, list(data.keys()))
+            values = list(data.values())
+
+            with self._get_connection() as connection:
+                with closing(connection.cursor()) as cursor:
+                    cursor.execute(sql_statement, values)
+
+                    if 'chat_id' in data:
+                        result = data['chat_id']
+                    elif 'message_id' in data:
+                        result = data['message_id']
+                    else:
+                        result = cursor.lastrowid
+
+        except Exception as e:
+            print(f"Error inserting data into {database_name}.{collection_name}: {e}")
+
+        return result
+
+    @observe_query
+    def add_data_objects(self,
+                         database_name: str,
+                         collection_name: str,
+                         data: List[dict],
+                         ignore_duplicate: bool = False,
+                         chunk_size: int = 500,
+                         copy_from: Optional[Tuple[str, str, List[str]]] = None) -> List[Optional[str]]:
+        """
+        Inserts many data objects into one collection. Objects with the same fields are written
+        together with executemany, chunk_size rows per transaction. If a chunk fails, its rows
+        are retried one by one so that a single bad row does not fail the others.
+
+        :param data: The objects to insert.
+        :param ignore_duplicate: Keep existing objects whose unique key collides, see
+            add_data_objects_in_transaction().
+        :param chunk_size: Maximum number of rows sent in one statement and transaction.
+        :param copy_from: (source_collection, key_field, columns) to take columns from an existing
+            object of another collection instead of from data, in the same statement. The source
+            object is the one whose key_field equals that of the object inserted. An object whose
+            source does not exist is not written and reported as an error.
+        :return: A list aligned with data holding None for each object that was written and
+            the error message for each object that was not.
+        """
+
+        errors = [None] * len(data)
+
+        groups = {}
+        for index, item in enumerate(data):
+            groups.setdefault(tuple(item.keys()), []).append(index)
+
+        for columns, indexes in groups.items():
+            sql_statement = self._insert_statement(database_name, collection_name, list(columns),
+                                                   ignore_duplicate, copy_from)
+            for start in range(0, len(indexes), chunk_size):
+                chunk = indexes[start:start + chunk_size]
+                rows = [self._insert_values(data[index], copy_from) for index in chunk]
+                try:
+                    with self._get_connection() as connection:
+                        self._begin(connection)
+                        try:
+                            with closing(connection.cursor()) as cursor:
+                                cursor.executemany(sql_statement, rows)
+                                self._check_inserted(cursor, len(rows), copy_from)
+                            connection.commit()
+                        except Exception:
+                            connection.rollback()
+                            raise
+                except Exception as e:
+                    if len(chunk) == 1:
+                        errors[chunk[0]] = str(e)
+                        continue
+                    print(f"Error bulk inserting data into {database_name}.{collection_name}, "
+                          f"retrying {len(chunk)} rows one by one: {e}")
+                    for index, row in zip(chunk, rows):
+                        try:
+                            with self._get_connection() as connection:
+                                with closing(connection.cursor()) as cursor:
+                                    cursor.execute(sql_statement, row)
+                                    self._check_inserted(cursor, 1, copy_from)
+                        except Exception as row_error:
+                            errors[index] = str(row_error)
+
+        return errors
+
+    @observe_query
+    def add_data_objects_in_transaction(self,
+                                        database_name: str,
+                                        writes: List[tuple]):
+        """
+        Inserts several data objects on one connection in a single transaction. Either all
+        of them are written or none.
+
+        :param database_name: Name of the database or similar abstraction.
+        :param writes: (collection_name, data, ignore_duplicate) tuples, executed in order. When
+            ignore_duplicate is set, an object whose unique key already exists is kept as is,
+            which makes the write an idempotent "create if missing". A fourth copy_from element,
+            see add_data_objects(), takes columns from an object written earlier in the same
+            transaction or already stored, the transaction fails if there is none.
+        :return: True if the transaction committed, None otherwise.
+        """
+
+        result = None
+
+        try:
+            with self._get_connection() as connection:
+                self._begin(connection)
+                try:
+                    with closing(connection.cursor()) as cursor:
+                        for collection_name, data, ignore_duplicate, *copy_from in writes:
+                            copy_from = copy_from[0] if copy_from else None
+                            sql_statement = self._insert_statement(
+                                database_name, collection_name, list(data.keys()), ignore_duplicate, copy_from
+                            )
+                            cursor.execute(sql_statement, self._insert_values(data, copy_from))
+                            self._check_inserted(cursor, 1, copy_from)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+            result = True
+
+        except Exception as e:
+            print(f"Error inserting data into {database_name}: {e}")
+
+        return result
+
+    @observe_query
+    def update_data_object(self,
+                           database_name: str,
+                           collection_name: str,
+                           key_field: str,
+                           key_value: str,
+                           update_data: dict):
+
+        result = None
+
+        try:
+            p = self._placeholder
+            set_clause = ', '.join([f"{field}={p}" for field in update_data.keys()])
+            sql_statement = f"UPDATE {self._table(database_name, collection_name)} SET {set_clause} WHERE {key_field}={p}"
+            values = list(update_data.values()) + [key_value]
+
+            with self._get_connection() as connection:
+                with closing(connection.cursor()) as cursor:
+                    cursor.execute(sql_statement, values)
+
+                    result = cursor.fetchone()
+
+        except Exception as e:
+            print(f"Error updating data in {database_name}.{collection_name}: {e}")
+
+        return result
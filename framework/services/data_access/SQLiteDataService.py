@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List
+
+from .RDBDataService import RDBDataService
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=" "))
+
+
+def _dict_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteDataService(RDBDataService):
+    """
+    An embedded data service backed by SQLite, with the same interface as MySQLRDBDataService.
+    It is meant for local development, tests and reproducible benchmarks without a MySQL server.
+
+    The context holds the database "path" (a file, or ":memory:" which is the default) and an
+    optional "schema", a list of DDL statements applied when the database is first opened.
+    SQLite has a single database per file, so the database_name argument of every method is
+    accepted but ignored.
+
+    All instances with the same path share one connection per process, serialized by a lock.
+    This also makes an in-memory database visible to every instance.
+    """
+
+    _placeholder = "?"
+    _connections = {}
+    _connections_lock = threading.Lock()
+
+    def __init__(self, context):
+        super().__init__(context)
+
+    def _table(self, database_name: str, collection_name: str) -> str:
+        return collection_name
+
+    def _begin(self, connection):
+        connection.execute("BEGIN")
+
+    def _ignore_duplicate_clause(self, columns: List[str]) -> str:
+        return "ON CONFLICT DO NOTHING"
+
+    def _explain(self, connection, sql_statement, values):
+        rows = connection.execute(f"EXPLAIN QUERY PLAN {sql_statement}", values).fetchall()
+        plan = []
+        for row in rows:
+            detail = row["detail"]
+            if detail.startswith(("SCAN ", "SEARCH ")):
+                # e.g. "SEARCH c USING INDEX ix_chat_details_chat_created (chat_id=?)"
+                # "SCAN t USING COVERING INDEX" still reads the whole index and counts as a scan.
+                plan.append({
+                    "table": detail.split()[1],
+                    "full_scan": detail.startswith("SCAN "),
+                    "sort": False,
+                    "detail": detail,
+                })
+            elif detail.startswith("USE TEMP B-TREE FOR ORDER BY"):
+                # Every matching row is read and sorted before the first one is returned
+                plan.append({"table": None, "full_scan": False, "sort": True, "detail": detail})
+        return plan
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.context.get("path", ":memory:"),
+            check_same_thread=False,
+            isolation_level=None
+        )
+        connection.row_factory = _dict_factory
+        connection.execute("PRAGMA journal_mode=WAL")
+        for statement in self.context.get("schema", []):
+            connection.execute(statement)
+        return connection
+
+    def _get_shared(self):
+        path = self.context.get("path", ":memory:")
+        shared = SQLiteDataService._connections.get(path)
+        if shared is None:
+            with SQLiteDataService._connections_lock:
+                shared = SQLiteDataService._connections.get(path)
+                if shared is None:
+                    shared = (self._connect(), threading.RLock())
+                    SQLiteDataService._connections[path] = shared
+        return shared
+
+    @contextmanager
+    def _get_connection(self):
+        """
+        Borrow the shared connection for the duration of the block.
+        """
+        connection, lock = self._get_shared()
+        with lock:
+            yield connection
+
+    def close(self):
+        """
+        Close the connection backing this data service, other connections are left open.
+        """
+        with SQLiteDataService._connections_lock:
+            shared = SQLiteDataService._connections.pop(self.context.get("path", ":memory:"), None)
+        if shared is not None:
+            connection, lock = shared
+            with lock:
+                connection.close()
+
+    @classmethod
+    def close_connections(cls):
+        """
+        Close every connection opened by this process. In-memory databases are lost.
+        """
+        with cls._connections_lock:
+            for connection, lock in cls._connections.values():
+                with lock:
+                    connection.close()
+            cls._connections.clear()
@@ -3,18 +3,66 @@
 #
 # https://medium.com/javarevisited/service-locator-factory-pattern-7bb9e835b709
 #
+import inspect
+import threading
 from abc import ABC, abstractmethod
 
 
 
 class BaseServiceFactory(ABC):
+    """
+    Service locator holding one instance of each service per process. Services are created on
+    first use by create_service and shared by every caller afterwards, so connection pools and
+    HTTP clients they own are reused across requests. close_services releases them on shutdown.
+    """
 
     def __init__(self):
         pass
 
+    @classmethod
+    def _registry(cls) -> dict:
+        # One registry per concrete factory, not shared through the base class.
+        if "_services" not in cls.__dict__:
+            cls._services = {}
+            cls._services_lock = threading.RLock()
+        return cls._services
+
     @classmethod
     @abstractmethod
-    def get_service(cls, service_name):
+    def create_service(cls, service_name):
+        """
+        :return: A new instance of the service, or None if the name is unknown.
+        """
         raise NotImplementedError()
 
+    @classmethod
+    def get_service(cls, service_name):
+        registry = cls._registry()
+        service = registry.get(service_name)
+        if service is None:
+            # Reentrant, a service may get the services it depends on while being created.
+            with cls._services_lock:
+                service = registry.get(service_name)
+                if service is None:
+                    service = cls.create_service(service_name)
+                    if service is not None:
+                        registry[service_name] = service
+        return service
 
+    @classmethod
+    async def close_services(cls):
+        """
+        Close every service created so far that has a close method, most recent first so that
+        services are closed before the services they depend on. The registry is emptied.
+        """
+        registry = cls._registry()
+        with cls._services_lock:
+            services = list(registry.values())
+            registry.clear()
+        for service in reversed(services):
+            close = getattr(service, "close", None)
+            if close is None:
+                continue
+            result = close()
+            if inspect.isawaitable(result):
+                await result
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """
+    A thread-safe in-process cache bounded by entry count, with least recently used eviction
+    and an optional time to live per entry. It keeps hit, miss, eviction and expiration
+    counters so the cache can be sized from production numbers.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        """
+        :param max_size: Maximum number of entries. 0 disables the cache.
+        :param ttl: Seconds an entry stays valid after it was set, None for no expiry.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            if entry is not self._MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+            return default
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether a live entry exists, without touching the counters or the LRU order"""
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            return entry is not self._MISSING and (entry[1] is None or entry[1] > time.monotonic())
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        :param ttl: Overrides the cache time to live for this entry.
+        """
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, *keys: Hashable):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, self._MISSING) is not self._MISSING:
+                    self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._stats)
+            result.update(size=len(self._entries), max_size=self.max_size)
+        lookups = result["hits"] + result["misses"]
+        result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+        return result
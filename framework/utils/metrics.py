@@ -0,0 +1,142 @@
+import functools
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Metrics of this service only, without the default process and platform collectors
+REGISTRY = CollectorRegistry()
+
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_duration_seconds", "Time to answer a request, streamed responses until the last byte",
+    ["endpoint", "method", "status"], registry=REGISTRY
+)
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_duration_seconds", "Time a request spent in a stage, see framework.utils.timing",
+    ["endpoint", "stage"], registry=REGISTRY
+)
+DB_QUERY_SECONDS = Histogram(
+    "chatbot_db_query_duration_seconds", "Time of a data service call, connection checkout included",
+    ["endpoint", "backend", "operation"], registry=REGISTRY,
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0)
+)
+LLM_COMPLETION_SECONDS = Histogram(
+    "chatbot_llm_completion_duration_seconds", "Time of a completion request to the LLM backend",
+    ["model", "outcome"], registry=REGISTRY,
+    buckets=(.1, .25, .5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 60.0)
+)
+LLM_TOKENS = Counter(
+    "chatbot_llm_tokens", "Tokens of completions, as reported by the LLM backend",
+    ["model", "kind"], registry=REGISTRY
+)
+LLM_RETRIES = Counter(
+    "chatbot_llm_retries", "Completions sent again because the previous answer was unusable",
+    ["operation"], registry=REGISTRY
+)
+
+UNMATCHED_ENDPOINT = "unmatched"
+# Endpoint label of the data service calls made outside of a request, e.g. by migrations
+BACKGROUND_ENDPOINT = "background"
+
+# Scope of the request being served. Routing adds the route to it once the request matched one.
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+
+def _endpoint(scope: dict) -> str:
+    # The route template, not the path, keeps the number of label values bounded
+    return getattr(scope.get("route"), "path", UNMATCHED_ENDPOINT)
+
+
+def track_request(scope: dict):
+    """Label the data service calls of the current request with its endpoint, see observe_query"""
+    _request_scope.set(scope)
+
+
+def observe_request(scope: dict, status: int, timings: dict):
+    """Record a finished request, timings are its stage timings with the "total" stage"""
+    endpoint = _endpoint(scope)
+    timings = dict(timings)
+    total = timings.pop("total", 0.0)
+    REQUEST_SECONDS.labels(endpoint, scope.get("method", ""), str(status)).observe(total)
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(endpoint, stage).observe(seconds)
+
+
+def observe_query(method: Callable) -> Callable:
+    """
+    Decorator recording the duration of a data service method in DB_QUERY_SECONDS, labeled
+    with the endpoint of the request tracked by track_request in the calling context.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            scope = _request_scope.get()
+            endpoint = _endpoint(scope) if scope is not None else BACKGROUND_ENDPOINT
+            DB_QUERY_SECONDS.labels(endpoint, type(self).__name__, method.__name__).observe(
+                time.perf_counter() - start
+            )
+
+    return wrapper
+
+
+def observe_completion(model: str, outcome: str, seconds: float, usage=None):
+    """Record a completion, usage is the usage of the response if the backend reported it"""
+    LLM_COMPLETION_SECONDS.labels(model, outcome).observe(seconds)
+    if usage is not None:
+        LLM_TOKENS.labels(model, "prompt").inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels(model, "completion").inc(usage.completion_tokens or 0)
+
+
+class _CacheStatsCollector:
+    """
+    Hits, misses and size of the caches, read from their stats() when scraped, so lookups do
+    not pay for the metrics.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], dict]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, stats: Callable[[], dict]):
+        with self._lock:
+            self._sources[name] = stats
+
+    def collect(self):
+        lookups = CounterMetricFamily("chatbot_cache_lookups", "Cache lookups by result", labels=["cache", "result"])
+        size = GaugeMetricFamily("chatbot_cache_size", "Entries in the cache", labels=["cache"])
+        with self._lock:
+            sources = dict(self._sources)
+        for name, stats in sorted(sources.items()):
+            result = stats()
+            # Tiered caches count their hits per tier, e.g. memory_hits and disk_hits
+            hits = sum(value for key, value in result.items() if key == "hits" or key.endswith("_hits"))
+            lookups.add_metric([name, "hit"], hits)
+            lookups.add_metric([name, "miss"], result.get("misses", 0))
+            if result.get("size") is not None:
+                size.add_metric([name], result["size"])
+        yield lookups
+        yield size
+
+
+_cache_stats = _CacheStatsCollector()
+REGISTRY.register(_cache_stats)
+
+
+def register_cache_stats(name: str, stats: Callable[[], dict]):
+    """
+    Expose a cache in chatbot_cache_lookups_total and chatbot_cache_size. stats returns a dict
+    with "hits" or "*_hits", "misses" and optionally "size". A name registered again is replaced.
+    """
+    _cache_stats.register(name, stats)
+
+
+def latest(registry: Optional[CollectorRegistry] = None) -> tuple:
+    """Body and content type of a scrape"""
+    return generate_latest(registry or REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,173 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from framework.utils.cache import LRUCache
+
+_MISSING = object()
+
+
+class PersistentCache:
+    """
+    A two tier cache for JSON serializable values: an in-process LRUCache in front of a SQLite
+    table on local disk, so entries survive restarts and are shared by the workers of a host.
+
+    Both tiers are bounded by entry count. The disk tier evicts the least recently read entries
+    and entries expire in both tiers after the same time to live. Reads of disk entries are
+    recorded in batches, and the disk tier is counted in process: once the count passes
+    max_size, the table is counted again and trimmed a tenth below max_size, so other workers
+    writing to the same file let it grow past max_size by at most one trim per worker.
+    """
+
+    # Disk reads recorded in memory before their accessed_at is written
+    access_batch_size = 100
+
+    def __init__(self, path: str, max_size: int = 10000, ttl: Optional[float] = None, memory_size: int = 1000):
+        """
+        :param path: SQLite database file, ":memory:" keeps the disk tier in memory.
+        :param max_size: Maximum number of entries on disk. 0 disables the cache.
+        :param ttl: Seconds an entry stays valid after it was set, None for no expiry.
+        :param memory_size: Maximum number of entries in the in-process tier.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.memory = LRUCache(max_size=memory_size if max_size > 0 else 0, ttl=ttl)
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "expirations": 0, "evictions": 0}
+        self._accessed = {}
+        self._reads = 0
+        self._size = 0
+        self._connection = None
+        if max_size > 0:
+            self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at)"
+            )
+            self._size = self._count()
+
+    def _count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+    @contextmanager
+    def _transaction(self):
+        """Commit the statements together, under the lock"""
+        self._connection.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def _flush_accessed(self):
+        """Write the recorded reads, under the lock"""
+        if self._accessed:
+            self._connection.executemany("UPDATE cache_entries SET accessed_at = ? WHERE key = ?",
+                                         [(accessed_at, key) for key, accessed_at in self._accessed.items()])
+            self._accessed.clear()
+        self._reads = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            with self._lock:
+                self._stats["memory_hits"] += 1
+            return value
+
+        with self._lock:
+            if self._connection is None:
+                self._stats["misses"] += 1
+                return default
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self._size -= self._connection.execute("DELETE FROM cache_entries WHERE key = ?", (key,)).rowcount
+                self._accessed.pop(key, None)
+                self._stats["expirations"] += 1
+                row = None
+            if row is None:
+                self._stats["misses"] += 1
+                return default
+            self._accessed[key] = now
+            self._reads += 1
+            if self._reads >= self.access_batch_size:
+                with self._transaction():
+                    self._flush_accessed()
+            self._stats["disk_hits"] += 1
+
+        value, expires_at = json.loads(row[0]), row[1]
+        self.memory.set(key, value, ttl=None if expires_at is None else expires_at - now)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """
+        :param ttl: Overrides the cache time to live for this entry.
+        """
+        if self._connection is None:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        row = (json.dumps(value), None if ttl is None else now + ttl, now, key)
+        with self._lock, self._transaction():
+            self._accessed.pop(key, None)
+            replaced = self._connection.execute(
+                "UPDATE cache_entries SET value = ?, expires_at = ?, accessed_at = ? WHERE key = ?", row
+            ).rowcount
+            if not replaced:
+                self._connection.execute(
+                    "INSERT INTO cache_entries (value, expires_at, accessed_at, key) VALUES (?, ?, ?, ?)", row
+                )
+                self._size += 1
+            self._stats["sets"] += 1
+            if self._size > self.max_size:
+                self._flush_accessed()
+                self._size = self._count()
+                excess = self._size - (self.max_size - self.max_size // 10)
+                if excess > 0:
+                    evicted = self._connection.execute(
+                        "DELETE FROM cache_entries WHERE key IN "
+                        "(SELECT key FROM cache_entries ORDER BY accessed_at LIMIT ?)", (excess,)
+                    ).rowcount
+                    self._size -= evicted
+                    self._stats["evictions"] += evicted
+        self.memory.set(key, value, ttl=ttl)
+
+    def clear(self):
+        self.memory.clear()
+        with self._lock:
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM cache_entries")
+                self._accessed.clear()
+                self._reads = 0
+                self._size = 0
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                with self._transaction():
+                    self._flush_accessed()
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._stats)
+            size = 0
+            if self._connection is not None:
+                size = self._count()
+        result.update(size=size, max_size=self.max_size, memory_size=len(self.memory))
+        hits = result["memory_hits"] + result["disk_hits"]
+        lookups = hits + result["misses"]
+        result["hit_rate"] = hits / lookups if lookups else 0.0
+        return result
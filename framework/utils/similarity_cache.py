@@ -0,0 +1,181 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional, Tuple
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+_STOP_WORDS = frozenset(
+    "a an and are as at be for from i i'm im in is it me my of on or please some something songs song "
+    "music that the to track tracks with want like give play".split()
+)
+
+
+def _features(text: str) -> set:
+    """Stemmed words of the text and the character 4-grams of each word"""
+    features = set()
+    for word in re.findall(r"[a-z0-9']+", text.lower()):
+        if word in _STOP_WORDS:
+            continue
+        for suffix in ("ing", "es", "s"):
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        features.add(word)
+        padded = f"#{word}#"
+        features.update(padded[i:i + 4] for i in range(len(padded) - 3))
+    return features
+
+
+class SimilarityCache:
+    """
+    Near duplicate lookup for short texts. Texts are reduced to MinHash sketches of their words
+    and word 4-grams, candidates are found with locality sensitive hashing on bands of the
+    sketch, and the stored value of the most similar candidate is returned when its estimated
+    Jaccard similarity reaches the threshold. Everything is computed locally.
+
+    Every lookup records the best similarity it found, in a histogram and as the number of
+    lookups that would have hit at each probe threshold, so the threshold can be tuned from
+    real traffic. With threshold None, the default, the cache only records, it never returns a
+    value. Only candidates sharing a band are compared, so similarities below about 0.3 are
+    undercounted. Texts added under one namespace are only found by lookups in the same one.
+    """
+
+    def __init__(self,
+                 threshold: Optional[float] = None,
+                 num_perm: int = 64,
+                 bands: int = 32,
+                 max_size: int = 10000,
+                 ttl: Optional[float] = None,
+                 probe_thresholds: Iterable[float] = (0.5, 0.6, 0.7, 0.8, 0.9)):
+        """
+        :param threshold: Minimum estimated Jaccard similarity of a hit, None to only record.
+        :param num_perm: Number of hash functions of a sketch.
+        :param bands: Number of LSH bands, must divide num_perm. More bands find less similar candidates.
+        :param max_size: Maximum number of entries, least recently used are evicted.
+        :param ttl: Seconds an entry stays valid after it was added, None for no expiry.
+        :param probe_thresholds: Thresholds reported in the would_hit statistics.
+        """
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.max_size = max_size
+        self.ttl = ttl
+        self.probe_thresholds = tuple(probe_thresholds)
+        generator = random.Random(0)
+        self._permutations = [
+            (generator.randrange(1, _MERSENNE_PRIME), generator.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._histogram = [0] * 10
+        self._would_hit = {probe: 0 for probe in self.probe_thresholds}
+
+    def _sketch(self, text: str) -> Optional[Tuple[int, ...]]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+            for feature in _features(text)
+        ]
+        if not hashes:
+            return None
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._permutations)
+
+    def _band_keys(self, sketch: Tuple[int, ...], namespace: str) -> List[tuple]:
+        rows = self.num_perm // self.bands
+        return [(namespace, band, sketch[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def _drop(self, entry_id: int):
+        sketch, _, _, namespace = self._entries.pop(entry_id)
+        for band_key in self._band_keys(sketch, namespace):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _similarity(self, first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        return sum(1 for a, b in zip(first, second) if a == b) / self.num_perm
+
+    def _record(self, similarity: float):
+        self._histogram[min(int(similarity * 10), 9)] += 1
+        for probe in self.probe_thresholds:
+            if similarity >= probe:
+                self._would_hit[probe] += 1
+
+    def get(self, text: str, default: Any = None, namespace: str = "") -> Any:
+        sketch = self._sketch(text)
+        with self._lock:
+            best_id, best_similarity = None, 0.0
+            if sketch is not None:
+                now = time.monotonic()
+                candidates = set()
+                for band_key in self._band_keys(sketch, namespace):
+                    candidates.update(self._buckets.get(band_key, ()))
+                for entry_id in candidates:
+                    candidate, _, expires_at, _ = self._entries[entry_id]
+                    if expires_at is not None and expires_at <= now:
+                        self._drop(entry_id)
+                        continue
+                    similarity = self._similarity(sketch, candidate)
+                    if similarity > best_similarity:
+                        best_id, best_similarity = entry_id, similarity
+            self._record(best_similarity)
+
+            if best_id is None or self.threshold is None or best_similarity < self.threshold:
+                self._stats["misses"] += 1
+                return default
+            self._entries.move_to_end(best_id)
+            self._stats["hits"] += 1
+            return self._entries[best_id][1]
+
+    def add(self, text: str, value: Any, namespace: str = ""):
+        if self.max_size <= 0:
+            return
+        sketch = self._sketch(text)
+        if sketch is None:
+            return
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (sketch, value, expires_at, namespace)
+            for band_key in self._band_keys(sketch, namespace):
+                self._buckets.setdefault(band_key, set()).add(entry_id)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def similarity(self, first: str, second: str) -> float:
+        """Estimated Jaccard similarity of two texts, as used for lookups"""
+        first_sketch, second_sketch = self._sketch(first), self._sketch(second)
+        if first_sketch is None or second_sketch is None:
+            return 0.0
+        return self._similarity(first_sketch, second_sketch)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._stats)
+            result.update(
+                size=len(self._entries),
+                max_size=self.max_size,
+                threshold=self.threshold,
+                best_similarity_histogram={f"{i / 10:.1f}-{(i + 1) / 10:.1f}": n for i, n in enumerate(self._histogram)},
+                would_hit=dict(self._would_hit)
+            )
+        lookups = result["hits"] + result["misses"]
+        result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+        return result
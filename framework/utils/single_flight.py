@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent calls with the same key on one event loop: the first caller (the leader)
+    runs the coroutine, callers arriving while it runs (followers) wait for it and share its
+    result or exception. Nothing is cached, the next call after it finishes runs it again.
+
+    The leader's coroutine runs as its own task, so a caller that is cancelled, e.g. because its
+    client went away, does not cancel the call for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+
+            def forget(done_task):
+                if self._calls.get(key) is done_task:
+                    del self._calls[key]
+
+            task.add_done_callback(forget)
+            self._stats["leaders"] += 1
+        else:
+            self._stats["followers"] += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        result = dict(self._stats, in_flight=len(self._calls))
+        calls = result["leaders"] + result["followers"]
+        result["coalesced_rate"] = result["followers"] / calls if calls else 0.0
+        return result
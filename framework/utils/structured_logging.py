@@ -0,0 +1,192 @@
+import copy
+import json
+import logging
+import queue
+import random
+import reprlib
+from collections import deque
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# Pass as extra= to sample a log call with LOG_SAMPLE_RATES, e.g. "payload=0.1"
+REQUEST = {"category": "request"}
+PAYLOAD = {"category": "payload"}
+
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class _BoundedRepr(reprlib.Repr):
+    """repr that stops after a few elements and characters, whatever the size of the value"""
+
+    def __init__(self, max_length: int):
+        super().__init__()
+        self.maxlevel = 3
+        self.maxlist = self.maxtuple = self.maxset = self.maxfrozenset = self.maxdeque = self.maxarray = 20
+        self.maxdict = 50
+        self.maxstring = self.maxlong = self.maxother = max_length
+
+    def repr_instance(self, obj, level):
+        # reprlib only cuts the full repr of other objects, their attributes are bounded instead
+        fields = getattr(obj, "__dict__", None)
+        if not isinstance(fields, dict) or not fields:
+            return super().repr_instance(obj, level)
+        if level <= 0:
+            return f"{type(obj).__name__}(...)"
+        items = [f"{key}={self.repr1(value, level - 1)}" for key, value in islice(fields.items(), self.maxdict)]
+        if len(fields) > self.maxdict:
+            items.append("...")
+        return f"{type(obj).__name__}({', '.join(items)})"
+
+
+# Arguments logged through the bounded repr, %s shows them as the repr of their elements too
+_CONTAINERS = (list, tuple, dict, set, frozenset, deque)
+
+
+def truncate(value, max_length: int, bounded_repr: Optional[reprlib.Repr] = None):
+    """
+    A log argument cut to about max_length characters. Numbers are kept as they are, strings
+    are sliced, containers are replaced by a bounded repr of a few of their elements, so the
+    cost does not grow with their size, and anything else by its str, sliced.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, _CONTAINERS):
+        value = (bounded_repr or _BoundedRepr(max_length)).repr(value)
+    elif not isinstance(value, str):
+        value = str(value)
+    if len(value) > max_length:
+        value = f"{value[:max_length]}...[{len(value) - max_length} more chars]"
+    return value
+
+
+class TruncatingQueueHandler(QueueHandler):
+    """
+    Hands records to a QueueListener without formatting them: the arguments are only cut to
+    max_length, the message is built and written by the listener thread. When the queue is
+    full the record is dropped instead of blocking the request.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_length: int = 1000):
+        super().__init__(log_queue)
+        self.max_length = max_length
+        self.dropped = 0
+        self._repr = _BoundedRepr(max_length)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if isinstance(record.args, dict):
+            record.args = {key: truncate(value, self.max_length, self._repr) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(truncate(arg, self.max_length, self._repr) for arg in record.args)
+        if record.exc_info:
+            # Tracebacks reference the frames of the request, render them before handing over
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps the given fraction of the records of each category, the "category" of their extra.
+    Warnings and errors, and records of other categories, are always kept.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(getattr(record, "category", None))
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the fields passed as extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Sample rates per category from "category=rate,category=rate" """
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        category, rate = item.split("=")
+        rates[category.strip()] = float(rate)
+    return rates
+
+
+class BackgroundLogging:
+    """
+    Moves the handlers of a logger, e.g. the stream handler uvicorn sets up, to a background
+    thread. The logger gets a TruncatingQueueHandler in their place, so a log call only cuts
+    its arguments and enqueues the record, while formatting and I/O happen on the thread.
+    """
+
+    def __init__(self, logger_name: str = "uvicorn", json_format: bool = False, max_length: int = 1000,
+                 sample_rates: Optional[Dict[str, float]] = None, queue_size: int = 10000):
+        """
+        :param json_format: Write JSON lines instead of the handlers' own format.
+        :param max_length: Characters kept of each log argument.
+        :param sample_rates: Fraction of the records kept per category, see SamplingFilter.
+        :param queue_size: Records waiting to be written before new ones are dropped.
+        """
+        self.logger = logging.getLogger(logger_name)
+        self.json_format = json_format
+        self.max_length = max_length
+        self.sample_rates = sample_rates
+        self.queue_size = queue_size
+        self.handler = None
+        self._handlers = []
+        self._formatters = []
+        self._listener = None
+
+    def start(self):
+        if self._listener is not None:
+            return
+        self._handlers = list(self.logger.handlers)
+        handlers = self._handlers or [logging.StreamHandler()]
+        self._formatters = [handler.formatter for handler in self._handlers]
+        if self.json_format:
+            for handler in handlers:
+                handler.setFormatter(JsonFormatter())
+
+        self.handler = TruncatingQueueHandler(queue.Queue(self.queue_size), self.max_length)
+        if self.sample_rates:
+            self.handler.addFilter(SamplingFilter(self.sample_rates))
+        for handler in self._handlers:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self.handler)
+        self._listener = QueueListener(self.handler.queue, *handlers, respect_handler_level=True)
+        self._listener.start()
+
+    def stop(self):
+        """Write the records still queued and give the handlers back to the logger"""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        self._listener = None
+        self.logger.removeHandler(self.handler)
+        for handler, formatter in zip(self._handlers, self._formatters):
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
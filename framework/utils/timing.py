@@ -0,0 +1,55 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Seconds spent per stage by the current request, None outside of a timed request. Stages may
+# nest: "db" and "llm" measure resources, router steps like "history" measure what they await.
+_timings: ContextVar[Optional[dict]] = ContextVar("stage_timings", default=None)
+
+
+def start_timings() -> dict:
+    """
+    Start recording the stages of the current request. Tasks started by the request share the
+    recording, so concurrent spans of the same stage are added up and may exceed the wall time.
+    """
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def stage_timings() -> dict:
+    """Seconds spent per stage by the current request so far"""
+    return dict(_timings.get() or {})
+
+
+def record(stage: str, seconds: float):
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """Add the time spent in the block to the stage, a no-op outside of a timed request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def server_timing(timings: dict) -> str:
+    """Server-Timing header value of stage timings, in milliseconds"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings.items())
+
+
+def parse_server_timing(value: str) -> dict:
+    """Seconds per stage of a Server-Timing header value"""
+    timings = {}
+    for metric in filter(None, (part.strip() for part in value.split(","))):
+        name, *params = (param.strip() for param in metric.split(";"))
+        for param in params:
+            if param.startswith("dur="):
+                timings[name] = float(param[4:]) / 1000
+    return timings
@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from framework.services.data_access.AsyncDataService import AsyncDataService
+
+
+class SlowDataService:
+
+    def __init__(self):
+        self.context = {}
+
+    def get_data_object(self, database_name, collection_name, key_field, key_value):
+        time.sleep(0.2)
+        return {key_field: key_value}
+
+
+def test_calls_overlap_without_blocking_the_loop():
+    service = AsyncDataService(SlowDataService(), max_workers=4)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        start = time.monotonic()
+        results = await asyncio.gather(*[
+            service.get_data_object("db", "chat_info", "chat_id", str(i)) for i in range(4)
+        ])
+        elapsed = time.monotonic() - start
+        ticker.cancel()
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(run())
+    service.close()
+
+    assert results == [{"chat_id": str(i)} for i in range(4)]
+    assert elapsed < 0.6
+    assert ticks > 5
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import threading
+
+from framework.utils.persistent_cache import PersistentCache
+from framework.utils.similarity_cache import SimilarityCache
+from app.services.openai import OpenAIService, SYS_PROMPT_RECOMMENDATION, TRAITS, TRAITS_MODE_STRUCTURED
+
+
+def test_extract_song_traits(mock_openai_service):
+    async def handler(request):
+        messages = json.loads(request.content)["messages"]
+        if messages[0]["content"] == SYS_PROMPT_RECOMMENDATION:
+            return json.dumps({trait: None for trait in TRAITS})
+        return "jazz and soul"
+
+    traits = asyncio.run(mock_openai_service(handler).extract_song_traits("late night jazz", cid=None))
+
+    assert traits["genres"] == ["jazz", "soul"]
+    assert traits["limit"] == 3
+
+
+def test_general_chat_calls_run_concurrently(mock_openai_service):
+    in_flight = []
+    peak = []
+
+    async def handler(request):
+        in_flight.append(1)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.05)
+        in_flight.pop()
+        return '{"content": "hi", "need_recommendation": false}'
+
+    async def run():
+        openai_service = mock_openai_service(handler)
+        return await asyncio.gather(*[openai_service.general_chat("hi", [], cid=None) for _ in range(5)])
+
+    answers = asyncio.run(run())
+
+    assert all(answer["content"] == "hi" for answer in answers)
+    assert max(peak) == 5
+
+
+def test_extract_song_traits_retries_only_the_failed_completion(mock_openai_service):
+    calls = {"traits": 0, "genres": 0}
+    in_flight = []
+    peak = []
+
+    async def handler(request):
+        in_flight.append(1)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.02)
+        in_flight.pop()
+        if json.loads(request.content)["messages"][0]["content"] == SYS_PROMPT_RECOMMENDATION:
+            calls["traits"] += 1
+            return json.dumps({trait: None for trait in TRAITS})
+        calls["genres"] += 1
+        return "no idea" if calls["genres"] == 1 else "blues"
+
+    traits = asyncio.run(mock_openai_service(handler).extract_song_traits("slow blues", cid=None))
+
+    assert traits["genres"] == ["blues"]
+    assert calls == {"traits": 1, "genres": 2}
+    assert max(peak) == 2
+
+
+def test_structured_mode_uses_one_schema_constrained_completion(mock_openai_service):
+    requests = []
+
+    async def handler(request):
+        requests.append(json.loads(request.content))
+        output = {trait: None for trait in TRAITS}
+        output.update(target_tempo=120, genres=["country", "not-a-genre"])
+        return json.dumps(output)
+
+    traits = asyncio.run(mock_openai_service(handler, traits_mode=TRAITS_MODE_STRUCTURED).extract_song_traits("fast country", None))
+
+    assert len(requests) == 1
+    assert requests[0]["response_format"]["json_schema"]["strict"] is True
+    assert traits["genres"] == ["country"] and traits["target_tempo"] == 120
+
+
+def test_cached_traits_skip_the_model(tmp_path, mock_openai_service):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        output = {trait: None for trait in TRAITS}
+        output["genres"] = ["rock"]
+        return json.dumps(output)
+
+    traits_cache = PersistentCache(str(tmp_path / "traits.db"))
+    openai_service = mock_openai_service(handler, traits_mode=TRAITS_MODE_STRUCTURED, traits_cache=traits_cache)
+
+    first = asyncio.run(openai_service.extract_song_traits("Classic rock", None))
+    first["genres"].append("changed")
+    second = asyncio.run(openai_service.extract_song_traits("  classic   ROCK ", None))
+
+    assert len(calls) == 1
+    assert second["genres"] == ["rock"]
+    traits_cache.close()
+
+
+def test_traits_cache_is_used_off_the_event_loop(tmp_path, mock_openai_service):
+    threads = []
+
+    class RecordingCache(PersistentCache):
+        def get(self, key, default=None):
+            threads.append(threading.get_ident())
+            return super().get(key, default)
+
+        def set(self, key, value, ttl=None):
+            threads.append(threading.get_ident())
+            super().set(key, value, ttl)
+
+    async def handler(request):
+        output = {trait: None for trait in TRAITS}
+        output["genres"] = ["rock"]
+        return json.dumps(output)
+
+    traits_cache = RecordingCache(str(tmp_path / "traits.db"))
+    openai_service = mock_openai_service(handler, traits_mode=TRAITS_MODE_STRUCTURED, traits_cache=traits_cache)
+
+    async def run():
+        await openai_service.extract_song_traits("classic rock", None)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+
+    assert len(threads) == 2 and loop_thread not in threads
+    traits_cache.close()
+
+
+def test_cached_traits_are_keyed_on_the_model(tmp_path, mock_openai_service):
+    models = []
+
+    async def handler(request):
+        models.append(json.loads(request.content)["model"])
+        output = {trait: None for trait in TRAITS}
+        output["genres"] = ["rock"]
+        return json.dumps(output)
+
+    traits_cache = PersistentCache(str(tmp_path / "traits.db"))
+    for model in ["gpt-4o-mini", "gpt-4o", "gpt-4o"]:
+        openai_service = mock_openai_service(handler, traits_mode=TRAITS_MODE_STRUCTURED, traits_cache=traits_cache, model=model)
+        asyncio.run(openai_service.extract_song_traits("classic rock", None))
+
+    assert models == ["gpt-4o-mini", "gpt-4o"]
+    traits_cache.close()
+
+
+def test_sync_service_runs_the_async_one(mock_openai_service):
+    async def handler(request):
+        return '{"content": "hi", "need_recommendation": false}'
+
+    openai_service = OpenAIService(token="test", backend=mock_openai_service(handler).backend)
+    try:
+        assert openai_service.general_chat("hi", [], cid=None)["content"] == "hi"
+    finally:
+        openai_service.close()
+
+
+def test_identical_concurrent_completions_are_sent_once(mock_openai_service):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return "jazz"
+
+    async def run():
+        openai_service = mock_openai_service(handler)
+        answers = await asyncio.gather(*[openai_service._chat("jazz please", "prompt", None) for _ in range(4)])
+        return openai_service, answers
+
+    openai_service, answers = asyncio.run(run())
+
+    assert answers == ["jazz"] * 4
+    assert len(calls) == 1
+    assert openai_service.single_flight.stats()["followers"] == 3
+
+
+def test_similar_traits_are_not_shared_across_modes(mock_openai_service):
+    calls = []
+
+    async def handler(request):
+        body = json.loads(request.content)
+        calls.append(body)
+        if body["messages"][0]["content"] == SYS_PROMPT_RECOMMENDATION:
+            return json.dumps({trait: None for trait in TRAITS})
+        if "response_format" in body:
+            output = {trait: None for trait in TRAITS}
+            output["genres"] = ["rock"]
+            return json.dumps(output)
+        return "rock"
+
+    similarity_cache = SimilarityCache(threshold=0.9)
+    asyncio.run(mock_openai_service(handler, similarity_cache=similarity_cache).extract_song_traits("classic rock", None))
+    asyncio.run(mock_openai_service(handler, similarity_cache=similarity_cache).extract_song_traits("classic rock", None))
+    assert len(calls) == 2
+
+    structured = mock_openai_service(handler, traits_mode=TRAITS_MODE_STRUCTURED, similarity_cache=similarity_cache)
+    asyncio.run(structured.extract_song_traits("classic rock", None))
+    assert len(calls) == 3
@@ -0,0 +1,34 @@
+import time
+
+from framework.utils.cache import LRUCache
+
+
+def test_lru_eviction_and_counters():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["size"]) == (3, 1, 1, 2)
+
+
+def test_ttl_expiry():
+    cache = LRUCache(max_size=2, ttl=0.05)
+    cache.set("a", 1)
+    assert "a" in cache
+    time.sleep(0.06)
+    assert "a" not in cache
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_invalidate():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.invalidate("a", "missing")
+    assert cache.get("a") is None
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.dependencies import get_chat_resource
+from app.main import app
+from app.resources.chat_resource import ChatResource
+from app.routers.chats import ChatBatchItem, ChatData
+from app.services.schema import sqlite_schema
+from framework.services.data_access.AsyncDataService import AsyncDataService
+from framework.services.data_access.SQLiteDataService import SQLiteDataService
+
+
+class CountingDataService(SQLiteDataService):
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.calls = []
+
+    def get_data_object(self, database_name, collection_name, *args, **kwargs):
+        self.calls.append(("get", collection_name))
+        return super().get_data_object(database_name, collection_name, *args, **kwargs)
+
+    def get_data_objects(self, database_name, collection_name, **kwargs):
+        self.calls.append(("select", collection_name))
+        return super().get_data_objects(database_name, collection_name, **kwargs)
+
+    def add_data_objects_in_transaction(self, database_name, writes):
+        self.calls += [("add", write[0]) for write in writes]
+        return super().add_data_objects_in_transaction(database_name, writes)
+
+
+@pytest.fixture
+def resource(tmp_path):
+    resource = ChatResource(config=None)
+    resource.data_service = CountingDataService(context=dict(
+        path=str(tmp_path / "chat.db"),
+        schema=sqlite_schema(resource.info_collection, resource.details_collection)
+    ))
+    # Two workers, a test writes from within a read
+    resource.async_data_service = AsyncDataService(resource.data_service, max_workers=2)
+    ChatResource.info_cache.clear()
+    ChatResource.conversation_cache.clear()
+    yield resource
+    resource.async_data_service.close()
+    SQLiteDataService.close_connections()
+
+
+def message(chat_id=None, content="hi", user_id="u1"):
+    return ChatData(chat_id=chat_id, role="human", content=content, user_id=user_id, agent_name="Chat")
+
+
+def test_follow_up_turns_skip_metadata_queries(resource):
+    chat_id = asyncio.run(resource.update_chat(message()))
+    resource.data_service.calls.clear()
+
+    assert asyncio.run(resource.update_chat(message(chat_id, "again"))) == chat_id
+    assert asyncio.run(resource.get_info_by_key(chat_id)).user_id == "u1"
+
+    assert resource.data_service.calls == [("add", resource.details_collection)]
+    # Both messages share a created_at second, so their relative order is not defined
+    history = asyncio.run(resource.get_chat_history("u1", chat_id=chat_id))
+    assert sorted(m.content for m in history) == ["again", "hi"]
+
+
+def test_messages_of_uncached_chat_are_filed_under_its_owner(resource):
+    chat_id = asyncio.run(resource.update_chat(message(content="first")))
+    ChatResource.info_cache.clear()
+
+    assert asyncio.run(resource.update_chat(ChatData(chat_id=chat_id, role="ai", content="second"))) == chat_id
+    assert asyncio.run(resource.update_chat(message(chat_id, "third", user_id="u2"))) == chat_id
+    batch = [ChatBatchItem(chat_id=chat_id, role="ai", content="fourth", user_id="u2")]
+    assert asyncio.run(resource.update_chats(batch)) == [(chat_id, None)]
+
+    history = asyncio.run(resource.get_chat_history("u1", chat_id=chat_id, agent_name="Chat"))
+    assert sorted(m.content for m in history) == ["first", "fourth", "second", "third"]
+    assert asyncio.run(resource.get_chat_history("u2")) == []
+
+
+def test_recent_messages_are_read_once_then_appended(resource):
+    chat_id = asyncio.run(resource.update_chat(message(content="one")))
+    assert [m.content for m in asyncio.run(resource.get_recent_messages("u1", chat_id, "Chat"))] == ["one"]
+
+    asyncio.run(resource.update_chat(message(chat_id, "two")))
+    resource.data_service.calls.clear()
+
+    assert [m.content for m in asyncio.run(resource.get_recent_messages("u1", chat_id, "Chat"))] == ["one", "two"]
+    assert resource.data_service.calls == []
+    assert asyncio.run(resource.get_recent_messages("u2", chat_id, "Chat")) == []
+
+
+def test_message_written_during_window_read_is_not_lost(resource):
+    chat_id = asyncio.run(resource.update_chat(message(content="one")))
+    ChatResource.conversation_cache.clear()
+    read = resource.data_service.get_data_objects
+
+    def read_then_append(*args, **kwargs):
+        results = read(*args, **kwargs)
+        resource.data_service.get_data_objects = read
+        asyncio.run(resource.update_chat(message(chat_id, "two")))
+        return results
+
+    resource.data_service.get_data_objects = read_then_append
+    assert [m.content for m in asyncio.run(resource.get_recent_messages("u1", chat_id, "Chat"))] == ["one"]
+    messages = asyncio.run(resource.get_recent_messages("u1", chat_id, "Chat"))
+    assert sorted(m.content for m in messages) == ["one", "two"]
+
+
+def test_chat_history_is_complete_unless_paged(resource):
+    asyncio.run(resource.update_chats([ChatBatchItem(role="human", content=str(i), user_id="u1", agent_name="Chat",
+                                                     created_at=datetime(2024, 1, 1) + timedelta(seconds=i))
+                                       for i in range(150)]))
+    app.dependency_overrides[get_chat_resource] = lambda: resource
+    try:
+        client = TestClient(app)
+        everything = client.get("/chat_history", params=dict(user_id="u1")).json()
+        first = client.get("/chat_history", params=dict(user_id="u1", limit=100)).json()
+        second = client.get("/chat_history", params=dict(user_id="u1", after=first["next_cursor"])).json()
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [m["content"] for m in everything] == [str(i) for i in range(150)]
+    assert len(first["messages"]) == 100
+    assert [m["content"] for m in second["messages"]] == [str(i) for i in range(100, 150)]
+    assert second["next_cursor"] is None
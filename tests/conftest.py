@@ -0,0 +1,76 @@
+import inspect
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+from app.dependencies import get_async_openai_service, get_chat_resource
+from app.main import app
+from app.resources.chat_resource import ChatResource
+from app.services.llm_backend import AsyncOpenAIBackend
+from app.services.openai import AsyncOpenAIService
+from app.services.schema import sqlite_schema
+from benchmarks.llm_server import create_app
+from framework.services.data_access.AsyncDataService import AsyncDataService
+from framework.services.data_access.SQLiteDataService import SQLiteDataService
+
+
+@pytest.fixture
+def chat_resource(tmp_path):
+    """ChatResource on an SQLite database of its own"""
+    resource = ChatResource(config=None)
+    resource.data_service = SQLiteDataService(context=dict(
+        path=str(tmp_path / "chat.db"),
+        schema=sqlite_schema(resource.info_collection, resource.details_collection, resource.summaries_collection)
+    ))
+    resource.async_data_service = AsyncDataService(resource.data_service, max_workers=2)
+    yield resource
+    resource.async_data_service.close()
+    SQLiteDataService.close_connections()
+
+
+@pytest.fixture
+def mock_openai_service():
+    """
+    Creates an AsyncOpenAIService whose completions are answered by handler(request), with an
+    httpx.Response or the content of the assistant message. Keyword arguments go to the service.
+    """
+    def create(handler, **kwargs):
+        async def respond(request):
+            response = handler(request)
+            if inspect.isawaitable(response):
+                response = await response
+            if isinstance(response, str):
+                response = httpx.Response(200, json={
+                    "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": response}}],
+                })
+            return response
+
+        backend = AsyncOpenAIBackend(client=AsyncOpenAI(
+            api_key="test", max_retries=0, http_client=httpx.AsyncClient(transport=httpx.MockTransport(respond))
+        ))
+        return AsyncOpenAIService(token="test", backend=backend, **kwargs)
+
+    return create
+
+
+@pytest.fixture
+def openai_service():
+    """AsyncOpenAIService answered by the stand-in LLM server, modules override it for other answers"""
+    backend = AsyncOpenAIBackend(client=AsyncOpenAI(
+        api_key="stub", base_url="http://stub/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app()))
+    ))
+    return AsyncOpenAIService(backend=backend)
+
+
+@pytest.fixture
+def client(chat_resource, openai_service):
+    """The app serving requests with chat_resource and openai_service"""
+    app.dependency_overrides[get_chat_resource] = lambda: chat_resource
+    app.dependency_overrides[get_async_openai_service] = lambda: openai_service
+    yield TestClient(app)
+    app.dependency_overrides.clear()
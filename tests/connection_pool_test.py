@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from framework.services.data_access.ConnectionPool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_reuses_connections():
+    pool = ConnectionPool(FakeConnection, min_size=1, max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert pool.stats()["created"] == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_checkout_timeout_when_exhausted():
+    pool = ConnectionPool(FakeConnection, min_size=0, max_size=1, timeout=0.05)
+    held = pool.acquire()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    pool.release(held)
+    assert pool.stats()["timeouts"] == 1
+    assert pool.acquire() is held
+
+
+def test_waiter_gets_released_connection():
+    pool = ConnectionPool(FakeConnection, min_size=0, max_size=1, timeout=1)
+    held = pool.acquire()
+    threading.Timer(0.05, pool.release, args=[held]).start()
+    assert pool.acquire() is held
+    assert pool.stats()["waits"] == 1
+
+
+def test_unhealthy_and_expired_connections_are_replaced():
+    pool = ConnectionPool(FakeConnection, min_size=1, max_size=1,
+                          health_check=lambda c: c.healthy, health_check_idle=0)
+    with pool.connection() as connection:
+        connection.healthy = False
+    with pool.connection() as replacement:
+        assert replacement is not connection
+    assert connection.closed
+    assert pool.stats()["failed_health_checks"] == 1
+
+    pool.max_lifetime = 0
+    time.sleep(0.01)
+    with pool.connection() as recycled:
+        assert recycled is not replacement
+    assert pool.stats()["recycled"] == 1
+
+
+def test_connection_discarded_on_error():
+    pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as connection:
+            raise RuntimeError("boom")
+    assert connection.closed
+    assert pool.stats()["size"] == 0
+
+
+def test_close():
+    pool = ConnectionPool(FakeConnection, min_size=2, max_size=2)
+    pool.close()
+    assert pool.stats()["size"] == 0
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+
+
+def test_slow_health_check_does_not_block_other_checkouts():
+    checking = threading.Event()
+    finish = threading.Event()
+
+    def slow_check(connection):
+        checking.set()
+        finish.wait(1)
+        return True
+
+    pool = ConnectionPool(FakeConnection, min_size=1, max_size=2, health_check=slow_check, health_check_idle=0)
+    checker = threading.Thread(target=lambda: pool.release(pool.acquire()))
+    checker.start()
+    assert checking.wait(1)
+    # The idle connection is being checked, a second caller opens a new one meanwhile
+    start = time.monotonic()
+    other = pool.acquire(timeout=0.5)
+    assert time.monotonic() - start < 0.5
+    finish.set()
+    checker.join()
+    pool.release(other)
+    assert pool.stats()["size"] == 2
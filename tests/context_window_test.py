@@ -0,0 +1,17 @@
+from app.utils.context_window import COMPRESSED_CHARS, count_tokens, fit_to_budget
+
+
+def test_no_budget_keeps_everything():
+    lines = ["human: hi", "ai: hello"]
+    assert fit_to_budget(lines, None) == (lines, 0)
+
+
+def test_recent_lines_verbatim_older_compressed_oldest_omitted():
+    old = "human: " + "x" * 1000
+    lines = [old, old, "human: " + "y" * 1000, "ai: short answer"]
+    budget = count_tokens(lines[-1]) + count_tokens(lines[-2]) + count_tokens(old[:COMPRESSED_CHARS] + "...")
+
+    kept, trimmed = fit_to_budget(lines, budget)
+
+    assert kept == ["[1 earlier messages omitted]", old[:COMPRESSED_CHARS] + "...", lines[2], lines[3]]
+    assert trimmed == sum(count_tokens(line) for line in lines) - budget
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from app.models.chat_details import ChatDetails
+from app.utils.conversation_cache import ConversationCache
+
+
+def message(i, chat_id="c1"):
+    return ChatDetails(message_id=str(i), chat_id=chat_id, role="human", content=str(i),
+                       created_at=datetime(2024, 1, 1, 0, 0, i))
+
+
+def test_window_keeps_most_recent_messages():
+    cache = ConversationCache(window_size=2, max_messages=10)
+    cache.seed("c1", "u1", "Chat", [message(1), message(2)])
+    assert cache.append("c1", message(3))
+    assert not cache.append("c2", message(4, "c2"))
+
+    assert [m.content for m in cache.get("c1", "u1", "Chat")] == ["2", "3"]
+    assert cache.get("c1", "u2", "Chat") is None
+    assert cache.stats()["messages"] == 2
+
+
+def test_global_message_cap_evicts_least_recently_used_chat():
+    cache = ConversationCache(window_size=2, max_messages=3)
+    cache.seed("c1", "u1", None, [message(1)])
+    cache.seed("c2", "u1", None, [message(2, "c2")])
+    cache.get("c1", "u1")
+    cache.seed("c3", "u1", None, [message(3, "c3"), message(4, "c3")])
+
+    assert cache.get("c2", "u1") is None
+    assert cache.get("c1", "u1") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_window_read_before_a_write_is_not_seeded():
+    cache = ConversationCache(window_size=5, max_messages=10, max_tracked_writes=1)
+    version = cache.version()
+    # Written while the window was being read, the read result misses it
+    cache.append("c1", message(2))
+    cache.seed("c1", "u1", "Chat", [message(1)], version=version)
+    assert cache.get("c1", "u1", "Chat") is None
+
+    version = cache.version()
+    cache.append("c2", message(3, "c2"))
+    cache.seed("c1", "u1", "Chat", [message(1), message(2)], version=version)
+    assert cache.get("c1", "u1", "Chat") is not None
+
+    # Once the write of c2 is forgotten, an older read of c2 cannot be trusted
+    cache.append("c3", message(4, "c3"))
+    cache.seed("c2", "u1", "Chat", [], version=version)
+    assert cache.get("c2", "u1", "Chat") is None
+    assert cache.stats()["stale_seeds"] == 2
@@ -0,0 +1,16 @@
+from datetime import datetime
+
+import pytest
+
+from app.utils.cursor import encode_cursor, decode_cursor
+
+
+def test_round_trip():
+    cursor = encode_cursor(datetime(2024, 4, 5, 0, 58, 50), "d0e11118-00a5-42ce-bf71-ec9187b61528")
+    assert decode_cursor(cursor) == ("2024-04-05 00:58:50", "d0e11118-00a5-42ce-bf71-ec9187b61528")
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor("yesterday", "m")])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
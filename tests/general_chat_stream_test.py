@@ -0,0 +1,98 @@
+import json
+
+import httpx
+import pytest
+
+from app.services.openai import SYS_PROMPT_RECOMMENDATION, TRAITS
+from app.utils.json_stream import JsonStringFieldExtractor
+from framework.utils.timing import parse_server_timing
+
+
+def test_extractor_decodes_split_escapes():
+    document = json.dumps({"need_recommendation": False, "content": 'a "b"\né \U0001F600'})
+    extractor = JsonStringFieldExtractor("content")
+
+    decoded = "".join(extractor.feed(char) for char in document)
+
+    assert decoded == 'a "b"\né \U0001F600'
+    assert extractor.done
+
+
+def stream_body(content):
+    events = []
+    for i in range(0, len(content), 5):
+        chunk = {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+                 "choices": [{"index": 0, "delta": {"content": content[i:i + 5]}, "finish_reason": None}]}
+        events.append(f"data: {json.dumps(chunk)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode()
+
+
+@pytest.fixture
+def openai_service(mock_openai_service):
+    answer = {"content": "Hello there, music fan!", "need_recommendation": False}
+
+    def handler(request):
+        body = json.loads(request.content)
+        if body.get("stream"):
+            return httpx.Response(200, content=stream_body(json.dumps(answer)),
+                                  headers={"content-type": "text/event-stream"})
+        if body["messages"][0]["content"] == SYS_PROMPT_RECOMMENDATION:
+            return json.dumps({trait: None for trait in TRAITS})
+        return "jazz"
+
+    openai_service = mock_openai_service(handler)
+    openai_service.answer = answer
+    return openai_service
+
+
+def events(response):
+    blocks = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    return [(lines[0].removeprefix("event: "), json.loads(lines[1].removeprefix("data: "))) for lines in blocks]
+
+
+def test_general_chat_stream_sends_content_then_done(client):
+    response = client.post("/general_chat/stream", params={"user_id": "u1", "query": "hi"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    names, payloads = zip(*events(response))
+
+    assert set(names[:-2]) == {"content"} and len(names) > 3
+    assert "".join(payload["delta"] for payload in payloads[:-2]) == "Hello there, music fan!"
+    assert names[-2:] == ("timing", "done")
+    assert payloads[-1] == {"content": "Hello there, music fan!", "traits": None, "need_recommendation": False}
+
+
+def test_general_chat_stream_reports_the_traits_stage(client, openai_service):
+    openai_service.answer["need_recommendation"] = True
+
+    response = client.post("/general_chat/stream", params={"user_id": "u1", "query": "jazz"})
+    (_, timing), (name, result) = events(response)[-2:]
+
+    assert name == "done" and result["traits"]["genres"] == ["jazz"]
+    assert {"history", "llm", "traits"} <= set(parse_server_timing(timing["server_timing"]))
+
+
+def test_general_chat_stream_fails_without_traits(client, openai_service):
+    async def no_traits(query, cid):
+        return None
+
+    openai_service.answer["need_recommendation"] = True
+    openai_service.extract_song_traits = no_traits
+
+    name, payload = events(client.post("/general_chat/stream", params={"user_id": "u1", "query": "jazz"}))[-1]
+
+    assert (name, payload) == ("error", {"detail": "Couldn't extract song traits"})
+
+
+def test_general_chat_stream_reports_unexpected_errors(client, openai_service):
+    async def broken(query, chat_history, cid):
+        yield "Hel"
+        raise RuntimeError("connection reset")
+
+    openai_service.general_chat_stream = broken
+
+    names, payloads = zip(*events(client.post("/general_chat/stream", params={"user_id": "u1", "query": "hi"})))
+
+    assert names == ("content", "timing", "error")
+    assert payloads[-1] == {"detail": "Failed in generating chat content"}
@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from openai import AsyncOpenAI
+
+from app.models.traits import Traits
+from app.services.llm_backend import AsyncOpenAIBackend
+from app.services.openai import AsyncOpenAIService, TRAITS_MODE_COMPLETIONS, TRAITS_MODE_STRUCTURED
+from framework.utils.metrics import REGISTRY
+from framework.utils.timing import start_timings
+from benchmarks.llm_server import Latency, create_app
+
+
+def stub_service(**kwargs):
+    traits_mode = kwargs.pop("traits_mode", TRAITS_MODE_COMPLETIONS)
+    client = AsyncOpenAI(
+        api_key="stub", base_url="http://stub/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(**kwargs)))
+    )
+    return AsyncOpenAIService(traits_mode=traits_mode, backend=AsyncOpenAIBackend(client=client))
+
+
+@pytest.mark.parametrize("traits_mode", [TRAITS_MODE_COMPLETIONS, TRAITS_MODE_STRUCTURED])
+def test_stub_answers_are_valid_traits(traits_mode):
+    openai_service = stub_service(traits_mode=traits_mode)
+
+    first = asyncio.run(openai_service.extract_song_traits("upbeat jazz for a road trip", cid=None))
+    second = asyncio.run(stub_service(traits_mode=traits_mode).extract_song_traits("upbeat jazz for a road trip", cid=None))
+
+    Traits(**first)
+    assert first["genres"] == ["jazz"]
+    assert first == second
+
+
+def test_stub_streams_general_chat():
+    async def run():
+        return [part async for part in stub_service(chunk_size=4).general_chat_stream("recommend some songs", [], None)]
+
+    parts = asyncio.run(run())
+
+    assert "".join(parts[:-1]) == parts[-1]["content"]
+    assert len(parts) > 3
+    assert parts[-1]["need_recommendation"] is True
+
+
+def completions(outcome):
+    return REGISTRY.get_sample_value("chatbot_llm_completion_duration_seconds_count",
+                                     {"model": "gpt-4o-mini", "outcome": outcome}) or 0
+
+
+def test_stream_times_only_the_upstream():
+    async def run():
+        timings = start_timings()
+        pieces = 0
+        async for _ in stub_service(chunk_size=4).general_chat_stream("recommend some songs", [], None):
+            pieces += 1
+            await asyncio.sleep(0.02)
+        return timings, pieces
+
+    ok = completions("ok")
+    timings, pieces = asyncio.run(run())
+
+    assert completions("ok") == ok + 1
+    assert pieces > 3 and timings["llm"] < pieces * 0.02
+
+
+def test_abandoned_stream_is_cancelled():
+    async def run():
+        stream = stub_service(chunk_size=4).general_chat_stream("recommend some songs", [], None)
+        await stream.__anext__()
+        await stream.aclose()
+
+    cancelled, ok = completions("cancelled"), completions("ok")
+    asyncio.run(run())
+
+    assert (completions("cancelled"), completions("ok")) == (cancelled + 1, ok)
+
+
+def test_stub_latency_and_errors():
+    assert Latency.parse("uniform:0.1:0.2") == Latency("uniform", 0.1, 0.2)
+    with pytest.raises(ValueError):
+        Latency.parse("normal:1")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(stub_service(error_rate=1.0).general_chat("hi", [], None))
+    assert error.value.status_code == 500
@@ -0,0 +1,53 @@
+import asyncio
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from framework.utils.metrics import register_cache_stats
+
+
+def samples(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+
+
+def test_metrics_per_endpoint_and_stage(client):
+    before = samples(client)
+    stats = {"memory_hits": 2, "disk_hits": 1, "misses": 4, "size": 3}
+    register_cache_stats("test_cache", lambda: stats)
+
+    chat_id = client.post("/update_chat", json=dict(role="human", content="hi", user_id="u1", agent_name="Chat")).json()
+    assert client.post("/general_chat", params=dict(user_id="u1", chat_id=chat_id,
+                                                    query="recommend some jazz")).status_code == 200
+    after = samples(client)
+
+    def delta(name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        return after.get(key, 0) - before.get(key, 0)
+
+    assert delta("chatbot_request_duration_seconds_count", endpoint="/general_chat", method="POST", status="200") == 1
+    for stage in ("history", "answer", "traits", "db", "llm", "prompt"):
+        assert delta("chatbot_stage_duration_seconds_count", endpoint="/general_chat", stage=stage) == 1
+    # The answer, then traits and genres
+    assert delta("chatbot_llm_completion_duration_seconds_count", model="gpt-4o-mini", outcome="ok") == 3
+    assert delta("chatbot_llm_tokens_total", model="gpt-4o-mini", kind="prompt") > 0
+    assert delta("chatbot_db_query_duration_seconds_count", endpoint="/update_chat", backend="SQLiteDataService",
+                 operation="add_data_objects_in_transaction") == 1
+    assert delta("chatbot_db_query_duration_seconds_count", endpoint="/general_chat", backend="SQLiteDataService",
+                 operation="get_data_objects") == 1
+    assert after[("chatbot_cache_lookups_total", (("cache", "test_cache"), ("result", "hit")))] == 3
+    assert after[("chatbot_cache_size", (("cache", "test_cache"),))] == 3
+
+
+def test_queries_outside_of_requests_are_background(client, chat_resource):
+    key = ("chatbot_db_query_duration_seconds_count",
+           (("backend", "SQLiteDataService"), ("endpoint", "background"), ("operation", "get_data_objects")))
+    before = samples(client).get(key, 0)
+
+    asyncio.run(chat_resource.get_chat_history(user_id="u1"))
+
+    assert samples(client)[key] == before + 1
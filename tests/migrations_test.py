@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.resources.chat_resource import ChatResource
+from app.migrations import check, hot_queries, missing_columns, upgrade
+from framework.services.data_access.AsyncDataService import AsyncDataService
+from framework.services.data_access.SQLiteDataService import SQLiteDataService
+
+
+@pytest.fixture
+def resource(tmp_path):
+    resource = ChatResource(config=None)
+    resource.data_service = SQLiteDataService(context=dict(path=str(tmp_path / "chat.db")))
+    resource.async_data_service = AsyncDataService(resource.data_service, max_workers=1)
+    yield resource
+    resource.async_data_service.close()
+    SQLiteDataService.close_connections()
+
+
+def test_upgrade_then_check_has_no_full_scans(resource):
+    upgrade(resource)
+    assert check(resource) == []
+
+
+def test_check_detects_missing_index(resource):
+    upgrade(resource)
+    resource.data_service.execute_statement(f"DROP INDEX ix_{resource.details_collection}_user_created")
+
+    failures = check(resource)
+
+    assert failures
+    assert all(resource.details_collection in sql_statement for sql_statement, _ in failures)
+
+
+def test_upgrade_fills_new_columns_of_existing_tables(resource):
+    resource.data_service.create_schema([
+        f"CREATE TABLE {resource.info_collection} (chat_id VARCHAR(36) NOT NULL, user_id VARCHAR(36), "
+        f"user_name VARCHAR(255), agent_id VARCHAR(36), agent_name VARCHAR(64), created_at DATETIME, "
+        f"PRIMARY KEY (chat_id))",
+        f"CREATE TABLE {resource.details_collection} (message_id VARCHAR(36) NOT NULL, chat_id VARCHAR(36), "
+        f"role VARCHAR(16), content TEXT, created_at DATETIME, PRIMARY KEY (message_id))",
+        f"INSERT INTO {resource.info_collection} (chat_id, user_id, agent_name) VALUES ('c1', 'u1', 'Chat')",
+        f"INSERT INTO {resource.details_collection} (message_id, chat_id, role, content, created_at) "
+        f"VALUES ('m1', 'c1', 'human', 'hi', '2024-01-01 00:00:00')",
+    ])
+
+    upgrade(resource)
+
+    assert [m.content for m in asyncio.run(resource.get_chat_history("u1", agent_name="Chat"))] == ["hi"]
+    assert check(resource) == []
+
+
+def test_hot_queries_leave_the_shared_caches_alone(resource):
+    upgrade(resource)
+    info_stats, conversation_stats = ChatResource.info_cache.stats(), ChatResource.conversation_cache.stats()
+
+    queries = hot_queries(resource)
+
+    assert queries and check(resource, queries) == []
+    assert ChatResource.info_cache.stats() == info_stats
+    assert ChatResource.conversation_cache.stats() == conversation_stats
+
+
+def test_missing_columns_until_upgrade(resource):
+    resource.data_service.create_schema([
+        f"CREATE TABLE {resource.details_collection} (message_id VARCHAR(36) NOT NULL, chat_id VARCHAR(36), "
+        f"role VARCHAR(16), content TEXT, created_at DATETIME, PRIMARY KEY (message_id))",
+    ])
+
+    missing = missing_columns(resource)
+
+    assert f"{resource.details_collection}.user_id" in missing
+    assert f"{resource.info_collection}.chat_id" in missing
+    upgrade(resource)
+    assert missing_columns(resource) == []
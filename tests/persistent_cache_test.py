@@ -0,0 +1,69 @@
+import time
+
+from framework.utils.persistent_cache import PersistentCache
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = PersistentCache(path, max_size=10)
+    cache.set("a", {"genres": ["jazz"]})
+    assert cache.get("a") == {"genres": ["jazz"]}
+    cache.close()
+
+    reopened = PersistentCache(path, max_size=10)
+    assert reopened.get("a") == {"genres": ["jazz"]}
+    assert reopened.get("a") == {"genres": ["jazz"]}
+    stats = reopened.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["hit_rate"]) == (1, 1, 1.0)
+    reopened.close()
+
+
+def test_size_bound_evicts_least_recently_read(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.db"), max_size=2, memory_size=0)
+    cache.set("a", 1)
+    time.sleep(0.01)
+    cache.set("b", 2)
+    time.sleep(0.01)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.db"), ttl=0.05, memory_size=0)
+    cache.set("a", 1)
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_reads_are_written_in_batches(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = PersistentCache(path, max_size=10, memory_size=0)
+    cache.access_batch_size = 3
+    cache.set("a", 1)
+    written = cache._connection.execute("SELECT accessed_at FROM cache_entries").fetchone()[0]
+    time.sleep(0.01)
+
+    cache.get("a")
+    cache.get("a")
+    assert cache._connection.execute("SELECT accessed_at FROM cache_entries").fetchone()[0] == written
+    cache.get("a")
+    assert cache._connection.execute("SELECT accessed_at FROM cache_entries").fetchone()[0] > written
+    cache.close()
+
+
+def test_size_bound_trims_below_max_size(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.db"), max_size=10, memory_size=0)
+    for i in range(10):
+        cache.set(str(i), i)
+    cache.set("0", 0)
+    assert cache.stats()["evictions"] == 0
+
+    cache.set("10", 10)
+    stats = cache.stats()
+    assert (stats["evictions"], stats["size"]) == (2, 9)
+    assert cache.get("10") == 10
@@ -0,0 +1,44 @@
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from framework.middleware.profiling import ProfilingMiddleware
+
+
+def busy_app():
+    app = FastAPI()
+
+    @app.get("/busy")
+    async def busy():
+        return {"total": sum(i * i for i in range(10000))}
+
+    return app
+
+
+def test_profiles_requests_with_the_token(tmp_path):
+    app = busy_app()
+    app.add_middleware(ProfilingMiddleware, directory=str(tmp_path), token="secret")
+    client = TestClient(app)
+
+    assert "x-profile" not in client.get("/busy").headers
+    assert "x-profile" not in client.get("/busy", headers={"X-Profile-Token": "wrong"}).headers
+    assert os.listdir(tmp_path) == []
+
+    response = client.get("/busy", headers={"X-Profile-Token": "secret", "X-Correlation-ID": "../abc 1"})
+    profile = response.headers["x-profile"]
+
+    assert response.status_code == 200
+    assert profile.startswith(".._abc_1-") and profile.endswith(".html")
+    assert os.listdir(tmp_path) == [profile]
+    assert "busy" in (tmp_path / profile).read_text()
+
+
+def test_sampling_keeps_the_newest_profiles(tmp_path):
+    app = busy_app()
+    app.add_middleware(ProfilingMiddleware, directory=str(tmp_path), sample_rate=1.0, max_files=2)
+    client = TestClient(app)
+
+    profiles = [client.get("/busy", headers={"X-Correlation-ID": f"cid{i}"}).headers["x-profile"] for i in range(3)]
+
+    assert sorted(os.listdir(tmp_path)) == sorted(profiles[1:])
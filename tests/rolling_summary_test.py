@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import pytest
+
+from app.routers import chats
+from app.routers.chats import ChatBatchItem
+from app.services.openai import SYS_PROMPT_SUMMARY
+
+
+@pytest.fixture
+def prompts():
+    return []
+
+
+@pytest.fixture
+def openai_service(mock_openai_service, prompts):
+    def handler(request):
+        messages = json.loads(request.content)["messages"]
+        prompts.append((messages[0]["content"], messages[1]["content"]))
+        summarizing = messages[0]["content"] == SYS_PROMPT_SUMMARY
+        return f"summary {len(prompts)}" if summarizing else "analysis"
+
+    return mock_openai_service(handler)
+
+
+@pytest.fixture
+def setup(client, chat_resource, prompts):
+    return client, chat_resource, prompts
+
+
+def add_messages(resource, *contents, second=0):
+    asyncio.run(resource.update_chats([
+        ChatBatchItem(chat_id="c1", role="human", content=content, user_id="u1", agent_name="Chat",
+                      created_at=f"2024-01-01T00:00:{second + i:02d}")
+        for i, content in enumerate(contents)
+    ]))
+
+
+def test_only_messages_after_the_watermark_are_summarized(setup):
+    client, resource, prompts = setup
+    add_messages(resource, "I love jazz", "and some blues")
+
+    assert client.post("/analyze_preference", params={"user_id": "u1"}).json() == "analysis"
+    add_messages(resource, "now into techno", second=10)
+    assert client.post("/analyze_preference", params={"user_id": "u1"}).json() == "analysis"
+
+    second_summary_input = prompts[2][1]
+    assert "summary 1" in second_summary_input and "now into techno" in second_summary_input
+    assert "I love jazz" not in second_summary_input
+    assert "summary 3" in prompts[3][1] and "jazz" not in prompts[3][1]
+    assert asyncio.run(resource.get_user_summary("u1", "Chat"))["summary"] == "summary 3"
+
+
+def test_no_messages_is_not_found(setup):
+    client, _, _ = setup
+    assert client.post("/analyze_preference", params={"user_id": "nobody"}).status_code == 404
+
+
+def summary_inputs(prompts):
+    return [user_prompt for system_prompt, user_prompt in prompts if system_prompt == SYS_PROMPT_SUMMARY]
+
+
+def test_backdated_messages_rebuild_the_summary(setup):
+    client, resource, prompts = setup
+    add_messages(resource, "I love jazz", second=10)
+    client.post("/analyze_preference", params={"user_id": "u1"})
+
+    add_messages(resource, "imported: classical", "imported: opera", second=0)
+    assert client.post("/analyze_preference", params={"user_id": "u1"}).json() == "analysis"
+
+    rebuilt = summary_inputs(prompts)[-1]
+    assert all(content in rebuilt for content in ("I love jazz", "imported: classical", "imported: opera"))
+    assert "summary 1" not in rebuilt
+    stored = asyncio.run(resource.get_user_summary("u1", "Chat"))
+    assert stored["watermark_position"] == 2
+
+    client.post("/analyze_preference", params={"user_id": "u1"})
+    assert len(summary_inputs(prompts)) == 2
+
+
+def test_same_second_message_sorting_before_the_watermark_is_summarized(setup):
+    client, resource, prompts = setup
+    add_messages(resource, "I love jazz")
+    client.post("/analyze_preference", params={"user_id": "u1"})
+    stored = asyncio.run(resource.get_user_summary("u1", "Chat"))
+
+    # Written in the second of the watermark, its message_id sorts before the watermark's
+    resource.data_service.add_data_objects(resource.database, resource.details_collection, [{
+        "message_id": "00000000-0000-0000-0000-000000000000", "chat_id": "c1", "user_id": "u1",
+        "agent_name": "Chat", "role": "human", "content": "and some blues",
+        "created_at": stored["watermark_created_at"],
+    }])
+    client.post("/analyze_preference", params={"user_id": "u1"})
+
+    rebuilt = summary_inputs(prompts)[-1]
+    assert "I love jazz" in rebuilt and "and some blues" in rebuilt
+
+
+def test_catch_up_is_capped_per_request(setup, monkeypatch):
+    client, resource, prompts = setup
+    monkeypatch.setattr(chats, "SUMMARY_BATCH_SIZE", 2)
+    monkeypatch.setattr(chats, "MAX_SUMMARY_BATCHES", 2)
+    add_messages(resource, *[f"message {i}" for i in range(7)])
+
+    client.post("/analyze_preference", params={"user_id": "u1"})
+    assert len(summary_inputs(prompts)) == 2
+    assert asyncio.run(resource.get_user_summary("u1", "Chat"))["watermark_position"] == 3
+
+    client.post("/analyze_preference", params={"user_id": "u1"})
+    inputs = summary_inputs(prompts)
+    assert len(inputs) == 4
+    assert "message 4" in inputs[2] and "message 6" in inputs[3] and "message 3" not in inputs[2]
+    assert asyncio.run(resource.get_user_summary("u1", "Chat"))["watermark_position"] == 6
@@ -0,0 +1,40 @@
+import asyncio
+
+from framework.services.service_factory import BaseServiceFactory
+
+
+class Closeable:
+
+    def __init__(self, name, closed):
+        self.name = name
+        self.closed = closed
+
+    def close(self):
+        self.closed.append(self.name)
+
+
+class Factory(BaseServiceFactory):
+
+    closed = []
+    created = []
+
+    @classmethod
+    def create_service(cls, service_name):
+        if service_name == "outer":
+            cls.get_service("inner")
+        elif service_name != "inner":
+            return None
+        cls.created.append(service_name)
+        return Closeable(service_name, cls.closed)
+
+
+def test_services_are_created_once_and_closed_in_reverse_order():
+    outer = Factory.get_service("outer")
+    assert Factory.get_service("outer") is outer
+    assert Factory.get_service("missing") is None
+    assert Factory.created == ["inner", "outer"]
+
+    asyncio.run(Factory.close_services())
+
+    assert Factory.closed == ["outer", "inner"]
+    assert Factory.get_service("outer") is not outer
@@ -0,0 +1,38 @@
+from framework.utils.similarity_cache import SimilarityCache
+
+
+def test_paraphrase_hits_and_unrelated_query_misses():
+    cache = SimilarityCache(threshold=0.9)
+    cache.add("chill study music", {"genres": ["chill"]})
+
+    assert cache.get("Chill music for studying") == {"genres": ["chill"]}
+    assert cache.get("angry death metal") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["would_hit"][0.5] == 1
+
+
+def test_shadow_mode_only_records():
+    cache = SimilarityCache(probe_thresholds=(0.3,))
+    cache.add("fast dance songs for the gym", 1)
+
+    assert cache.get("high-energy gym dance tracks") is None
+    assert cache.stats()["would_hit"] == {0.3: 1}
+
+
+def test_max_size_evicts_oldest():
+    cache = SimilarityCache(threshold=0.9, max_size=1)
+    cache.add("jazz", 1)
+    cache.add("metal", 2)
+
+    assert cache.get("jazz") is None
+    assert cache.get("metal") == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_namespaces_are_separate():
+    cache = SimilarityCache(threshold=0.9)
+    cache.add("chill study music", {"genres": ["chill"]}, namespace="v1")
+
+    assert cache.get("chill study music", namespace="v2") is None
+    assert cache.get("chill study music", namespace="v1") == {"genres": ["chill"]}
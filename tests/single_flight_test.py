@@ -0,0 +1,19 @@
+import asyncio
+
+from framework.utils.single_flight import AsyncSingleFlight
+
+
+def test_async_errors_are_shared_and_not_remembered():
+    single_flight = AsyncSingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def run():
+        results = await asyncio.gather(*[single_flight.do("k", failing) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert await single_flight.do("k", lambda: asyncio.sleep(0, result="ok")) == "ok"
+
+    asyncio.run(run())
+    assert single_flight.stats() == {"leaders": 2, "followers": 2, "in_flight": 0, "coalesced_rate": 0.5}
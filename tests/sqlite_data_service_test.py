@@ -0,0 +1,98 @@
+import uuid
+
+import pytest
+
+from app.services.schema import sqlite_schema
+from framework.services.data_access.SQLiteDataService import SQLiteDataService
+
+DB = "chatbot"
+OWNER = ("chat_info", "chat_id", ["user_id", "agent_name"])
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = SQLiteDataService(context=dict(
+        path=str(tmp_path / "chat.db"),
+        schema=sqlite_schema("chat_info", "chat_details")
+    ))
+    yield service
+    SQLiteDataService.close_connections()
+
+
+def add_chat(service, chat_id, user_id, agent_name, messages, second=0):
+    writes = [("chat_info", {"chat_id": chat_id, "user_id": user_id, "agent_name": agent_name,
+                             "created_at": "2024-01-01 00:00:00"}, True)]
+    for i, (role, content) in enumerate(messages):
+        writes.append(("chat_details", {"message_id": str(uuid.uuid4()), "chat_id": chat_id, "role": role,
+                                        "content": content, "created_at": f"2024-01-01 00:00:{second + i:02d}"}, False, OWNER))
+    return service.add_data_objects_in_transaction(DB, writes)
+
+
+def history(service, **kwargs):
+    return service.get_data_objects(
+        DB, "chat_details",
+        filters={"user_id": "u1", "agent_name": kwargs.pop("agent_name", None), "role": kwargs.pop("role", None)},
+        **kwargs
+    )
+
+
+def test_transaction_and_history(service):
+    assert add_chat(service, "c1", "u1", "Chat", [("human", "hi"), ("ai", "hello")])
+    # Re-opening an existing chat keeps the chat_info row and adds the message
+    assert add_chat(service, "c1", "u1", "Chat", [("human", "again")], second=10)
+    assert add_chat(service, "c2", "u1", "Recommendation", [("human", "songs")], second=20)
+    assert add_chat(service, "c3", "u2", "Chat", [("human", "other user")])
+
+    assert service.get_data_object(DB, "chat_info", "chat_id", "c1")["agent_name"] == "Chat"
+    assert [row["content"] for row in history(service, agent_name="Chat")] == ["hi", "hello", "again"]
+    assert [row["content"] for row in history(service, role="human")] == ["hi", "again", "songs"]
+
+
+def test_failed_transaction_writes_nothing(service):
+    writes = [
+        ("chat_info", {"chat_id": "c1", "user_id": "u1"}, True),
+        ("chat_details", {"message_id": "m1", "chat_id": "c1"}, False),
+        ("chat_details", {"message_id": "m1", "chat_id": "c1"}, False),
+    ]
+    assert service.add_data_objects_in_transaction(DB, writes) is None
+    assert service.get_data_object(DB, "chat_info", "chat_id", "c1") is None
+
+
+def test_keyset_pages(service):
+    add_chat(service, "c1", "u1", "Chat", [("human", str(i)) for i in range(7)])
+
+    def keyset(row):
+        return row["created_at"], row["message_id"]
+
+    first = history(service, tiebreak_field="message_id", limit=3)
+    second = history(service, tiebreak_field="message_id", limit=3, after=keyset(first[-1]))
+    third = history(service, tiebreak_field="message_id", limit=3, after=keyset(second[-1]))
+    assert [row["content"] for row in first + second + third] == [str(i) for i in range(7)]
+
+    previous = history(service, tiebreak_field="message_id", limit=3, before=keyset(third[0]))
+    assert previous == second
+
+
+def test_bulk_insert_reports_per_row_errors(service):
+    rows = [{"message_id": f"m{i}", "chat_id": "c1", "role": "human", "content": str(i)} for i in range(5)]
+    rows.append({"message_id": "m2", "chat_id": "c1"})
+    rows.append({"message_id": None, "chat_id": "c1", "role": "human", "content": "no key"})
+
+    errors = service.add_data_objects(DB, "chat_details", rows, chunk_size=2)
+
+    assert errors[:5] == [None] * 5
+    assert errors[5] is not None and errors[6] is not None
+    assert len(service.get_all_data_object(DB, "chat_details", "chat_id", "c1")) == 5
+
+
+def test_insert_copies_columns_from_source(service):
+    add_chat(service, "c1", "u1", "Chat", [])
+    rows = [{"message_id": "m1", "chat_id": "c1", "content": "filed"},
+            {"message_id": "m2", "chat_id": "missing", "content": "no chat"}]
+
+    assert service.add_data_objects(DB, "chat_details", rows, copy_from=OWNER) == \
+        [None, "No chat_info object to copy user_id, agent_name from"]
+    assert service.add_data_objects_in_transaction(DB, [("chat_details", rows[1], False, OWNER)]) is None
+
+    row = service.get_data_object(DB, "chat_details", "message_id", "m1")
+    assert (row["user_id"], row["agent_name"]) == ("u1", "Chat")
@@ -0,0 +1,63 @@
+import io
+import json
+import logging
+
+from framework.utils.structured_logging import (PAYLOAD, REQUEST, BackgroundLogging, JsonFormatter,
+                                                SamplingFilter, parse_sample_rates, truncate)
+
+
+def test_truncate_bounds_large_arguments():
+    assert truncate("a" * 5000, 10) == "aaaaaaaaaa...[4990 more chars]"
+    assert truncate(12345, 2) == 12345
+    history = [{"content": "x" * 10000, "role": "human"} for _ in range(1000)]
+    assert len(truncate(history, 100)) < 150
+    assert truncate(ValueError("x"), 100) == "x"
+
+
+def test_truncate_bounds_objects_in_containers():
+    class Message:
+        def __init__(self):
+            self.content = "x" * 100000
+
+        def __repr__(self):
+            raise AssertionError("the whole repr is built")
+
+    truncated = truncate([Message()], 1000)
+
+    assert truncated.startswith("[Message(content='xxx") and len(truncated) < 1100
+
+
+def test_sampling_keeps_errors():
+    sampling = SamplingFilter(parse_sample_rates("payload=0, request=1"))
+
+    def record(level, extra):
+        return logging.makeLogRecord(dict(levelno=level, **extra))
+
+    assert not sampling.filter(record(logging.INFO, PAYLOAD))
+    assert sampling.filter(record(logging.INFO, REQUEST))
+    assert sampling.filter(record(logging.ERROR, PAYLOAD))
+    assert sampling.filter(record(logging.INFO, {}))
+
+
+def test_background_logging_writes_on_listener_thread():
+    logger = logging.getLogger("structured_logging_test")
+    logger.setLevel(logging.INFO)
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    logger.addHandler(handler)
+    logging_thread = BackgroundLogging(logger_name=logger.name, json_format=True, max_length=20,
+                                       sample_rates={"payload": 0.0})
+    logging_thread.start()
+    try:
+        logger.info("Got chat response: %s - [%s]", "y" * 1000, "cid1", extra=REQUEST)
+        logger.info("Dropped: %s - [%s]", "z", "cid2", extra=PAYLOAD)
+    finally:
+        logging_thread.stop()
+
+    assert logger.handlers == [handler]
+    assert not isinstance(handler.formatter, JsonFormatter)
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["category"] == "request" and lines[0]["level"] == "INFO"
+    assert lines[0]["message"] == f"Got chat response: {'y' * 20}...[980 more chars] - [cid1]"
+    logger.removeHandler(handler)
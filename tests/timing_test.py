@@ -0,0 +1,47 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from benchmarks.run import compare, run
+from framework.middleware.timing import ServerTimingMiddleware
+from framework.utils.timing import parse_server_timing, record, stage_timings, timed
+
+
+def test_server_timing_header():
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware)
+
+    @app.get("/")
+    async def root():
+        with timed("db"):
+            await asyncio.sleep(0.01)
+        record("db", 0.5)
+        return {}
+
+    response = TestClient(app).get("/")
+    timings = parse_server_timing(response.headers["server-timing"])
+
+    assert timings["db"] >= 0.51
+    assert timings["total"] >= 0.01
+    # Outside of a request nothing is recorded
+    with timed("db"):
+        pass
+    assert stage_timings() == {}
+
+
+def test_benchmark_smoke():
+    report = asyncio.run(run(endpoints=["general_chat", "chat_history"], requests=6, concurrency=2, warmup=1,
+                             repeat=1, users=2, chats_per_user=1, messages_per_chat=4))
+
+    assert report["general_chat"]["errors"] == 0
+    assert {"db", "llm", "prompt"} <= set(report["general_chat"]["stages"])
+    assert report["chat_history"]["latency"]["p50_ms"] > 0
+
+    slower = {"chat_history": {"latency": {"p50_ms": 100.0, "p95_ms": 100.0}, "stages": {}}}
+    faster = {"chat_history": {"latency": {"p50_ms": 10.0, "p95_ms": 10.0}, "stages": {}}}
+    assert compare(slower, faster, tolerance=0.5) == [
+        "chat_history total p50_ms: 100.0 ms, baseline 10.0 ms",
+        "chat_history total p95_ms: 100.0 ms, baseline 10.0 ms",
+    ]
+    assert compare(faster, slower, tolerance=0.5) == []
@@ -1,3 +1,4 @@
+import asyncio
 from app.resources.chat_resource import ChatResource
 from app.services.service_factory import ServiceFactory
 import json
@@ -33,8 +34,8 @@ def test_get_chat_ids_agent():
 def test_analyze_preference():
     user_id = "8fa98871-2e6a-42e1-b602-00050e5a0ac4"
     db_service = ServiceFactory.get_service("ChatResource")
-    chat_history = db_service.get_chat_history(user_id=user_id, chat_id=None, role="human",
-                                               agent_name="Recommendation")
+    chat_history = asyncio.run(db_service.get_chat_history(user_id=user_id, chat_id=None, role="human",
+                                                           agent_name="Recommendation"))
 
     if chat_history:
         openai_service = ServiceFactory.get_service("OpenAI")
@@ -48,7 +49,7 @@ def test_general_chat():
     query = "What are some news for music world today?"
     # Get chat history by specific chat id
     db_service = ServiceFactory.get_service("ChatResource")
-    chat_history = db_service.get_chat_history(user_id=user_id, chat_id=chat_id, agent_name="Chat")
+    chat_history = asyncio.run(db_service.get_chat_history(user_id=user_id, chat_id=chat_id, agent_name="Chat"))
 
     # Generate agent's answer
     openai_service = ServiceFactory.get_service("OpenAI")